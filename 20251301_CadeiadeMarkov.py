@@ -1,8 +1,149 @@
+import os
+import time
+
 import streamlit as st
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from markov_churn import (
+    STATES, ModelParams, aggregate_monthly, assign_states, build_monthly_panel, counts_frame, decode_states,
+    model_from_panel, month_index_to_timestamp, select_customers, transition_counts, transition_matrix,
+)
+from markov_churn.io import (
+    COLUMNAR_CACHE_DIR, HAS_PYARROW, SNIFF_ROWS, IngestionCache, add_revenue, columnar_cache_path, columnar_format,
+    date_bounds, file_content_hash, file_kind, model_columns, read_transactions, write_columnar_copy,
+)
+from markov_churn.bootstrap import bootstrap
+from markov_churn.expanded import HAS_SCIPY, fit_expanded, log_likelihood as markov_log_likelihood
+from markov_churn.parallel import default_jobs, panel_with_states
+from markov_churn.scoring import score_customers
+from markov_churn.segments import COHORT_SEGMENT, segment_model
+from markov_churn.simulation import simulate
+from markov_churn.stages import StageCache, stage_key
+from markov_churn.states import STATE_C
+from markov_churn.validation import (
+    brier_score, history_counts, log_loss, mae, markov_order_test, reliability_curve, rolling_backtest,
+    threshold_sweep,
+)
+
+
+# ============================================================
+# INGESTÃO COM CACHE (hash do conteúdo + opções do parser)
+# ============================================================
+# Cada interação com um widget reexecuta o script do topo. Sem cache, o arquivo
+# enviado seria parseado de novo a cada clique. Aqui guardamos os DataFrames já
+# lidos num LRU limitado por memória, compartilhado entre sessões.
+INGEST_CACHE_MAX_BYTES = 2 * 1024**3  # teto de memória do cache de ingestão (2 GB)
+
+
+@st.cache_resource
+def get_ingestion_cache() -> IngestionCache:
+    return IngestionCache(INGEST_CACHE_MAX_BYTES)
+
+
+def uploaded_file_hash(uploaded_file) -> str:
+    # o hash é calculado uma vez por upload (file_id) e reaproveitado nos reruns
+    file_id = getattr(uploaded_file, "file_id", None) or uploaded_file.name
+    cached = st.session_state.get("_upload_hash")
+    if cached is not None and cached[0] == file_id:
+        return cached[1]
+    digest = file_content_hash(uploaded_file.getvalue())
+    st.session_state["_upload_hash"] = (file_id, digest)
+    return digest
+
+
+# ============================================================
+# ETAPAS DO MODELO COM MEMOIZAÇÃO (chave = etapa de cima + parâmetros)
+# ============================================================
+# Um rerun por slider (n do preview, threshold) não deve refazer agregação,
+# painel, estados e Nᵢⱼ. Cada etapa da aba ⚙️ Modelo guarda o último resultado
+# com a sua chave; só as etapas abaixo do parâmetro alterado são recalculadas.
+# Todo cálculo sobre linhas do painel passa por aqui, inclusive os que rodam
+# dentro de expanders (o corpo roda a cada rerun, mesmo fechado) e as validações.
+STAGE_LABELS = {
+    "aggregate": "agregação", "customers": "clientes", "panel": "painel", "states": "estados A/R/C",
+    "transitions": "Nᵢⱼ", "model": "P",
+}
+
+
+def model_stages() -> StageCache:
+    # por sessão (cada sessão tem os seus dados); uma entrada por etapa
+    if "_model_stages" not in st.session_state:
+        st.session_state["_model_stages"] = StageCache()
+    return st.session_state["_model_stages"]
+
+
+def columnar_source(uploaded_file):
+    """Garante uma cópia colunar local do upload. Retorna (path, formato, convertido_agora).
+
+    Parquet/Feather/Arrow são gravados como vieram; CSV/XLSX são convertidos
+    para Parquet uma única vez — as próximas sessões com o mesmo arquivo leem
+    direto do Parquet. Sem pyarrow, retorna (None, None, False).
+    """
+    if not HAS_PYARROW:
+        return None, None, False
+
+    kind = file_kind(uploaded_file.name)
+    path = columnar_cache_path(uploaded_file_hash(uploaded_file), kind, COLUMNAR_CACHE_DIR)
+    if os.path.exists(path):
+        return path, columnar_format(kind), False
+    write_columnar_copy(uploaded_file.getvalue(), kind, path)
+    return path, columnar_format(kind), True
+
+
+def read_uploaded_file(uploaded_file, columns=None, dtypes=None, date_cols=(), nrows=None,
+                       customer_col=None, state_col=None, date_range=None):
+    """Lê o upload usando o cache de ingestão. Retorna (DataFrame, hit).
+
+    A leitura em si é `markov_churn.io.read_transactions` (projeção de colunas,
+    dtypes compactos, datas convertidas, filtro de período); tudo isso fica
+    dentro do cache, então nenhum rerun repete o trabalho.
+    """
+    kind = file_kind(uploaded_file.name)
+
+    cache = get_ingestion_cache()
+    key = (
+        uploaded_file_hash(uploaded_file), kind,
+        tuple(columns or ()), tuple(sorted((dtypes or {}).items())), tuple(date_cols), nrows,
+        customer_col, state_col, tuple(str(d) for d in date_range) if date_range else None,
+    )
+
+    df = cache.get(key)
+    hit = df is not None
+    if not hit:
+        path, fmt, _ = columnar_source(uploaded_file)
+        if path is not None:
+            source, source_kind = path, fmt
+        else:
+            uploaded_file.seek(0)
+            source, source_kind = uploaded_file, kind
+        df = read_transactions(
+            source, source_kind, columns=columns, dtypes=dtypes, date_cols=date_cols, nrows=nrows,
+            customer_col=customer_col, state_col=state_col, date_range=date_range,
+        )
+        cache.put(key, df)
+
+    # cópia rasa: colunas novas (ex.: revenue) não vazam para o frame cacheado
+    return df.copy(deep=False), hit
+
+
+@st.cache_data(show_spinner=False)
+def columnar_date_bounds(path, fmt, date_col):
+    # min/max da coluna de data lendo só essa coluna da cópia colunar (path é nomeado pelo hash)
+    return date_bounds(path, fmt, date_col)
+
+
+def display_frame(frame: pd.DataFrame, customer_col: str, customer_labels) -> pd.DataFrame:
+    # o pipeline carrega cliente (int32) e estados (int8) como códigos; rótulos só para exibir
+    out = frame.copy()
+    if customer_col in out.columns:
+        out[customer_col] = np.asarray(customer_labels)[out[customer_col].to_numpy()]
+    for c in ("state", "next_state", "prev_state"):
+        if c in out.columns:
+            out[c] = decode_states(out[c].to_numpy())
+    return out
+
 
 st.set_page_config(page_title="Cadeia de Markov (Churn)", layout="wide")
 st.title("📌 Cadeia de Markov aplicada a Churn (A/R/C)")
@@ -439,39 +580,131 @@ with main_tabs[1]:
         "- **Estado (A/R/C)** já pronto. Se não tiver, vamos criar na aba ⚙️ Modelo (com regras)."
     )
 
-    uploaded_file = st.file_uploader("Envie seu arquivo (CSV ou XLSX)", type=["csv", "xlsx", "xls"])
+    if HAS_PYARROW:
+        upload_types = ["csv", "xlsx", "xls", "parquet", "pq", "feather", "arrow", "ipc"]
+        upload_label = "Envie seu arquivo (CSV, XLSX, Parquet, Feather ou Arrow)"
+    else:
+        upload_types = ["csv", "xlsx", "xls"]
+        upload_label = "Envie seu arquivo (CSV ou XLSX)"
+    uploaded_file = st.file_uploader(upload_label, type=upload_types)
 
     if uploaded_file is None:
         st.info("Envie um arquivo para continuar.")
         st.stop()
 
     # ----------------------------
-    # 1) Carregamento
+    # 1) Pré-visualização (fase 1: só cabeçalho + primeiras linhas)
     # ----------------------------
     try:
-        file_name = uploaded_file.name.lower()
-        if file_name.endswith(".csv"):
-            df_raw = pd.read_csv(uploaded_file)
-        elif file_name.endswith(".xlsx") or file_name.endswith(".xls"):
-            df_raw = pd.read_excel(uploaded_file)
+        with st.spinner("Preparando cópia colunar (Parquet) do arquivo — só na primeira vez..."):
+            columnar_path, columnar_fmt, converted_now = columnar_source(uploaded_file)
+        df_head, _ = read_uploaded_file(uploaded_file, nrows=SNIFF_ROWS)
+    except Exception as e:
+        st.error(f"Erro ao carregar arquivo: {e}")
+        st.stop()
+
+    if columnar_path is not None:
+        if converted_now:
+            st.caption("📦 Cópia colunar criada agora: próximas sessões com este arquivo abrem direto dela.")
+        else:
+            st.caption("📦 Cópia colunar encontrada: leitura direta com projeção de colunas e filtro de datas.")
+
+    st.caption(
+        f"Pré-visualização: primeiras **{len(df_head):,} linhas** × **{df_head.shape[1]} colunas**. "
+        "O arquivo completo é lido depois do mapeamento, só com as colunas que o modelo usa."
+    )
+    st.dataframe(df_head.head(25), use_container_width=True)
+
+    st.divider()
+
+    # ----------------------------
+    # 2) Mapeamento de colunas
+    # ----------------------------
+    st.subheader("1) Mapeamento de colunas (o que cada coluna significa)")
+
+    cols = df_head.columns.tolist()
+
+    # sugestões automáticas
+    customer_guess = next((c for c in cols if c.lower() in ["customer_id", "customer id", "customer", "userid", "user_id", "id_cliente", "cliente"]), cols[0])
+    date_guess = next((c for c in cols if "date" in c.lower() or "data" in c.lower() or "month" in c.lower() or "mes" in c.lower()), cols[0])
+    state_guess = next((c for c in cols if c.lower() in ["state", "estado", "status", "markov_state", "status_markov"]), None)
+
+    customer_col = st.selectbox("Coluna de cliente (ID)", options=cols, index=cols.index(customer_guess))
+    date_col = st.selectbox("Coluna de data (evento/mês)", options=cols, index=cols.index(date_guess))
+
+    has_state = st.checkbox("Meu dataset já tem uma coluna de estado (A/R/C)", value=(state_guess is not None))
+    state_col = None
+    if has_state:
+        state_col = st.selectbox("Coluna de estado (A/R/C)", options=cols, index=cols.index(state_guess) if state_guess else 0)
+
+    # segmentos opcionais (país, canal...): lidos junto para estimar uma P por segmento na aba 📈 Gráficos
+    segment_options = [c for c in cols if c not in (customer_col, date_col, state_col, "Price", "Quantity")]
+    segment_cols = st.multiselect(
+        "Colunas de segmento (opcional: país, canal...)", options=segment_options, default=[],
+        key="data_segment_cols"
+    )
+
+    # filtro de período opcional (em Parquet/Arrow é aplicado na própria leitura)
+    date_range = None
+    if st.checkbox("Filtrar período no carregamento", value=False, key="data_filter_period"):
+        bounds = None
+        if columnar_path is not None:
+            bounds = columnar_date_bounds(columnar_path, columnar_fmt, date_col)
+        if bounds is None:
+            head_dates = pd.to_datetime(df_head[date_col], errors="coerce").dropna()
+            bounds = (head_dates.min().date(), head_dates.max().date()) if len(head_dates) else None
+        if bounds is None:
+            st.warning(f"Não foi possível ler datas na coluna `{date_col}` para sugerir o período.")
         else:
-            st.error("Formato inválido. Envie CSV ou XLSX.")
-            st.stop()
+            picked = st.date_input("Período (início e fim)", value=bounds, key="data_period_range")
+            if isinstance(picked, (tuple, list)) and len(picked) == 2:
+                date_range = (picked[0], picked[1])
+
+    st.divider()
+
+    # ----------------------------
+    # 3) Carregamento (fase 2: só colunas usadas, dtypes compactos)
+    # ----------------------------
+    # o modelo só usa cliente, data, Price/Quantity (revenue) e, opcionalmente, estado
+    use_cols, load_dtypes = model_columns(cols, customer_col, date_col, state_col, segment_cols)
 
-        st.success(f"Arquivo carregado: **{df_raw.shape[0]:,} linhas** × **{df_raw.shape[1]} colunas**")
-        st.dataframe(df_raw.head(25), use_container_width=True)
+    try:
+        with st.spinner("Lendo colunas selecionadas..."):
+            df_raw, cache_hit = read_uploaded_file(
+                uploaded_file,
+                columns=use_cols,
+                dtypes=load_dtypes,
+                date_cols=(date_col,),
+                customer_col=customer_col,
+                state_col=state_col,
+                date_range=date_range,
+            )
+
+        st.success(
+            f"Arquivo carregado: **{df_raw.shape[0]:,} linhas** × **{df_raw.shape[1]} colunas usadas** "
+            f"(de {len(cols)} no arquivo) — {df_raw.memory_usage(deep=True).sum() / 1024**2:,.1f} MB em memória"
+        )
+
+        cache_stats = get_ingestion_cache().stats()
+        cache_usage = (
+            f"{cache_stats['entries']} arquivo(s), "
+            f"{cache_stats['bytes'] / 1024**2:,.1f} MB de {cache_stats['max_bytes'] / 1024**2:,.0f} MB"
+        )
+        if cache_hit:
+            st.caption(f"⚡ Cache de ingestão: **HIT** — arquivo reaproveitado sem reler ({cache_usage}).")
+        else:
+            st.caption(f"🐢 Cache de ingestão: **MISS** — arquivo lido e guardado no cache ({cache_usage}).")
 
     except Exception as e:
         st.error(f"Erro ao carregar arquivo: {e}")
         st.stop()
 
     # ----------------------------
-    # 1.1) Coluna de Revenue (se possível)
+    # 3.1) Coluna de Revenue (se possível)
     # ----------------------------
-    st.subheader("0) Enriquecimento: Revenue (Price × Quantity)")
+    st.subheader("2) Enriquecimento: Revenue (Price × Quantity)")
 
-    if ("Price" in df_raw.columns) and ("Quantity" in df_raw.columns):
-        df_raw["revenue"] = df_raw["Price"] * df_raw["Quantity"]
+    if add_revenue(df_raw):
         st.success("Coluna **revenue** criada com sucesso: `revenue = Price × Quantity`.")
         with st.expander("Ver amostra de revenue"):
             st.dataframe(df_raw[["Price", "Quantity", "revenue"]].head(10), use_container_width=True)
@@ -481,15 +714,15 @@ with main_tabs[1]:
     st.divider()
 
     # ----------------------------
-    # 2) Diagnóstico rápido
+    # 4) Diagnóstico rápido
     # ----------------------------
-    st.subheader("1) Diagnóstico rápido (qualidade dos dados)")
+    st.subheader("3) Diagnóstico rápido (qualidade dos dados)")
 
     c1, c2, c3 = st.columns(3)
     with c1:
         st.metric("Linhas", f"{df_raw.shape[0]:,}")
     with c2:
-        st.metric("Colunas", f"{df_raw.shape[1]:,}")
+        st.metric("Colunas usadas", f"{df_raw.shape[1]:,}")
     with c3:
         st.metric("Nulos totais", f"{int(df_raw.isna().sum().sum()):,}")
 
@@ -500,31 +733,9 @@ with main_tabs[1]:
     st.divider()
 
     # ----------------------------
-    # 3) Mapeamento de colunas
-    # ----------------------------
-    st.subheader("2) Mapeamento de colunas (o que cada coluna significa)")
-
-    cols = df_raw.columns.tolist()
-
-    # sugestões automáticas
-    customer_guess = next((c for c in cols if c.lower() in ["customer_id", "customer id", "customer", "userid", "user_id", "id_cliente", "cliente"]), cols[0])
-    date_guess = next((c for c in cols if "date" in c.lower() or "data" in c.lower() or "month" in c.lower() or "mes" in c.lower()), cols[0])
-    state_guess = next((c for c in cols if c.lower() in ["state", "estado", "status", "markov_state", "status_markov"]), None)
-
-    customer_col = st.selectbox("Coluna de cliente (ID)", options=cols, index=cols.index(customer_guess))
-    date_col = st.selectbox("Coluna de data (evento/mês)", options=cols, index=cols.index(date_guess))
-
-    has_state = st.checkbox("Meu dataset já tem uma coluna de estado (A/R/C)", value=(state_guess is not None))
-    state_col = None
-    if has_state:
-        state_col = st.selectbox("Coluna de estado (A/R/C)", options=cols, index=cols.index(state_guess) if state_guess else 0)
-
-    st.divider()
-
-    # ----------------------------
-    # 4) Validações mínimas
+    # 5) Validações mínimas
     # ----------------------------
-    st.subheader("3) Validações mínimas (para o Markov funcionar)")
+    st.subheader("4) Validações mínimas (para o Markov funcionar)")
 
     problems = []
 
@@ -533,17 +744,15 @@ with main_tabs[1]:
     if null_rate_customer > 0.05:
         problems.append(f"Mais de 5% de valores nulos na coluna de cliente `{customer_col}` (≈ {null_rate_customer:.0%}).")
 
-    # Data: parse
-    date_parsed = pd.to_datetime(df_raw[date_col], errors="coerce")
-    parse_fail = date_parsed.isna().mean()
+    # Data: parse (já convertida no carregamento; NaT = falha de parse)
+    parse_fail = df_raw[date_col].isna().mean()
     if parse_fail > 0.20:
         problems.append(f"A coluna `{date_col}` tem muita falha de parse (≈ {parse_fail:.0%}). Ajuste o formato da data.")
 
     # Estado: valores válidos
     if has_state:
         valid_states = {"A", "R", "C"}
-        states_norm = df_raw[state_col].astype(str).str.strip().str.upper()
-        invalid_rate = (~states_norm.isin(valid_states)).mean()
+        invalid_rate = (~df_raw[state_col].isin(valid_states)).mean()
         if invalid_rate > 0.10:
             problems.append(
                 f"A coluna `{state_col}` tem muitos valores fora de A/R/C (≈ {invalid_rate:.0%}). "
@@ -560,13 +769,14 @@ with main_tabs[1]:
     st.divider()
 
     # ----------------------------
-    # 5) Remoção de Customer ID nulo (opcional)
+    # 6) Remoção de Customer ID nulo (opcional)
     # ----------------------------
-    st.subheader("4) Tratamento de clientes sem ID")
+    st.subheader("5) Tratamento de clientes sem ID")
 
     null_customers = df_raw[customer_col].isna().sum()
     null_pct = df_raw[customer_col].isna().mean()
 
+    drop_nulls = False
     if null_customers > 0:
         st.warning(f"Existem **{null_customers:,} linhas ({null_pct:.1%})** sem Customer ID.")
         drop_nulls = st.checkbox("Excluir linhas sem Customer ID (recomendado)", value=True)
@@ -575,43 +785,41 @@ with main_tabs[1]:
             df_filtered = df_raw.dropna(subset=[customer_col])
             st.success(f"{null_customers:,} linhas removidas. Base agora tem {df_filtered.shape[0]:,} linhas.")
         else:
-            df_filtered = df_raw.copy()
+            df_filtered = df_raw
             st.warning("⚠️ Manter clientes sem ID pode inviabilizar o Markov (não dá para montar transições por cliente).")
     else:
-        df_filtered = df_raw.copy()
+        df_filtered = df_raw
         st.success("Nenhum Customer ID nulo encontrado.")
 
     st.divider()
 
     # ----------------------------
-    # 6) Preparação final (month como inteiro) + salvar em session_state
+    # 7) Preparação final (month como inteiro) + salvar em session_state
     # ----------------------------
-    st.subheader("5) Preparar dados (month como número) e salvar para a próxima aba")
-
-    df = df_filtered.copy()
-
-    # padronizações leves
-    df[customer_col] = df[customer_col].astype(str).str.strip()
-    df[date_col] = pd.to_datetime(df[date_col], errors="coerce")
+    st.subheader("6) Preparar dados (month como número) e salvar para a próxima aba")
 
+    # cliente já vem como category (sem espaços) e a data já vem como datetime do carregamento;
     # remove linhas inválidas
-    df = df.dropna(subset=[customer_col, date_col])
+    df = df_filtered.dropna(subset=[customer_col, date_col])
 
     # month como número (1-12)
-    df["month"] = df[date_col].dt.month
-
-    if has_state:
-        df[state_col] = df[state_col].astype(str).str.strip().str.upper()
+    df["month"] = df[date_col].dt.month.astype("int8")
 
     # salva para as próximas abas
     st.session_state["df_raw"] = df_raw
     st.session_state["df"] = df
+    # chave da etapa de carga: mesmo arquivo + mesmas opções = mesmo `df` (raiz das chaves da aba ⚙️ Modelo)
+    st.session_state["data_key"] = stage_key(
+        uploaded_file_hash(uploaded_file), tuple(use_cols), customer_col, date_col, state_col,
+        str(date_range), bool(drop_nulls),
+    )
     st.session_state["data_config"] = {
         "customer_col": customer_col,
         "date_col": date_col,
         "month_col": "month",
         "has_state": has_state,
         "state_col": state_col,
+        "segment_cols": list(segment_cols),
         "has_revenue": "revenue" in df.columns
     }
 
@@ -644,8 +852,10 @@ with main_tabs[2]:
         st.warning("Primeiro carregue e prepare os dados na aba 📥 Dados.")
         st.stop()
 
-    df = st.session_state["df"].copy()
+    df = st.session_state["df"]  # somente leitura
     cfg = st.session_state["data_config"]
+    stages = model_stages()
+    stages.last_run.clear()
 
     customer_col = cfg["customer_col"]
     date_col = cfg["date_col"]
@@ -724,42 +934,31 @@ with main_tabs[2]:
     st.subheader("2) Construção da base mensal (cliente × mês)")
 
     # Tratamento de revenue negativo (devoluções) — comum no Online Retail
+    neg_mode = "keep"
     if use_revenue and "revenue" in df.columns:
         st.markdown("**Tratamento de revenue negativo (devoluções/estornos)**")
-        neg_mode = st.selectbox(
+        neg_mode_options = {
+            "Manter (recomendado para análise financeira)": "keep",
+            "Zerar negativos (não considerar devolução)": "clip",
+            "Remover linhas negativas (limpar devoluções)": "drop",
+        }
+        neg_mode_label = st.selectbox(
             "Como tratar revenue < 0?",
-            ["Manter (recomendado para análise financeira)", "Zerar negativos (não considerar devolução)", "Remover linhas negativas (limpar devoluções)"],
+            list(neg_mode_options),
             index=0,
             key="model_neg_revenue_mode"
         )
+        neg_mode = neg_mode_options[neg_mode_label]
 
-        if neg_mode == "Zerar negativos (não considerar devolução)":
-            df["revenue"] = df["revenue"].clip(lower=0)
-        elif neg_mode == "Remover linhas negativas (limpar devoluções)":
-            df = df[df["revenue"] >= 0].copy()
-
-        metric_col = "revenue"
-    else:
-        metric_col = "_events"
-        df[metric_col] = 1
-
-    # mês real (YYYY-MM) e índice sequencial ano+mês
-    df["_month_ts"] = pd.to_datetime(df[date_col], errors="coerce").dt.to_period("M").dt.to_timestamp()
-    df = df.dropna(subset=[customer_col, "_month_ts"]).copy()
-    df["_month_index"] = df["_month_ts"].dt.year * 12 + df["_month_ts"].dt.month
-
-    # Agregação: 1 linha por cliente-mês
-    agg = (
-        df.groupby([customer_col, "_month_index"], as_index=False)
-          .agg(
-              month_ts=("_month_ts", "min"),
-              revenue=(metric_col, "sum"),
-              total_purchases=(metric_col, "size")
-          )
+    # Agregação: 1 linha por cliente-mês (cliente como código int32, índice sequencial ano+mês)
+    # etapas memoizadas: cada chave = chave da etapa de cima + parâmetros da etapa
+    agg_key = stage_key(st.session_state.get("data_key"), customer_col, date_col, bool(use_revenue), neg_mode)
+    agg, customer_labels = stages.run(
+        "aggregate", agg_key, aggregate_monthly, df, customer_col, date_col, use_revenue=use_revenue, neg_mode=neg_mode
     )
 
     st.write("Abaixo está a agregação mensal (um registro por cliente por mês).")
-    st.dataframe(agg.head(20), use_container_width=True)
+    st.dataframe(display_frame(agg.head(20), customer_col, customer_labels), use_container_width=True)
 
     st.info("Nota: usamos um índice sequencial **ano+mês** para não misturar Janeiro/2010 com Janeiro/2011.")
 
@@ -774,42 +973,62 @@ with main_tabs[2]:
     max_m = int(agg["_month_index"].max())
     st.write(f"Período detectado: **{agg['month_ts'].min().date()}** até **{agg['month_ts'].max().date()}**")
 
-    customers = agg[customer_col].dropna().astype(str).unique()
-    all_months = np.arange(min_m, max_m + 1, dtype=int)
-
     st.subheader("Opcional: amostragem (para performance)")
     sample_mode = st.checkbox("Rodar em amostra de clientes (para testar mais rápido)", value=False, key="model_sample_mode")
     sample_n = None
     if sample_mode:
         sample_n = st.number_input("Qtd. clientes na amostra", min_value=100, max_value=200000, value=5000, step=100, key="model_sample_n")
 
+    sample_size = int(sample_n) if sample_mode else None
+    customers_key = stage_key(agg_key, sample_size)
+    customers_used = stages.run("customers", customers_key, select_customers, agg, customer_col, sample_size, seed=42)
+    n_customers_total = stages.run("n_customers", agg_key, lambda: int(agg[customer_col].nunique()))
     if sample_mode:
-        rng = np.random.default_rng(42)
-        customers_used = rng.choice(customers, size=min(int(sample_n), len(customers)), replace=False)
-        st.warning(f"Rodando com amostra de **{len(customers_used):,}** clientes (de {len(customers):,}).")
+        st.warning(f"Rodando com amostra de **{len(customers_used):,}** clientes (de {n_customers_total:,}).")
     else:
-        customers_used = customers
         st.success(f"Rodando com **todos os clientes**: {len(customers_used):,}")
 
-    panel = pd.MultiIndex.from_product([customers_used, all_months], names=[customer_col, "_month_index"]).to_frame(index=False)
-
-    panel = panel.merge(
-        agg[[customer_col, "_month_index", "month_ts", "revenue", "total_purchases"]],
-        on=[customer_col, "_month_index"],
-        how="left"
+    n_jobs = st.number_input(
+        "Processos em paralelo (painel e estados por grupos de clientes)",
+        min_value=1, max_value=default_jobs(), value=1, step=1,
+        help="Acima de 1, clientes são divididos em grupos processados em paralelo; o resultado é idêntico.",
+        key="model_n_jobs"
     )
 
-    # reconstruir month_ts onde faltante
-    year = panel["_month_index"] // 12
-    month = panel["_month_index"] % 12
-    month = month.replace(0, 12)
-    panel["month_ts"] = panel["month_ts"].fillna(pd.to_datetime(dict(year=year, month=month, day=1)))
-
-    panel["revenue"] = panel["revenue"].fillna(0.0)
-    panel["total_purchases"] = panel["total_purchases"].fillna(0).astype(int)
+    # painel esparso: cada cliente só a partir do 1º mês com compra (o "relógio" começa ali)
+    # até o fim da janela — sem materializar clientes × meses inteiros
+    # (o resultado não depende de n_jobs, então n_jobs fica fora das chaves)
+    panel_key = stage_key(customers_key)
+    states_key = stage_key(panel_key, int(risk_gap_months), int(churn_gap_months))
+    if n_jobs > 1:
+        # painel + A/R/C (seção 4) já calculados nos processos
+        panel = stages.run(
+            "states", states_key,
+            lambda: panel_with_states(
+                agg, customer_col, customers_used, max_m,
+                ModelParams(risk_gap_months=int(risk_gap_months), churn_gap_months=int(churn_gap_months),
+                            use_revenue=bool(use_revenue)),
+                n_jobs=int(n_jobs),
+            )[0],
+        )
+    else:
+        panel = stages.run("panel", panel_key, build_monthly_panel, agg, customer_col, customers_used,
+                           end_month=max_m, use_revenue=use_revenue)
 
-    st.write("Painel completo (inclui meses sem compra com revenue=0 e total_purchases=0):")
-    st.dataframe(panel.head(20), use_container_width=True)
+    n_full = len(customers_used) * (max_m - min_m + 1)
+    st.write(
+        "Painel a partir do 1º mês de compra de cada cliente "
+        "(inclui meses sem compra com revenue=0 e total_purchases=0):"
+    )
+    st.caption(f"{len(panel):,} linhas cliente-mês (o produto completo clientes × meses teria {n_full:,}).")
+    st.dataframe(
+        display_frame(
+            panel.head(20)[[customer_col, "_month_index", "month_ts", "revenue", "total_purchases", "_had_purchase",
+                            "_first_purchase_month"]],
+            customer_col, customer_labels,
+        ),
+        use_container_width=True
+    )
 
     st.divider()
 
@@ -818,38 +1037,11 @@ with main_tabs[2]:
     # ----------------------------
     st.subheader("4) Definição de estado por mês (A/R/C)")
 
-    panel = panel.sort_values([customer_col, "_month_index"]).reset_index(drop=True)
-
-    # compra no mês?
-    if use_revenue:
-        panel["_had_purchase"] = panel["revenue"] > 0
-    else:
-        panel["_had_purchase"] = panel["total_purchases"] > 0
-
-    # começar o "relógio" do cliente no primeiro mês em que ele aparece comprando
-    first_purchase = (
-        panel[panel["_had_purchase"]]
-        .groupby(customer_col)["_month_index"].min()
-        .rename("_first_purchase_month")
-        .reset_index()
-    )
-    panel = panel.merge(first_purchase, on=customer_col, how="left")
-    panel = panel[panel["_month_index"] >= panel["_first_purchase_month"]].copy()
-
-    # meses desde a última compra
-    panel["_last_purchase_month"] = np.where(panel["_had_purchase"], panel["_month_index"], np.nan)
-    panel["_last_purchase_month"] = panel.groupby(customer_col)["_last_purchase_month"].ffill()
-    panel["_months_since_purchase"] = panel["_month_index"] - panel["_last_purchase_month"]
-
-    # estado
-    panel["state"] = "R"
-    panel.loc[panel["_had_purchase"], "state"] = "A"
-    panel.loc[(~panel["_had_purchase"]) & (panel["_months_since_purchase"] >= risk_gap_months), "state"] = "R"
-    panel.loc[(~panel["_had_purchase"]) & (panel["_months_since_purchase"] >= churn_gap_months), "state"] = "C"
-
-    # churn absorvente: depois de C, sempre C
-    panel["_ever_churned"] = panel.groupby(customer_col)["state"].transform(lambda s: (s == "C").cummax())
-    panel.loc[panel["_ever_churned"], "state"] = "C"
+    # A/R/C por mês (códigos int8), churn absorvente e próximo estado por cliente
+    if n_jobs == 1:
+        panel = stages.run("states", states_key, assign_states, panel, customer_col, int(risk_gap_months),
+                           int(churn_gap_months))
+    state = panel["state"].to_numpy()
 
     # explicação business do que é essa tabela
     st.markdown("### 📌 O que essa distribuição significa? (para negócios)")
@@ -861,14 +1053,20 @@ with main_tabs[2]:
         "Cliente pode aparecer em estados diferentes em meses diferentes (A hoje, R amanhã, C depois)."
     )
 
-    dist = panel["state"].value_counts(normalize=True).rename("proporção").to_frame()
-    dist["contagem"] = panel["state"].value_counts()
+    state_counts = stages.run("state_counts", states_key, np.bincount, state, minlength=len(STATES))
+    dist = pd.DataFrame(
+        {"proporção": state_counts / max(state_counts.sum(), 1), "contagem": state_counts},
+        index=pd.Index(STATES, name="state"),
+    ).sort_values("contagem", ascending=False)
     st.write("Distribuição geral de estados no painel (cliente-mês):")
     st.dataframe(dist, use_container_width=True)
 
     with st.expander("Ver amostra com colunas de diagnóstico"):
         st.dataframe(
-            panel[[customer_col, "month_ts", "_month_index", "revenue", "total_purchases", "_months_since_purchase", "state"]].head(50),
+            display_frame(
+                panel.head(50)[[customer_col, "month_ts", "_month_index", "revenue", "total_purchases", "_months_since_purchase", "state"]],
+                customer_col, customer_labels,
+            ),
             use_container_width=True
         )
 
@@ -879,22 +1077,11 @@ with main_tabs[2]:
     # ----------------------------
     st.subheader("5) Transições mensais e matriz de contagens Nᵢⱼ")
 
-    panel["next_state"] = panel.groupby(customer_col)["state"].shift(-1)
-    trans = panel.dropna(subset=["next_state"]).copy()
-
-    states = ["A", "R", "C"]
-    trans["state"] = pd.Categorical(trans["state"], categories=states, ordered=True)
-    trans["next_state"] = pd.Categorical(trans["next_state"], categories=states, ordered=True)
-
-    Nij = (
-        trans.groupby(["state", "next_state"])
-             .size()
-             .unstack(fill_value=0)
-             .reindex(index=states, columns=states, fill_value=0)
-    )
+    Nij_counts = stages.run("transitions", states_key, transition_counts, state, panel["next_state"].to_numpy())
+    states = list(STATES)
 
     st.write("Matriz de contagens **Nᵢⱼ** (quantas transições i→j observamos):")
-    st.dataframe(Nij, use_container_width=True)
+    st.dataframe(counts_frame(Nij_counts, states), use_container_width=True)
 
     st.divider()
 
@@ -903,19 +1090,34 @@ with main_tabs[2]:
     # ----------------------------
     st.subheader("6) Estimação da matriz de transição P")
 
-    row_sums = Nij.sum(axis=1).replace(0, np.nan)
-    P = Nij.div(row_sums, axis=0).fillna(0.0)
-
     force_absorb = st.checkbox("Forçar churn como absorvente (C→C = 1)", value=True, key="model_force_absorb")
-    if force_absorb:
-        P.loc["C", :] = 0.0
-        P.loc["C", "C"] = 1.0
+
+    model_key = stage_key(states_key, bool(force_absorb))
+    model = stages.run(
+        "model", model_key, model_from_panel,
+        panel, customer_col, customer_labels,
+        ModelParams(
+            risk_gap_months=int(risk_gap_months),
+            churn_gap_months=int(churn_gap_months),
+            use_revenue=bool(use_revenue),
+            neg_mode=neg_mode,
+            force_absorb=bool(force_absorb),
+            sample_n=sample_size,
+        ),
+        counts=Nij_counts,
+        n_customers_total=n_customers_total,
+    )
+    Nij = model.Nij_frame
+    P = model.P_frame
 
     st.write("Matriz **P** (probabilidades i→j):")
     st.dataframe(P.style.format("{:.4f}"), use_container_width=True)
 
     # Salvar para outras abas
+    st.session_state["model"] = model
+    st.session_state["model_key"] = model_key
     st.session_state["panel_monthly"] = panel
+    st.session_state["customer_labels"] = customer_labels
     st.session_state["Nij"] = Nij
     st.session_state["P"] = P
     st.session_state["states"] = states
@@ -927,6 +1129,13 @@ with main_tabs[2]:
     }
 
     st.success("✅ Modelo estimado! Matrizes Nᵢⱼ e P salvas para a aba 📈 Gráficos.")
+    reused = [label for name, label in STAGE_LABELS.items() if stages.last_run.get(name, (False,))[0]]
+    recomputed = [f"{label} ({stages.last_run[name][1]:.2f}s)" for name, label in STAGE_LABELS.items()
+                  if name in stages.last_run and not stages.last_run[name][0]]
+    st.caption(
+        f"⚡ Etapas reaproveitadas: {', '.join(reused) or 'nenhuma'} · "
+        f"recalculadas: {', '.join(recomputed) or 'nenhuma'}."
+    )
     st.divider()
 
     # ----------------------------
@@ -940,85 +1149,69 @@ with main_tabs[2]:
         key="model_preview_n_slider"  # <- evita StreamlitDuplicateElementId
     )
 
-    P_np = P.to_numpy(dtype=float)
-    Pn = np.linalg.matrix_power(P_np, int(n_preview))
-    idx = {s: i for i, s in enumerate(states)}
-
-    prob_A = Pn[idx["A"], idx["C"]]
-    prob_R = Pn[idx["R"], idx["C"]]
+    prob_A = model.churn_probability(int(n_preview), "A")
+    prob_R = model.churn_probability(int(n_preview), "R")
 
     st.write(f"Probabilidade de estar em **Churn (C)** em **{n_preview} meses**:")
     st.success(f"Começando em **A**: {prob_A*100:.2f}%")
     st.success(f"Começando em **R**: {prob_R*100:.2f}%")
 
+    # ----------------------------
+    # Opcional: espaço de estados expandido (A por faixa de gasto, R por meses sem compra)
+    # ----------------------------
+    with st.expander("Opcional: estados expandidos (A1..Aq por gasto, R1..R(c−1) por meses sem compra)"):
+        st.caption(
+            "A regra A/R/C junta em R clientes com 1 e com vários meses sem compra. Aqui o mesmo painel é "
+            "reclassificado em estados mais finos (a memória que o teste 8.2 mede) e P é guardada de forma esparsa."
+        )
+        spend_tiers = st.number_input("Faixas de gasto para A (quantis)", min_value=1, max_value=50, value=3,
+                                      step=1, key="model_expanded_tiers")
+        # o corpo do expander roda a cada rerun (mesmo fechado): o ajuste só refaz com outro modelo ou faixas
+        expanded = stages.run("expanded", stage_key(model_key, int(spend_tiers)), fit_expanded, model, int(spend_tiers))
+        exp_reused, exp_secs = stages.last_run["expanded"]
+
+        n_trans = int(model.Nij.sum())
+        ll_arc = markov_log_likelihood(model.Nij)
+        ll_exp = expanded.coarse_log_likelihood()
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Estados (K)", f"{expanded.n_states}")
+        c2.metric("Transições possíveis (não nulas)", f"{expanded.nnz:,} de {expanded.n_states**2:,}")
+        c3.metric("Log-verossimilhança por transição", f"{ll_exp / max(n_trans, 1):.4f}",
+                  delta=f"{(ll_exp - ll_arc) / max(n_trans, 1):+.4f} vs A/R/C")
+        st.caption(
+            f"{'Ajuste reaproveitado' if exp_reused else f'Ajuste em {exp_secs:.3f} s'} "
+            f"({'scipy.sparse' if HAS_SCIPY else 'denso, scipy não instalado'}). "
+            "A log-verossimilhança compara a previsão do próximo A/R/C: quanto maior, melhor."
+        )
+
+        st.dataframe(expanded.summary(int(n_preview)).style.format({
+            "P(→C em 1 mês)": "{:.4f}", f"churn_{int(n_preview)}m": "{:.4f}",
+            "tempo_ate_churn": "{:.2f}", "ltv": "{:,.2f}",
+        }), use_container_width=True)
+
+        n_exp = np.arange(1, int(n_preview) + 1)
+        fig, ax = plt.subplots()
+        ax.plot(n_exp, model.churn_curve(int(n_preview), "R"), label="A/R/C — começando em R")
+        ax.plot(n_exp, expanded.churn_curve(int(n_preview), "R"), label="expandido — R (pesado pela ocupação)")
+        for label in [s for s in expanded.labels if s.startswith("R")][:4]:
+            ax.plot(n_exp, expanded.churn_curve(int(n_preview), label), linestyle="--", label=f"expandido — {label}")
+        ax.set_xlabel("n (meses)")
+        ax.set_ylabel("P(churn)")
+        ax.legend()
+        st.pyplot(fig)
+
     # ============================================================
     # 8) Validação do modelo (Markov/memória, backtesting, estabilidade, log-loss)
     # ============================================================
     st.divider()
     st.header("✅ Validação do Modelo (qualidade e confiabilidade)")
 
-    import matplotlib.pyplot as plt
-
-    # ----------------------------
-    # Helpers
-    # ----------------------------
-    def build_P_from_panel(panel_df: pd.DataFrame, states=("A","R","C"), force_absorb=True) -> pd.DataFrame:
-        dfv = panel_df.copy()
-        dfv["next_state"] = dfv.groupby(customer_col)["state"].shift(-1)
-        transv = dfv.dropna(subset=["next_state"]).copy()
-
-        transv["state"] = pd.Categorical(transv["state"], categories=list(states), ordered=True)
-        transv["next_state"] = pd.Categorical(transv["next_state"], categories=list(states), ordered=True)
-
-        Nijv = (
-            transv.groupby(["state", "next_state"]).size()
-                 .unstack(fill_value=0)
-                 .reindex(index=states, columns=states, fill_value=0)
-        )
-        row_sums_v = Nijv.sum(axis=1).replace(0, np.nan)
-        Pv = Nijv.div(row_sums_v, axis=0).fillna(0.0)
-
-        if force_absorb and "C" in Pv.index and "C" in Pv.columns:
-            Pv.loc["C", :] = 0.0
-            Pv.loc["C", "C"] = 1.0
-        return Pv
-
-    def month_dist(panel_df: pd.DataFrame, month_value, states=("A","R","C")) -> np.ndarray:
-        d = (
-            panel_df[panel_df["month_ts"] == month_value]["state"]
-            .value_counts(normalize=True)
-            .reindex(states).fillna(0.0)
-        )
-        return d.to_numpy()
-
-    def mae(a: np.ndarray, b: np.ndarray) -> float:
-        return float(np.mean(np.abs(a - b)))
-
-    def log_loss(y_true: np.ndarray, p_pred: np.ndarray, eps: float = 1e-15) -> float:
-        p = np.clip(p_pred, eps, 1 - eps)
-        return float(-(y_true*np.log(p) + (1-y_true)*np.log(1-p)).mean())
-
-    def brier_score(y_true: np.ndarray, p_pred: np.ndarray) -> float:
-        return float(np.mean((p_pred - y_true)**2))
-
-    def confusion_counts(y_true: np.ndarray, p_pred: np.ndarray, thr: float):
-        y_hat = (p_pred >= thr).astype(int)
-        tp = int(((y_hat==1) & (y_true==1)).sum())
-        fp = int(((y_hat==1) & (y_true==0)).sum())
-        tn = int(((y_hat==0) & (y_true==0)).sum())
-        fn = int(((y_hat==0) & (y_true==1)).sum())
-        return tp, fp, tn, fn
-
-    def l1_matrix_norm(Pa: pd.DataFrame, Pb: pd.DataFrame) -> float:
-        A = Pa.to_numpy(dtype=float)
-        B = Pb.to_numpy(dtype=float)
-        return float(np.mean(np.abs(A - B)))
-
-    # padronizar month_ts
-    panel_val = panel.copy()
-    panel_val["month_ts"] = pd.to_datetime(panel_val["month_ts"]).dt.to_period("M").dt.to_timestamp()
-    panel_val = panel_val.sort_values([customer_col, "month_ts"]).reset_index(drop=True)
+    # painel já ordenado por cliente e mês, com month_ts no 1º dia do mês
+    panel_val = panel
     states_tuple = tuple(states)
+    # contagens por mês guardadas no ajuste: transições (M, K, K) e linhas por estado (M, K)
+    val_months, val_transitions, val_states = model.months, model.month_transitions, model.month_states
+    val_shares = val_states / np.maximum(val_states.sum(axis=1, keepdims=True), 1)
 
     # ----------------------------
     # 8.1 Backtesting (Out-of-Time)
@@ -1032,17 +1225,17 @@ with main_tabs[2]:
         "- Prevemos π(t+1)=π(t)·P e comparamos com o real"
     )
 
-    months = np.sort(panel_val["month_ts"].unique())
+    months = list(month_index_to_timestamp(val_months))
     if len(months) < 4:
         st.warning("Poucos meses no painel para backtesting. Ideal: 4+ meses.")
     else:
         c1, c2, c3 = st.columns(3)
         with c1:
-            train_start = st.selectbox("Mês inicial (treino)", options=list(months), index=0, key="bt_train_start")
+            train_start = st.selectbox("Mês inicial (treino)", options=months, index=0, key="bt_train_start")
         with c2:
-            train_end = st.selectbox("Mês final (treino)", options=list(months), index=min(2, len(months)-2), key="bt_train_end")
+            train_end = st.selectbox("Mês final (treino)", options=months, index=min(2, len(months)-2), key="bt_train_end")
         with c3:
-            apply_month = st.selectbox("Mês base π(t) (aplicar P)", options=list(months), index=min(3, len(months)-2), key="bt_apply_month")
+            apply_month = st.selectbox("Mês base π(t) (aplicar P)", options=months, index=min(3, len(months)-2), key="bt_apply_month")
 
         month_to_idx = {m:i for i,m in enumerate(months)}
         apply_idx = month_to_idx[apply_month]
@@ -1051,12 +1244,13 @@ with main_tabs[2]:
         if target_month is None:
             st.warning("Não há mês seguinte para comparar.")
         else:
-            panel_train = panel_val[(panel_val["month_ts"] >= train_start) & (panel_val["month_ts"] <= train_end)].copy()
-            P_bt = build_P_from_panel(panel_train, states=states_tuple, force_absorb=True)
+            # transições com origem e destino dentro da janela: meses [início, fim)
+            train_counts = val_transitions[month_to_idx[train_start]:month_to_idx[train_end]].sum(axis=0)
+            P_bt = transition_matrix(train_counts, force_absorb=True)
 
-            pi_apply = month_dist(panel_val, apply_month, states=states_tuple)
-            pi_real = month_dist(panel_val, target_month, states=states_tuple)
-            pi_pred = pi_apply @ P_bt.to_numpy(dtype=float)
+            pi_apply = val_shares[apply_idx]
+            pi_real = val_shares[apply_idx + 1]
+            pi_pred = pi_apply @ P_bt
 
             df_cmp = pd.DataFrame({
                 "estado": list(states_tuple),
@@ -1080,12 +1274,53 @@ with main_tabs[2]:
             ax.legend()
             st.pyplot(fig)
 
+    st.markdown("### Backtest automático — todas as origens (janela expansiva ou móvel)")
+    st.caption(
+        "Para cada mês t, P é treinada só com as transições observadas até t e prevê π(t+h) = π(t)·Pʰ. "
+        "As janelas saem de contagens acumuladas por mês: nenhuma reconstrução do painel por origem."
+    )
+    c1, c2, c3 = st.columns(3)
+    bt_mode = c1.radio("Janela de treino", ["Expansiva (histórico até t)", "Móvel (últimos W meses)"],
+                       key="bt_roll_mode")
+    bt_window = c2.number_input("W (meses, janela móvel)", min_value=1, max_value=120, value=6, step=1,
+                                key="bt_roll_window")
+    bt_horizons = c3.multiselect("Horizontes h (meses)", options=[1, 2, 3, 6, 12], default=[1, 3, 6],
+                                 key="bt_roll_horizons")
+
+    if bt_horizons:
+        bt_window_used = None if bt_mode.startswith("Expansiva") else int(bt_window)
+        bt_all = stages.run(
+            "backtest", stage_key(model_key, bt_window_used, tuple(sorted(bt_horizons))),
+            rolling_backtest, val_transitions, val_states, horizons=bt_horizons, window=bt_window_used,
+            min_train_months=3, months=val_months,
+        )
+        if bt_all.empty:
+            st.warning("Poucos meses no painel para o backtest automático (precisa de 3 meses de treino + horizonte).")
+        else:
+            bt_summary = bt_all.groupby("horizonte")["mae"].agg(origens="size", mae_medio="mean",
+                                                                mae_mediano="median", mae_max="max")
+            st.dataframe(bt_summary.style.format({"mae_medio": "{:.4f}", "mae_mediano": "{:.4f}", "mae_max": "{:.4f}"}),
+                         use_container_width=True)
+
+            fig, ax = plt.subplots()
+            for h, sub in bt_all.groupby("horizonte"):
+                ax.plot(sub["mes_origem"], sub["mae"], marker="o", label=f"h = {h}")
+            ax.set_title("MAE das shares A/R/C por mês de origem")
+            ax.set_xlabel("Mês de origem (t)")
+            ax.set_ylabel("MAE")
+            ax.legend()
+            fig.autofmt_xdate()
+            st.pyplot(fig)
+
+            with st.expander("Ver backtest por origem e horizonte"):
+                st.dataframe(bt_all.drop(columns="origem"), use_container_width=True)
+
     st.divider()
 
     # ----------------------------
-    # 8.2 Teste de Markov (memória) — aproximado
+    # 8.2 Teste de Markov (memória) — razão de verossimilhança
     # ----------------------------
-    st.subheader("2) Teste da Propriedade de Markov (memória) — aproximado")
+    st.subheader("2) Teste da Propriedade de Markov (memória) — 1ª vs 2ª ordem")
     st.info(
     "✅ **Pergunta de negócio:** o estado atual (A/R/C) é suficiente para prever o próximo passo?\n\n"
     "A hipótese de Markov diz que, para prever o futuro, **só importa o estado atual**. "
@@ -1103,38 +1338,37 @@ with main_tabs[2]:
     "difere do comportamento 'médio' do estado **curr**.\n"
     "  - **próximo de 0:** ótimo (o passado quase não importa).\n"
     "  - **alto:** indica 'memória' (o passado influencia).\n"
-    "- **amostra:** tamanho do grupo analisado (grupos pequenos geram divergências menos confiáveis)."
+    "- **amostra:** tamanho do grupo analisado (grupos pequenos geram divergências menos confiáveis).\n"
+    "- **G2 / p_valor:** teste da razão de verossimilhança (H₀: só o estado atual importa). "
+    "p-valor pequeno (< 0.05) = o estado anterior muda o próximo passo; com bases grandes, "
+    "olhe também o tamanho da divergência."
     )
 
-    tmp = panel_val.copy()
-    tmp["prev_state"] = tmp.groupby(customer_col)["state"].shift(1)
-    tmp["next_state"] = tmp.groupby(customer_col)["state"].shift(-1)
-    tri = tmp.dropna(subset=["prev_state", "next_state"]).copy()
+    test_order3 = st.checkbox("Testar também 3ª vs 2ª ordem (dois meses de histórico)", value=False,
+                              key="model_markov_order3")
 
-    if tri.empty:
-        st.warning("Não há sequência suficiente para testar memória (precisa de 3+ meses por cliente).")
-    else:
-        P1 = (
-            tri.groupby(["state", "next_state"]).size()
-            .unstack(fill_value=0)
-            .reindex(index=states_tuple, columns=states_tuple, fill_value=0)
+    for order in ([2, 3] if test_order3 else [2]):
+        order_test = stages.run(
+            f"order_test_{order}", stage_key(states_key, order),
+            lambda: markov_order_test(history_counts(panel_val, customer_col, order, len(states_tuple)), states_tuple),
         )
-        P1 = P1.div(P1.sum(axis=1).replace(0, np.nan), axis=0).fillna(0.0)
-
-        g = tri.groupby(["prev_state", "state", "next_state"]).size().rename("n").reset_index()
-
-        divergences = []
-        for (prev_s, curr_s), sub in g.groupby(["prev_state", "state"]):
-            vec_counts = sub.set_index("next_state")["n"].reindex(states_tuple).fillna(0.0).to_numpy()
-            if vec_counts.sum() == 0:
-                continue
-            p2 = vec_counts / vec_counts.sum()
-            p1 = P1.loc[curr_s].to_numpy(dtype=float)
-            div = np.mean(np.abs(p2 - p1))
-            divergences.append({"prev": prev_s, "curr": curr_s, "div_L1_media": div, "amostra": int(vec_counts.sum())})
-
-        div_df = pd.DataFrame(divergences).sort_values("div_L1_media", ascending=False)
-        st.dataframe(div_df.head(20), use_container_width=True)
+        if order_test.n == 0:
+            st.warning(f"Não há sequência suficiente para testar memória (precisa de {order + 1}+ meses por cliente).")
+            continue
+
+        st.write(f"#### Ordem {order - 1} (H₀) vs ordem {order}")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("G² (razão de verossimilhança)", f"{order_test.g2:,.1f}")
+        c2.metric("Graus de liberdade", f"{order_test.df}")
+        c3.metric("p-valor (G²)", f"{order_test.p_value:.2e}" if order_test.df else "n/a")
+        c4.metric("Transições testadas", f"{order_test.n:,}")
+        st.caption(
+            f"Qui-quadrado de Pearson: {order_test.chi2:,.1f} (p-valor {order_test.p_value_chi2:.2e}). "
+            f"Células com contagem esperada < 5: {order_test.sparse_share:.1%}."
+        )
+        st.dataframe(order_test.contexts, use_container_width=True)
+        st.dataframe(order_test.histories.sort_values("div_L1_media", ascending=False).head(20),
+                     use_container_width=True)
 
     st.divider()
 
@@ -1150,28 +1384,17 @@ with main_tabs[2]:
     "e previsões feitas com um único modelo podem estar distorcidas."
     )
 
-    tmp2 = panel_val.copy()
-    tmp2["next_state"] = tmp2.groupby(customer_col)["state"].shift(-1)
-    trans2 = tmp2.dropna(subset=["next_state"]).copy()
+    # P de cada mês com transições, em lote sobre o eixo dos meses
+    has_trans = val_transitions.sum(axis=(1, 2)) > 0
 
-    if trans2.empty:
+    if not has_trans.any():
         st.warning("Não há transições suficientes para estimar P por período.")
     else:
-        mats = []
-        for m, dfm in trans2.groupby("month_ts"):
-            Nij_m = (
-                dfm.groupby(["state","next_state"]).size()
-                .unstack(fill_value=0)
-                .reindex(index=states_tuple, columns=states_tuple, fill_value=0)
-            )
-            rs = Nij_m.sum(axis=1).replace(0, np.nan)
-            Pm = Nij_m.div(rs, axis=0).fillna(0.0)
-            Pm.loc["C", :] = 0.0
-            Pm.loc["C", "C"] = 1.0
-            mats.append((m, Pm))
-
-        diffs = [{"month": m, "L1_medio_vs_global": l1_matrix_norm(P, Pm)} for m, Pm in mats]
-        diff_df = pd.DataFrame(diffs).sort_values("month")
+        P_months = transition_matrix(val_transitions[has_trans], force_absorb=True)
+        diff_df = pd.DataFrame({
+            "month": month_index_to_timestamp(val_months[has_trans]),
+            "L1_medio_vs_global": np.abs(P_months - P.to_numpy(dtype=float)).mean(axis=(1, 2)),
+        })
         st.dataframe(diff_df, use_container_width=True)
 
         fig, ax = plt.subplots()
@@ -1202,16 +1425,15 @@ with main_tabs[2]:
     "O Brier Score mede o quão erradas estão as probabilidades que o modelo fornece."
     )
 
-    eval_df = panel_val.copy()
-    eval_df["next_state"] = eval_df.groupby(customer_col)["state"].shift(-1)
-    eval_df = eval_df.dropna(subset=["next_state"]).copy()
-
-    # prob churn próxima etapa = P[estado_atual, C]
-    eval_df["p_churn_next"] = eval_df["state"].map(P["C"].to_dict())
-    eval_df["y_churn_next"] = (eval_df["next_state"] == "C").astype(int)
-
-    y_true = eval_df["y_churn_next"].to_numpy(dtype=int)
-    p_pred = eval_df["p_churn_next"].to_numpy(dtype=float)
+    # prob churn próxima etapa = P[estado_atual, C]: cada transição só depende do estado atual,
+    # então basta um par (não churn, churn) por estado, pesado pelas contagens Nᵢⱼ
+    n_churn = model.Nij[:, STATE_C]
+    n_rows = model.Nij.sum(axis=1)
+    y_true = np.tile([0, 1], len(states_tuple))
+    p_pred = np.repeat(P["C"].to_numpy(dtype=float), 2)
+    w_eval = np.column_stack([n_rows - n_churn, n_churn]).ravel()
+    # confusão em todos os limiares de uma vez: o slider só consulta a curva
+    sweep = threshold_sweep(y_true, p_pred, weights=w_eval)
 
     thr = st.slider(
         "Threshold para classificar churn (ex.: 0.5)",
@@ -1219,29 +1441,14 @@ with main_tabs[2]:
         key="tab_model_validation_confusion_threshold"  # <- key única
     )
 
-    def confusion_counts(y_true: np.ndarray, p_pred: np.ndarray, thr: float):
-        y_hat = (p_pred >= thr).astype(int)
-        tp = int(((y_hat==1) & (y_true==1)).sum())
-        fp = int(((y_hat==1) & (y_true==0)).sum())
-        tn = int(((y_hat==0) & (y_true==0)).sum())
-        fn = int(((y_hat==0) & (y_true==1)).sum())
-        return tp, fp, tn, fn
-
-    def log_loss(y_true: np.ndarray, p_pred: np.ndarray, eps: float = 1e-15) -> float:
-        p = np.clip(p_pred, eps, 1 - eps)
-        return float(-(y_true*np.log(p) + (1-y_true)*np.log(1-p)).mean())
-
-    def brier_score(y_true: np.ndarray, p_pred: np.ndarray) -> float:
-        return float(np.mean((p_pred - y_true)**2))
-
-    tp, fp, tn, fn = confusion_counts(y_true, p_pred, thr)
+    tp, fp, tn, fn = sweep.at(thr)
 
     precision = tp / (tp + fp) if (tp + fp) else 0.0
     recall = tp / (tp + fn) if (tp + fn) else 0.0
     acc = (tp + tn) / (tp + tn + fp + fn) if (tp + tn + fp + fn) else 0.0
 
-    ll = log_loss(y_true, p_pred)
-    bs = brier_score(y_true, p_pred)
+    ll = log_loss(y_true, p_pred, weights=w_eval)
+    bs = brier_score(y_true, p_pred, weights=w_eval)
 
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("Accuracy", f"{acc*100:.2f}%")
@@ -1259,6 +1466,39 @@ with main_tabs[2]:
     )
     st.dataframe(cm, use_container_width=True)
 
+    st.write("### Curvas ROC, Precisão × Recall e confiabilidade")
+    c1, c2 = st.columns(2)
+    c1.metric("AUC (ROC)", f"{sweep.auc:.4f}")
+    c2.metric("Average Precision (PR)", f"{sweep.average_precision:.4f}")
+
+    curve = sweep.curve
+    reliab = reliability_curve(y_true, p_pred, weights=w_eval)
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4))
+    axes[0].plot(curve["fpr"], curve["tpr"], marker="o")
+    axes[0].plot([0, 1], [0, 1], linestyle="--", color="gray")
+    axes[0].set_title("ROC")
+    axes[0].set_xlabel("Taxa de falsos positivos")
+    axes[0].set_ylabel("Recall")
+    axes[1].plot(curve["tpr"], curve["precision"], marker="o")
+    axes[1].set_title("Precisão × Recall")
+    axes[1].set_xlabel("Recall")
+    axes[1].set_ylabel("Precisão")
+    axes[2].plot([0, 1], [0, 1], linestyle="--", color="gray")
+    axes[2].scatter(reliab["p_medio"], reliab["taxa_real"], s=20 + 200 * reliab["amostra"] / reliab["amostra"].max())
+    axes[2].set_title("Confiabilidade (previsto vs real)")
+    axes[2].set_xlabel("P(churn) prevista")
+    axes[2].set_ylabel("Churn observado")
+    # ponto do limiar escolhido nas curvas
+    at_thr = sweep.row(thr)
+    axes[0].scatter([at_thr["fpr"]], [at_thr["tpr"]], color="red", zorder=3, label=f"limiar {thr:.2f}")
+    axes[1].scatter([at_thr["tpr"]], [at_thr["precision"]], color="red", zorder=3)
+    axes[0].legend()
+    fig.tight_layout()
+    st.pyplot(fig)
+
+    with st.expander("Ver confusão em cada limiar"):
+        st.dataframe(curve, use_container_width=True)
+
     st.write(
     "💡 **Como ler isso (executivo):**\n"
     "- **Recall alto**: você captura a maioria dos churners (bom para evitar perda, mas pode gerar falsos positivos)\n"
@@ -1281,89 +1521,26 @@ with main_tabs[3]:
     # ----------------------------
     # 0) Checar se o modelo existe
     # ----------------------------
-    required = ["P", "states", "panel_monthly", "data_config", "model_params"]
+    required = ["model", "model_key", "states", "panel_monthly", "data_config", "model_params"]
     if any(k not in st.session_state for k in required):
         st.warning("Primeiro carregue os dados (📥 Dados) e rode o modelo (⚙️ Modelo).")
         st.stop()
 
-    import pandas as pd
-    import numpy as np
-    import matplotlib.pyplot as plt
-
-    P = st.session_state["P"].copy()
+    model = st.session_state["model"]
+    P = model.P_frame
     states = st.session_state["states"]
-    panel = st.session_state["panel_monthly"].copy()
+    panel = st.session_state["panel_monthly"]  # somente leitura (cliente/estado em códigos)
     cfg = st.session_state["data_config"]
     params = st.session_state["model_params"]
 
     customer_col = cfg["customer_col"]
 
-    # Garantir ordem
-    P = P.reindex(index=states, columns=states).astype(float)
-    P_np = P.to_numpy(dtype=float)
-
     st.caption(
         "Nesta aba você vê **o que o modelo responde para o negócio**: "
         "risco de churn por horizonte, tempo de vida, LTV, projeções e impacto de ações."
     )
 
-    # ----------------------------
-    # Helpers
-    # ----------------------------
-    def is_absorbing(P_df, absorb_state="C") -> bool:
-        if absorb_state not in P_df.index or absorb_state not in P_df.columns:
-            return False
-        row = P_df.loc[absorb_state, :]
-        return np.isclose(row.drop(absorb_state).sum(), 0.0) and np.isclose(row[absorb_state], 1.0)
-
-    def safe_matrix_power(P_np, n: int):
-        return np.linalg.matrix_power(P_np, int(n))
-
-    def get_Q(P_df, transient=("A", "R")):
-        return P_df.loc[list(transient), list(transient)].to_numpy(dtype=float)
-
-    def fundamental_matrix(Q):
-        I = np.eye(Q.shape[0])
-        return np.linalg.inv(I - Q)
-
-    def expected_time_to_absorption(Q):
-        N = fundamental_matrix(Q)
-        ones = np.ones((Q.shape[0], 1))
-        t = (N @ ones).flatten()
-        return t, N
-
-    def month_state_distribution(panel_df):
-        tmp = (
-            panel_df.groupby(["month_ts", "state"])
-                    .size()
-                    .rename("count")
-                    .reset_index()
-        )
-        total = tmp.groupby("month_ts")["count"].transform("sum")
-        tmp["share"] = tmp["count"] / total
-        pivot = tmp.pivot(index="month_ts", columns="state", values="share").fillna(0.0)
-        pivot = pivot.reindex(columns=states, fill_value=0.0)
-        return pivot
-
-    def reward_by_state(panel_df, remove_negative=True):
-        df2 = panel_df.copy()
-        if "revenue" in df2.columns:
-            if remove_negative:
-                df2 = df2[df2["revenue"] >= 0].copy()
-            # ⚠️ bom para negócio: churn por definição não gera receita
-            # então forçamos reward(C)=0 para não confundir o usuário
-            rewards = df2.groupby("state")["revenue"].mean().reindex(states).fillna(0.0)
-            if "C" in rewards.index:
-                rewards.loc["C"] = 0.0
-            return rewards
-        else:
-            rewards = df2.groupby("state")["total_purchases"].mean().reindex(states).fillna(0.0)
-            if "C" in rewards.index:
-                rewards.loc["C"] = 0.0
-            return rewards
-
-    idx = {s: i for i, s in enumerate(states)}
-    absorbing = is_absorbing(P, "C")
+    absorbing = model.is_absorbing
 
     # ============================================================
     # 1) Matriz P + Heatmap
@@ -1416,7 +1593,7 @@ with main_tabs[3]:
     "• **A caindo** → enfraquecimento da carteira"
     )
 
-    dist_month = month_state_distribution(panel)
+    dist_month = model.month_distribution()
 
     fig, ax = plt.subplots()
 
@@ -1449,13 +1626,7 @@ with main_tabs[3]:
     start_state = st.selectbox("Estado inicial para análise", options=["A", "R"], index=0, key="graphs_start_state")
     horizon = st.slider("Horizonte máximo (meses)", 1, 60, 24, 1, key="graphs_horizon")
 
-    churn_idx = idx.get("C", None)
-
-    probs = []
-    for n in range(1, horizon + 1):
-        Pn = safe_matrix_power(P_np, n)
-        probs.append(Pn[idx[start_state], churn_idx])
-
+    probs = model.churn_curve(horizon, start_state)
     curve_df = pd.DataFrame({"n": np.arange(1, horizon + 1), "P(churn até n)": probs}).set_index("n")
 
     fig, ax = plt.subplots()
@@ -1470,6 +1641,28 @@ with main_tabs[3]:
         if k <= horizon:
             st.write(f"📌 **Churn acumulado em {k} meses** (começando em {start_state}): **{curve_df.loc[k,'P(churn até n)']*100:.2f}%**")
 
+    with st.expander("Horizonte longo ou fracionário (forma fechada de Pⁿ)"):
+        st.caption(
+            "Pⁿ calculado pela decomposição de P (autovalores ou forma canônica Q/R), "
+            "com o mesmo custo para qualquer n — útil para planejamento de longo prazo e sensibilidade."
+        )
+        n_long = st.number_input(
+            "n (meses; aceita frações, ex.: 1.5)",
+            min_value=0.0, max_value=100000.0, value=240.0, step=0.5,
+            key="graphs_long_horizon_n"
+        )
+        spectral = model.spectral
+        try:
+            c1, c2 = st.columns(2)
+            c1.metric(f"P(churn em {n_long:g} meses | A)", f"{model.churn_probability(n_long, 'A')*100:.4f}%")
+            c2.metric(f"P(churn em {n_long:g} meses | R)", f"{model.churn_probability(n_long, 'R')*100:.4f}%")
+        except ValueError as e:
+            st.warning(f"Não foi possível calcular Pⁿ para n = {n_long:g}: {e}")
+        st.caption(
+            f"Método: **{spectral.method}** — erro máximo vs multiplicação repetida (n ≤ 240): "
+            f"{spectral.check(240):.2e}"
+        )
+
     st.divider()
 
     # ============================================================
@@ -1482,23 +1675,8 @@ with main_tabs[3]:
         "Isso é útil para mostrar o 'custo de não agir' para diretoria."
     )
 
-    last_month = panel["month_ts"].max()
-    pi0 = (
-        panel[panel["month_ts"] == last_month]["state"]
-        .value_counts(normalize=True)
-        .reindex(states).fillna(0.0)
-        .to_numpy()
-    )
-
     sim_h = st.slider("Projetar até (meses)", 6, 120, 36, 6, key="graphs_forecast_h")
-
-    pis = []
-    for n in range(0, sim_h + 1):
-        Pn = safe_matrix_power(P_np, n)
-        pis.append(pi0 @ Pn)
-
-    pi_df = pd.DataFrame(pis, columns=states)
-    pi_df.index.name = "n_meses"
+    pi_df = model.projection(sim_h)
 
     fig, ax = plt.subplots()
     for s in states:
@@ -1522,8 +1700,7 @@ with main_tabs[3]:
     )
 
     if absorbing:
-        Q = get_Q(P, transient=("A", "R"))
-        t_vec, Nfund = expected_time_to_absorption(Q)
+        t_vec, Nfund = model.time_to_churn()
         t_df = pd.DataFrame({"Estado inicial": ["A", "R"], "Tempo médio até churn (meses)": t_vec})
         st.dataframe(t_df, use_container_width=True)
 
@@ -1535,6 +1712,29 @@ with main_tabs[3]:
 
         with st.expander("Ver matriz fundamental N"):
             st.dataframe(pd.DataFrame(Nfund, index=["A","R"], columns=["A","R"]).style.format("{:.4f}"), use_container_width=True)
+
+        st.write("### Distribuição do tempo até churn (não só a média)")
+        st.caption(
+            "P(T > n) = (Qⁿ·1): chance de o cliente ainda não ter churnado após n meses. "
+            "Percentis: p50 = metade dos clientes já churnou até esse mês."
+        )
+        ttc_summary = model.time_to_churn_summary()
+        st.dataframe(ttc_summary.style.format("{:.2f}"), use_container_width=True)
+
+        ttc_dist = model.time_to_churn_distribution()
+        p90_max = ttc_summary["p90"].max()
+        ttc_show = ttc_dist.loc[:max(12, int(2 * p90_max))] if np.isfinite(p90_max) else ttc_dist
+        fig, axes = plt.subplots(1, 2, figsize=(12, 4))
+        for s in ("A", "R"):
+            axes[0].plot(ttc_show.index, ttc_show[f"sobrevivencia_{s}"], label=f"começando em {s}")
+            axes[1].plot(ttc_show.index[1:], ttc_show[f"pmf_{s}"].iloc[1:], marker=".", label=f"começando em {s}")
+        axes[0].set_title("Sobrevivência — P(ainda sem churn após n meses)")
+        axes[1].set_title("P(churn exatamente no mês n)")
+        for ax in axes:
+            ax.set_xlabel("n (meses)")
+            ax.legend()
+        fig.tight_layout()
+        st.pyplot(fig)
     else:
         st.warning("Tempo até churn faz mais sentido quando C é absorvente.")
 
@@ -1551,7 +1751,7 @@ with main_tabs[3]:
     )
 
     remove_negative = st.checkbox("Ignorar revenue negativo (devoluções) no reward", True, key="graphs_rm_neg")
-    rewards = reward_by_state(panel, remove_negative=remove_negative)
+    rewards = model.rewards(remove_negative=remove_negative)
 
     st.write("Ganho médio mensal estimado por estado (reward):")
     st.dataframe(rewards.to_frame("ganho_medio_mensal").style.format("{:.2f}"), use_container_width=True)
@@ -1565,12 +1765,7 @@ with main_tabs[3]:
     )
 
     if absorbing:
-        Q = get_Q(P, transient=("A","R"))
-        r = rewards.reindex(["A","R"]).to_numpy(dtype=float).reshape(-1,1)
-
-        I = np.eye(Q.shape[0])
-        V = np.linalg.inv(I - discount * Q) @ r
-        V = V.flatten()
+        V = model.ltv(discount=discount, remove_negative=remove_negative)
 
         ltv_df = pd.DataFrame({"Estado inicial": ["A","R"], "LTV esperado (a partir de hoje)": V})
         st.dataframe(ltv_df, use_container_width=True)
@@ -1599,7 +1794,225 @@ with main_tabs[3]:
         "Ex.: quantos clientes precisam de campanha de reativação (R)?"
     )
 
-    snap = panel[panel["month_ts"] == last_month].copy()
-    uniq = snap.groupby("state")[customer_col].nunique().reindex(states).fillna(0).astype(int)
+    last_month = panel["month_ts"].max()
+    snap = panel[panel["month_ts"] == last_month]
+    uniq = snap.groupby("state")[customer_col].nunique().reindex(range(len(states))).fillna(0).astype(int)
+    uniq.index = pd.Index(states, name="state")
 
     st.dataframe(uniq.to_frame("clientes_unicos").T, use_container_width=True)
+
+    st.divider()
+
+    # ============================================================
+    # 8) Segmentos (país, canal, coorte) — uma P por segmento
+    # ============================================================
+    st.subheader("8) Segmentos — P por país, canal ou coorte de aquisição")
+
+    st.info(
+        "✅ **Pergunta de negócio:** quais segmentos churnam mais rápido e quanto vale um cliente em cada um?\n"
+        "Todas as matrizes P por segmento são estimadas de uma vez, a partir do mesmo painel do modelo."
+    )
+
+    segment_sources = {"Coorte de aquisição (mês da 1ª compra)": COHORT_SEGMENT}
+    segment_sources.update({f"Coluna: {c}": c for c in cfg.get("segment_cols", [])})
+    seg_choice = st.selectbox("Segmentar por", options=list(segment_sources), key="graphs_segment_source")
+    if len(segment_sources) == 1:
+        st.caption("Para segmentar por país, canal etc., escolha colunas de segmento na aba 📥 Dados.")
+
+    seg_model = model_stages().run(
+        "segments", stage_key(st.session_state.get("model_key"), seg_choice),
+        segment_model, model, segment_sources[seg_choice], st.session_state["df"],
+    )
+
+    c1, c2 = st.columns(2)
+    seg_h = c1.number_input("Horizonte do ranking (meses)", min_value=1, max_value=120, value=12, step=1,
+                            key="graphs_segment_h")
+    seg_min = c2.number_input("Mínimo de clientes por segmento", min_value=0, value=10, step=1,
+                              key="graphs_segment_min")
+
+    board = seg_model.leaderboard(int(seg_h), discount=discount, remove_negative=remove_negative)
+    board = board[board["clientes"] >= int(seg_min)]
+    st.caption(
+        f"{len(board):,} de {seg_model.n_segments:,} segmentos (com ≥ {int(seg_min)} clientes), "
+        f"ordenados pelo churn em {int(seg_h)} meses a partir de A — clique no cabeçalho para reordenar."
+    )
+    st.dataframe(
+        board.style.format({c: "{:.4f}" for c in board.columns if c not in ("clientes", "transicoes")}),
+        use_container_width=True
+    )
+
+    if len(board):
+        top = board.head(15)
+        fig, ax = plt.subplots()
+        ax.barh(top.index.astype(str)[::-1], top[f"churn_{int(seg_h)}m_A"].to_numpy()[::-1])
+        ax.set_title(f"Segmentos com maior P(churn em {int(seg_h)} meses | A)")
+        ax.set_xlabel("Probabilidade")
+        st.pyplot(fig)
+
+        seg_pick = st.selectbox("Ver matriz P do segmento", options=board.index.tolist(), key="graphs_segment_pick")
+        st.dataframe(seg_model.P_frame(seg_pick).style.format("{:.4f}"), use_container_width=True)
+
+        # sobrevivência de todos os segmentos sai de uma vez; aqui só a do segmento escolhido vs a global
+        seg_surv = seg_model.time_to_churn_survival()[seg_model.segment_index(seg_pick)]
+        global_dist = model.time_to_churn_distribution()
+        if not np.isnan(seg_surv[0, 0]) and global_dist is not None:
+            n_show = min(seg_surv.shape[-1], len(global_dist), 60)
+            fig, ax = plt.subplots()
+            ax.plot(np.arange(n_show), seg_surv[0, :n_show], label=f"{seg_pick} — começando em A")
+            ax.plot(np.arange(n_show), global_dist["sobrevivencia_A"].to_numpy()[:n_show], linestyle="--",
+                    label="base toda — começando em A")
+            ax.set_title("Sobrevivência (sem churn após n meses): segmento vs base")
+            ax.set_xlabel("n (meses)")
+            ax.legend()
+            st.pyplot(fig)
+
+    st.divider()
+
+    # ============================================================
+    # 9) Score por cliente (CRM)
+    # ============================================================
+    st.subheader("9) Score por cliente — churn em n meses e LTV para o CRM")
+
+    st.info(
+        "✅ **Pergunta de negócio:** qual a chance de cada cliente estar em churn daqui a n meses, e quanto ele vale?\n"
+        "Cada cliente recebe (Pⁿ)[estado atual, C] e o LTV do seu estado no último mês do painel."
+    )
+
+    c1, c2 = st.columns(2)
+    score_h = c1.number_input("Horizonte do score (meses)", min_value=1, max_value=120, value=12, step=1,
+                              key="graphs_score_h")
+    score_by_segment = c2.checkbox(f"Usar a P do segmento ({seg_choice})", value=False, key="graphs_score_segment")
+
+    scores = score_customers(
+        model, int(score_h), discount=discount, remove_negative=remove_negative,
+        segments=seg_model if score_by_segment else None,
+    )
+    churn_col = f"churn_{int(score_h)}m"
+    st.caption(f"{len(scores):,} clientes pontuados. Maiores probabilidades de churn entre os que ainda não estão em C:")
+    st.dataframe(
+        scores[scores["state"] != "C"].nlargest(25, churn_col).style.format({churn_col: "{:.4f}", "ltv": "{:,.2f}"}),
+        use_container_width=True
+    )
+
+    score_file = f"customer_scores_{int(score_h)}m"
+    c1, c2 = st.columns(2)
+    # arquivos gerados só no clique (milhões de clientes não pesam em cada rerun)
+    c1.download_button(
+        "⬇️ Baixar scores (CSV)", data=lambda: scores.to_csv(index=False).encode("utf-8"),
+        file_name=f"{score_file}.csv", mime="text/csv", key="graphs_score_csv"
+    )
+    if HAS_PYARROW:
+        c2.download_button(
+            "⬇️ Baixar scores (Parquet)", data=lambda: scores.to_parquet(index=False),
+            file_name=f"{score_file}.parquet", mime="application/octet-stream", key="graphs_score_parquet"
+        )
+
+    st.divider()
+
+    # ============================================================
+    # 10) Intervalos de confiança (bootstrap de clientes)
+    # ============================================================
+    st.subheader("10) Intervalos de confiança — bootstrap por cliente")
+
+    st.info(
+        "✅ **Pergunta de negócio:** quanto esses números podem variar só por acaso na amostra de clientes?\n"
+        "Clientes são reamostrados com reposição (com todo o seu histórico de transições) e P, churn em 3/6/12 meses, "
+        "tempo até churn e LTV são recalculados em cada réplica."
+    )
+
+    c1, c2, c3 = st.columns(3)
+    n_boot = c1.number_input("Réplicas", min_value=50, max_value=10000, value=1000, step=50, key="graphs_boot_n")
+    boot_seed = c2.number_input("Semente", min_value=0, value=42, step=1, key="graphs_boot_seed")
+    boot_level = c3.slider("Nível de confiança", 0.80, 0.99, 0.95, 0.01, key="graphs_boot_level")
+
+    # réplicas guardadas na sessão: só refaz ao clicar, e só vale para o mesmo modelo (chave da etapa
+    # do modelo na aba ⚙️ Modelo: dados, agregação, amostra, gaps e P) e os mesmos parâmetros
+    boot_key = stage_key(st.session_state["model_key"], int(n_boot), int(boot_seed), float(discount),
+                         bool(remove_negative))
+    if st.button("Rodar bootstrap", key="graphs_boot_run"):
+        with st.spinner(f"Rodando {int(n_boot):,} réplicas..."):
+            t0 = time.perf_counter()
+            boot = bootstrap(
+                model, int(n_boot), seed=int(boot_seed), horizons=(3, 6, 12), discount=discount,
+                remove_negative=remove_negative, n_jobs=int(st.session_state.get("model_n_jobs", 1)),
+            )
+            st.session_state["bootstrap"] = {"key": boot_key, "result": boot, "secs": time.perf_counter() - t0}
+
+    boot_state = st.session_state.get("bootstrap")
+    if boot_state is None or boot_state["key"] != boot_key:
+        st.caption("Clique em **Rodar bootstrap** para calcular os intervalos com os parâmetros atuais.")
+    else:
+        boot = boot_state["result"]
+        iv = boot.intervals(level=float(boot_level))
+        st.caption(f"{boot.n_boot:,} réplicas em {boot_state['secs']:.2f} s — intervalos percentis de {boot_level:.0%}.")
+        st.dataframe(iv.style.format("{:.4f}"), use_container_width=True)
+
+        fig, ax = plt.subplots()
+        for offset, s in ((-0.15, "A"), (0.15, "R")):
+            rows = iv.loc[[f"churn_{h}m_{s}" for h in boot.horizons]]
+            x = np.arange(len(boot.horizons)) + offset
+            err = np.vstack([rows["estimativa"] - rows["ic_inf"], rows["ic_sup"] - rows["estimativa"]])
+            ax.errorbar(x, rows["estimativa"], yerr=err, fmt="o", capsize=4, label=f"começando em {s}")
+        ax.set_xticks(np.arange(len(boot.horizons)))
+        ax.set_xticklabels([f"{h} meses" for h in boot.horizons])
+        ax.set_ylabel("P(churn)")
+        ax.set_title(f"Churn acumulado com IC de {boot_level:.0%}")
+        ax.legend()
+        st.pyplot(fig)
+
+    st.divider()
+
+    # ============================================================
+    # 11) Simulação Monte Carlo (distribuição de churn e receita)
+    # ============================================================
+    st.subheader("11) Simulação Monte Carlo — faixa de churn e receita nos próximos meses")
+
+    st.info(
+        "✅ **Pergunta de negócio:** quantos clientes podemos perder e quanto podemos faturar no próximo ano, "
+        "e com que margem?\n"
+        "A seção 4 mostra só a média π₀·Pⁿ. Aqui a base atual é simulada muitas vezes com P e o reward de cada "
+        "estado, e cada mês ganha uma faixa (quantis) em vez de um número só."
+    )
+
+    c1, c2, c3 = st.columns(3)
+    sim_paths = c1.number_input("Caminhos simulados", min_value=100, max_value=100000, value=2000, step=100,
+                                key="graphs_sim_paths")
+    sim_h = c2.number_input("Horizonte (meses)", min_value=1, max_value=120, value=12, step=1, key="graphs_sim_h")
+    sim_seed = c3.number_input("Semente", min_value=0, value=42, step=1, key="graphs_sim_seed")
+
+    # caminhos guardados na sessão: só refaz ao clicar, e só vale para o mesmo modelo (chave da etapa
+    # do modelo) e os mesmos parâmetros
+    sim_key = stage_key(st.session_state["model_key"], int(sim_paths), int(sim_h), int(sim_seed),
+                        bool(remove_negative))
+    if st.button("Rodar simulação", key="graphs_sim_run"):
+        with st.spinner(f"Simulando {int(sim_paths):,} caminhos..."):
+            t0 = time.perf_counter()
+            sim = simulate(
+                model, int(sim_paths), int(sim_h), seed=int(sim_seed), remove_negative=remove_negative,
+                n_jobs=int(st.session_state.get("model_n_jobs", 1)),
+            )
+            st.session_state["simulation"] = {"key": sim_key, "result": sim, "secs": time.perf_counter() - t0}
+
+    sim_state = st.session_state.get("simulation")
+    if sim_state is None or sim_state["key"] != sim_key:
+        st.caption("Clique em **Rodar simulação** para gerar os caminhos com os parâmetros atuais.")
+    else:
+        sim = sim_state["result"]
+        sim_month = sim.monthly()
+        st.caption(f"{sim.n_paths:,} caminhos × {sim.horizon} meses em {sim_state['secs']:.2f} s — faixas de 5% a 95%.")
+        st.dataframe(sim.totals().style.format("{:,.1f}"), use_container_width=True)
+
+        fig, axes = plt.subplots(1, 2, figsize=(12, 4))
+        for ax, name, title in ((axes[0], "novos_churn", "Novos churns por mês"),
+                                (axes[1], "receita", "Receita por mês")):
+            ax.fill_between(sim_month.index, sim_month[f"{name}_p5"], sim_month[f"{name}_p95"], alpha=0.3,
+                            label="faixa 5%–95%")
+            ax.plot(sim_month.index, sim_month[f"{name}_p50"], marker="o", label="mediana")
+            ax.set_title(title)
+            ax.set_xlabel("n (meses)")
+            ax.legend()
+        fig.tight_layout()
+        st.pyplot(fig)
+
+        with st.expander("Ver quantis por mês"):
+            st.dataframe(sim_month, use_container_width=True)
@@ -0,0 +1,54 @@
+"""Benchmark: churn absorvente via groupby+lambda vs passe vetorizado.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_absorbing_churn --customers 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from markov_churn import group_start_mask, propagate_absorbing
+
+
+def synthetic_panel(n_customers: int, max_months: int = 36, seed: int = 42) -> pd.DataFrame:
+    # painel ordenado por cliente, com 1..max_months linhas por cliente e estados A/R/C
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, max_months + 1, size=n_customers)
+    customer = np.repeat(np.arange(n_customers), lengths).astype(str)
+    state = rng.choice(np.array(["A", "R", "C"], dtype=object), size=int(lengths.sum()), p=[0.6, 0.3, 0.1])
+    return pd.DataFrame({"customer": customer, "state": state})
+
+
+def with_lambda(panel: pd.DataFrame) -> np.ndarray:
+    return panel.groupby("customer")["state"].transform(lambda s: (s == "C").cummax()).to_numpy(dtype=bool)
+
+
+def vectorized(panel: pd.DataFrame) -> np.ndarray:
+    return propagate_absorbing(panel["state"].to_numpy() == "C", group_start_mask(panel["customer"].to_numpy()))
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--max-months", type=int, default=36)
+    args = parser.parse_args()
+
+    print(f"{'clientes':>10} {'linhas':>12} {'lambda (s)':>11} {'vetorizado (s)':>15} {'speedup':>8}")
+    for n in args.customers:
+        panel = synthetic_panel(n, args.max_months)
+        ref, t_ref = timed(with_lambda, panel)
+        out, t_vec = timed(vectorized, panel)
+        assert np.array_equal(ref, out), "resultado diferente do groupby+lambda"
+        print(f"{n:>10,} {len(panel):>12,} {t_ref:>11.2f} {t_vec:>15.3f} {t_ref / t_vec:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Motor da Cadeia de Markov de churn (A/R/C), sem dependência do Streamlit.
+
+Uso headless (batch, benchmarks) e pela aba ⚙️ Modelo do app seguem o mesmo caminho:
+
+    from markov_churn import ModelParams, fit_file
+    model = fit_file("transacoes.parquet", "Customer ID", "InvoiceDate", ModelParams(churn_gap_months=3))
+    model.P_frame, model.churn_probability(12, "A"), model.ltv(discount=0.98)
+"""
+
+from .analytics import (
+    expected_time_to_absorption, fundamental_matrix, get_Q, is_absorbing, ltv_by_state, month_state_distribution,
+    reward_by_state, safe_matrix_power, solve_batched,
+)
+from .engine import MarkovChurnModel, ModelParams, fit, fit_aggregated, fit_file, model_from_panel
+from .horizon import HorizonEngine, horizon_engine
+from .bootstrap import BootstrapResult, bootstrap, customer_contributions
+from .expanded import ExpandedModel, expanded_labels, expanded_states, fit_expanded
+from .spectral import SpectralPower, power_2x2, spectral_power
+from .incremental import ModelState, merge_states, state_from_model
+from .parallel import fit_aggregated_parallel, fit_parallel, panel_with_states, state_from_aggregated_parallel
+from .scoring import current_states, score_customers
+from .simulation import SimulationResult, simulate
+from .segments import COHORT_SEGMENT, SegmentModel, fit_segments, segment_model
+from .streaming import MonthlyAccumulator, fit_streaming
+from .io import load_transactions
+from .panel import (
+    NEG_MODES, aggregate_monthly, assign_states, build_monthly_panel, group_start_mask, month_index_to_timestamp,
+    propagate_absorbing, select_customers, shift_in_group,
+)
+from .states import STATES, decode_states, encode_customers
+from .transitions import (
+    counts_frame, matrix_frame, month_counts, segment_transition_counts, transition_counts, transition_matrix,
+)
+
+__all__ = [
+    "MarkovChurnModel",
+    "ModelParams",
+    "fit",
+    "fit_aggregated",
+    "fit_file",
+    "model_from_panel",
+    "BootstrapResult",
+    "bootstrap",
+    "customer_contributions",
+    "ExpandedModel",
+    "expanded_labels",
+    "expanded_states",
+    "fit_expanded",
+    "HorizonEngine",
+    "horizon_engine",
+    "SpectralPower",
+    "power_2x2",
+    "spectral_power",
+    "ModelState",
+    "merge_states",
+    "state_from_model",
+    "fit_aggregated_parallel",
+    "fit_parallel",
+    "panel_with_states",
+    "state_from_aggregated_parallel",
+    "current_states",
+    "score_customers",
+    "SimulationResult",
+    "simulate",
+    "COHORT_SEGMENT",
+    "SegmentModel",
+    "fit_segments",
+    "segment_model",
+    "MonthlyAccumulator",
+    "fit_streaming",
+    "load_transactions",
+    "NEG_MODES",
+    "aggregate_monthly",
+    "assign_states",
+    "build_monthly_panel",
+    "group_start_mask",
+    "month_index_to_timestamp",
+    "propagate_absorbing",
+    "select_customers",
+    "shift_in_group",
+    "STATES",
+    "decode_states",
+    "encode_customers",
+    "counts_frame",
+    "matrix_frame",
+    "month_counts",
+    "segment_transition_counts",
+    "transition_counts",
+    "transition_matrix",
+    "expected_time_to_absorption",
+    "fundamental_matrix",
+    "get_Q",
+    "is_absorbing",
+    "ltv_by_state",
+    "month_state_distribution",
+    "reward_by_state",
+    "safe_matrix_power",
+    "solve_batched",
+]
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from .horizon import horizon_engine
+from .states import STATE_C, STATES
+
+TRANSIENT = (0, 1)  # A, R
+SINGULAR_TOL = 1e-12  # |det(I − Q)| abaixo disso: sem tempo até churn/LTV finitos
+TTC_MAX_MONTHS = 1200  # teto da distribuição do tempo até churn (100 anos)
+TTC_QUANTILES = (0.25, 0.5, 0.75, 0.9)
+
+
+def is_absorbing(P: np.ndarray, absorbing_state: int = STATE_C) -> bool:
+    row = np.asarray(P, dtype=float)[absorbing_state]
+    others = np.delete(row, absorbing_state)
+    return bool(np.isclose(others.sum(), 0.0) and np.isclose(row[absorbing_state], 1.0))
+
+
+def get_Q(P: np.ndarray, transient=TRANSIENT) -> np.ndarray:
+    # bloco transitório → transitório da forma canônica P = [[Q, R], [0, I]]
+    t = list(transient)
+    return np.asarray(P, dtype=float)[np.ix_(t, t)]
+
+
+def fundamental_matrix(Q: np.ndarray) -> np.ndarray:
+    I = np.eye(Q.shape[0])
+    return np.linalg.inv(I - Q)
+
+
+def expected_time_to_absorption(Q: np.ndarray):
+    N = fundamental_matrix(Q)
+    ones = np.ones((Q.shape[0], 1))
+    t = (N @ ones).flatten()
+    return t, N
+
+
+def absorption_survival(Q: np.ndarray, tol: float = 1e-9, max_steps: int = TTC_MAX_MONTHS) -> np.ndarray:
+    """P(T > n) para n = 0, 1, …, por estado transitório inicial: shape (..., T, n_max + 1).
+
+    (Qⁿ·1)ᵢ é a chance de ainda não ter churnado após n meses partindo de i.
+    Itera v ← Q·v em lote sobre os eixos iniciais (segmentos, réplicas) e para
+    quando a massa restante de todas as cadeias fica abaixo de `tol`.
+    """
+    Q = np.asarray(Q, dtype=float)
+    v = np.ones(Q.shape[:-1])
+    out = [v]
+    for _ in range(int(max_steps)):
+        if v.size == 0 or np.nanmax(v) < tol:
+            break
+        v = np.einsum("...ij,...j->...i", Q, v)
+        out.append(v)
+    return np.stack(out, axis=-1)
+
+
+def absorption_time_moments(Q: np.ndarray):
+    # média t = N·1 e variância (2N − I)·t − t² do tempo até churn, em lote; singulares viram NaN
+    Q = np.asarray(Q, dtype=float)
+    k = Q.shape[-1]
+    A = (np.eye(k) - Q).reshape(-1, k, k)
+    t = solve_batched(A, np.ones((len(A), k)))
+    Nt = solve_batched(A, np.nan_to_num(t))
+    var = 2 * Nt - t - t ** 2
+    return t.reshape(Q.shape[:-1]), var.reshape(Q.shape[:-1])
+
+
+def survival_quantiles(survival: np.ndarray, quantiles=TTC_QUANTILES) -> np.ndarray:
+    # menor n com P(T ≤ n) ≥ q, para cada q: (..., len(q)); NaN se a curva não chega lá
+    out = []
+    for q in quantiles:
+        n = (survival > 1 - q + 1e-12).sum(axis=-1).astype(float)  # sobrevivência é não crescente
+        n[(n >= survival.shape[-1]) | np.isnan(survival[..., 0])] = np.nan
+        out.append(n)
+    return np.stack(out, axis=-1)
+
+
+def time_to_churn_distribution(Q: np.ndarray, tol: float = 1e-9, max_steps: int = TTC_MAX_MONTHS,
+                               states=STATES) -> pd.DataFrame:
+    """Sobrevivência P(T > n) e massa P(T = n) por estado inicial, uma linha por mês n."""
+    S = absorption_survival(Q, tol, max_steps)
+    pmf = np.concatenate([np.zeros(S.shape[:-1] + (1,)), S[..., :-1] - S[..., 1:]], axis=-1)
+    names = [states[i] for i in TRANSIENT]
+    return pd.DataFrame(
+        {**{f"sobrevivencia_{s}": S[i] for i, s in enumerate(names)},
+         **{f"pmf_{s}": pmf[i] for i, s in enumerate(names)}},
+        index=pd.Index(np.arange(S.shape[-1]), name="n_meses"),
+    )
+
+
+def time_to_churn_summary(Q: np.ndarray, quantiles=TTC_QUANTILES, tol: float = 1e-9,
+                          max_steps: int = TTC_MAX_MONTHS, states=STATES) -> pd.DataFrame:
+    """Média, variância, desvio padrão e percentis (meses) do tempo até churn por estado inicial."""
+    mean, var = absorption_time_moments(Q)
+    pct = survival_quantiles(absorption_survival(Q, tol, max_steps), quantiles)
+    out = pd.DataFrame({"media": mean, "variancia": var, "desvio_padrao": np.sqrt(var)},
+                       index=pd.Index([states[i] for i in TRANSIENT], name="state"))
+    for j, q in enumerate(quantiles):
+        out[f"p{100 * q:g}"] = pct[:, j]
+    return out
+
+
+def ltv_by_state(Q: np.ndarray, rewards_transient: np.ndarray, discount: float) -> np.ndarray:
+    # V = (I - γQ)⁻¹ r : receita futura descontada até o churn, por estado transitório
+    I = np.eye(Q.shape[0])
+    r = np.asarray(rewards_transient, dtype=float).reshape(-1, 1)
+    return (np.linalg.inv(I - discount * Q) @ r).flatten()
+
+
+def solve_batched(A: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # resolve A[s] x = b[s] para uma pilha de sistemas (segmentos, réplicas); singulares viram NaN
+    out = np.full(b.shape, np.nan)
+    ok = np.abs(np.linalg.det(A)) > SINGULAR_TOL
+    if ok.any():
+        out[ok] = np.linalg.solve(A[ok], b[ok][..., None])[..., 0]
+    return out
+
+
+def safe_matrix_power(P: np.ndarray, n: int) -> np.ndarray:
+    return np.linalg.matrix_power(np.asarray(P, dtype=float), int(n))
+
+
+def churn_curve(P: np.ndarray, horizon: int, start: int, absorbing_state: int = STATE_C) -> np.ndarray:
+    # (Pⁿ)[start, C] para n = 1..horizon, da pilha de potências em cache
+    return horizon_engine(P).entry_curve(start, absorbing_state, horizon)
+
+
+def month_state_counts(panel: pd.DataFrame, k: int = len(STATES)) -> pd.DataFrame:
+    # linhas cliente-mês por mês × estado (colunas = códigos de estado)
+    return (
+        panel.groupby(["month_ts", "state"])
+             .size()
+             .unstack(fill_value=0)
+             .reindex(columns=range(k), fill_value=0)
+    )
+
+
+def month_state_distribution(panel: pd.DataFrame, states=STATES) -> pd.DataFrame:
+    counts = month_state_counts(panel, len(states))
+    counts.columns = pd.Index(list(states), name="state")
+    return counts.div(counts.sum(axis=1), axis=0)
+
+
+def reward_by_state(panel: pd.DataFrame, use_revenue: bool = True, remove_negative: bool = True,
+                    states=STATES) -> pd.Series:
+    """Ganho médio mensal por estado (revenue ou nº de compras); reward(C) = 0."""
+    metric = "revenue" if (use_revenue and "revenue" in panel.columns) else "total_purchases"
+    df2 = panel
+    if metric == "revenue" and remove_negative:
+        df2 = panel[panel["revenue"] >= 0]
+    rewards = df2.groupby("state")[metric].mean().reindex(range(len(states))).fillna(0.0)
+    rewards.index = pd.Index(list(states), name="state")
+    # ⚠️ bom para negócio: churn por definição não gera receita
+    # então forçamos reward(C)=0 para não confundir o usuário
+    if "C" in rewards.index:
+        rewards.loc["C"] = 0.0
+    return rewards
@@ -0,0 +1,164 @@
+"""Intervalos de confiança por bootstrap de clientes (não de linhas do painel).
+
+Cada cliente vira um vetor de contribuições: suas K×K transições e suas somas
+de reward por estado. Uma réplica sorteia n clientes com reposição, e o efeito
+do sorteio é um vetor de pesos w (quantas vezes cada cliente saiu). Então as
+somas da réplica são w @ X. Várias réplicas saem de uma vez como W @ X, com W
+de shape (réplicas × clientes). P, churn em n meses, tempo até churn e LTV são
+recalculados em lote para todas as réplicas. Os lotes de réplicas podem ser
+divididos num pool de processos. Cada lote tem a sua semente, derivada de
+`seed`, então o resultado não depende de `n_jobs`.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .analytics import TRANSIENT, solve_batched
+from .engine import MarkovChurnModel
+from .panel import group_start_mask
+from .parallel import default_jobs
+from .states import STATE_C, STATES
+from .transitions import transition_matrix
+
+K = len(STATES)
+BOOTSTRAP_BATCH_CELLS = 10_000_000  # réplicas × clientes por lote (limita a memória de W)
+
+
+def customer_contributions(model: MarkovChurnModel) -> np.ndarray:
+    """Matriz (clientes × F): K×K transições, somas de reward [todas, só >= 0] e linhas [todas, só >= 0] por estado."""
+    panel = model.panel
+    codes = panel[model.customer_col].to_numpy()
+    pos = np.cumsum(group_start_mask(codes)) - 1  # posição do cliente (painel ordenado por cliente)
+    n = int(pos[-1]) + 1 if len(pos) else 0
+    state = panel["state"].to_numpy().astype(np.int64)
+    next_state = panel["next_state"].to_numpy()
+
+    has_next = next_state >= 0
+    trans = np.bincount(pos[has_next] * K * K + state[has_next] * K + next_state[has_next],
+                        minlength=n * K * K).reshape(n, K * K)
+
+    metric = "revenue" if (model.params.use_revenue and "revenue" in panel.columns) else "total_purchases"
+    value = panel[metric].to_numpy(dtype=float)
+    nonneg = value >= 0 if metric == "revenue" else np.ones(len(value), dtype=bool)
+    key = pos * K + state
+    blocks = [
+        np.bincount(key, weights=value, minlength=n * K),
+        np.bincount(key[nonneg], weights=value[nonneg], minlength=n * K),
+        np.bincount(key, minlength=n * K),
+        np.bincount(key[nonneg], minlength=n * K),
+    ]
+    return np.hstack([trans] + [b.reshape(n, K) for b in blocks]).astype(float)
+
+
+def replicate_stats(sums: np.ndarray, horizons=(3, 6, 12), discount: float = 0.98, remove_negative: bool = True,
+                    force_absorb: bool = True) -> dict:
+    """Métricas do modelo para cada linha de `sums` (réplicas × F, no layout de `customer_contributions`)."""
+    b = len(sums)
+    Nij = sums[:, :K * K].reshape(b, K, K)
+    P = transition_matrix(Nij, force_absorb=force_absorb)
+    t = list(TRANSIENT)
+
+    churn = np.stack([np.linalg.matrix_power(P, int(h))[:, t, STATE_C] for h in horizons], axis=1)  # (b, H, 2)
+
+    reward_sum = sums[:, K * K:K * K + 2 * K].reshape(b, 2, K)
+    reward_rows = sums[:, K * K + 2 * K:].reshape(b, 2, K)
+    row = 1 if remove_negative else 0
+    rewards = np.divide(reward_sum[:, row], reward_rows[:, row],
+                        out=np.zeros((b, K)), where=reward_rows[:, row] > 0)
+
+    absorbing = np.isclose(P[:, STATE_C, STATE_C], 1.0) & np.isclose(P[:, STATE_C].sum(axis=-1), 1.0)
+    Q = P[:, t][:, :, t]
+    I = np.eye(len(t))
+    ttc = solve_batched(I - Q, np.ones((b, len(t))))
+    ltv = solve_batched(I - discount * Q, rewards[:, t])
+    ttc[~absorbing] = np.nan
+    ltv[~absorbing] = np.nan
+    return {"P": P, "churn": churn, "time_to_churn": ttc, "ltv": ltv}
+
+
+def _resample_sums(X: np.ndarray, n_boot: int, seed_seq) -> np.ndarray:
+    # n_boot réplicas: pesos por cliente via bincount dos sorteios, somas via W @ X
+    rng = np.random.default_rng(seed_seq)
+    n = len(X)
+    W = np.empty((n_boot, n))
+    for r in range(n_boot):
+        W[r] = np.bincount(rng.integers(0, n, size=n), minlength=n)
+    return W @ X
+
+
+_worker_X = None
+
+
+def _init_worker(X):
+    global _worker_X
+    _worker_X = X
+
+
+def _worker_sums(n_boot, seed_seq):
+    return _resample_sums(_worker_X, n_boot, seed_seq)
+
+
+@dataclass
+class BootstrapResult:
+    """Estimativa pontual e réplicas bootstrap de P, churn em n meses, tempo até churn e LTV."""
+
+    n_boot: int
+    seed: int
+    horizons: tuple
+    estimate: dict
+    replicates: dict
+
+    def intervals(self, level: float = 0.95) -> pd.DataFrame:
+        """Intervalos percentis: uma linha por métrica com estimativa, limite inferior e superior."""
+        alpha = (1 - level) / 2
+        rows = []
+
+        def add(name, point, reps):
+            lo, hi = np.nanquantile(reps, [alpha, 1 - alpha]) if np.isfinite(reps).any() else (np.nan, np.nan)
+            rows.append((name, float(point), float(lo), float(hi)))
+
+        for i, si in enumerate(STATES):
+            for j, sj in enumerate(STATES):
+                add(f"P({si}→{sj})", self.estimate["P"][0, i, j], self.replicates["P"][:, i, j])
+        for k, h in enumerate(self.horizons):
+            for s, name in enumerate(("A", "R")):
+                add(f"churn_{h}m_{name}", self.estimate["churn"][0, k, s], self.replicates["churn"][:, k, s])
+        for s, name in enumerate(("A", "R")):
+            add(f"tempo_ate_churn_{name}", self.estimate["time_to_churn"][0, s], self.replicates["time_to_churn"][:, s])
+        for s, name in enumerate(("A", "R")):
+            add(f"ltv_{name}", self.estimate["ltv"][0, s], self.replicates["ltv"][:, s])
+
+        out = pd.DataFrame(rows, columns=["metrica", "estimativa", "ic_inf", "ic_sup"]).set_index("metrica")
+        out.attrs["level"] = level
+        return out
+
+
+def bootstrap(model: MarkovChurnModel, n_boot: int = 1000, seed: int = 42, horizons=(3, 6, 12),
+              discount: float = 0.98, remove_negative: bool = True, n_jobs: int = 1) -> BootstrapResult:
+    """Bootstrap de clientes com `n_boot` réplicas (lotes em `n_jobs` processos; 0/None = todos os núcleos)."""
+    if n_boot < 1:
+        raise ValueError("n_boot precisa ser >= 1")
+    X = customer_contributions(model)
+    if not len(X):
+        raise ValueError("painel vazio: nada para reamostrar")
+    horizons = tuple(int(h) for h in horizons)
+    stats_args = dict(horizons=horizons, discount=discount, remove_negative=remove_negative,
+                      force_absorb=model.params.force_absorb)
+
+    batch = int(max(1, min(n_boot, BOOTSTRAP_BATCH_CELLS // len(X))))
+    sizes = [min(batch, n_boot - lo) for lo in range(0, n_boot, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    n_jobs = max(int(n_jobs or default_jobs()), 1)
+    if n_jobs == 1 or len(sizes) == 1:
+        sums = [_resample_sums(X, b, s) for b, s in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(sizes)), initializer=_init_worker,
+                                 initargs=(X,)) as pool:
+            sums = list(pool.map(_worker_sums, sizes, seeds))
+
+    replicates = replicate_stats(np.vstack(sums), **stats_args)
+    estimate = replicate_stats(X.sum(axis=0, keepdims=True), **stats_args)
+    return BootstrapResult(n_boot=n_boot, seed=seed, horizons=horizons, estimate=estimate, replicates=replicates)
@@ -0,0 +1,332 @@
+"""Execução em lote do modelo A/R/C (ex.: rodada noturna via cron).
+
+Uso (a partir da raiz do repositório):
+    python -m markov_churn transacoes.parquet --out saida/ --churn-gap 3 --horizons 3 6 12 --jobs 0
+
+Grava em --out: Nij, P, curvas de churn em n meses, tempo até churn (média,
+variância, percentis e distribuição mês a mês) e LTV (Parquet, JSON ou CSV) e
+um summary.json com parâmetros, resultados e tempos por etapa.
+Com --simulate N, N caminhos Monte Carlo da base atual (quantis de churn e receita por mês).
+Com --backtest, o backtest com origem móvel sobre todos os meses (backtest).
+Com --score, também o churn no maior horizonte e o LTV de cada cliente (customer_scores).
+
+P por segmento (país, canal ou coorte de aquisição = _cohort), com ranking dos segmentos:
+    python -m markov_churn transacoes.parquet --out saida/ --segment-col Country
+
+Atualização mensal sem reprocessar o histórico:
+    python -m markov_churn historico.parquet --out saida/ --save-state estado/
+    python -m markov_churn mes_novo.csv --out saida/ --update-state estado/
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from .bootstrap import bootstrap
+from .engine import ModelParams, fit_aggregated, stage_timer
+from .expanded import fit_expanded, log_likelihood
+from .incremental import ModelState, state_from_model
+from .io import HAS_PYARROW, iter_transaction_chunks, load_transactions
+from .panel import NEG_MODES, aggregate_monthly
+from .parallel import fit_aggregated_parallel, state_from_aggregated_parallel
+from .scoring import score_customers
+from .simulation import simulate
+from .segments import COHORT_SEGMENT, cohort_segments, customer_segments, fit_segments
+from .streaming import MonthlyAccumulator
+from .validation import rolling_backtest
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m markov_churn", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("input", help="arquivo de transações (CSV/XLSX/Parquet/Feather/Arrow)")
+    parser.add_argument("--out", default="markov_churn_output", help="diretório de saída")
+    parser.add_argument("--customer-col", default="Customer ID")
+    parser.add_argument("--date-col", default="InvoiceDate")
+    parser.add_argument("--risk-gap", type=int, default=1, help="meses sem compra para R")
+    parser.add_argument("--churn-gap", type=int, default=3, help="meses sem compra para C")
+    parser.add_argument("--metric", choices=("revenue", "purchases"), default="revenue",
+                        help="compra no mês por revenue (Price×Quantity) ou por nº de linhas")
+    parser.add_argument("--neg-mode", choices=NEG_MODES, default="keep", help="tratamento de revenue < 0")
+    parser.add_argument("--no-force-absorb", action="store_true", help="não forçar C→C = 1")
+    parser.add_argument("--sample-n", type=int, default=None, help="amostra de clientes (padrão: todos)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", type=dt.date.fromisoformat, default=None, help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--end", type=dt.date.fromisoformat, default=None, help="data final (AAAA-MM-DD)")
+    parser.add_argument("--horizons", type=int, nargs="+", default=[3, 6, 12], help="horizontes n (meses)")
+    parser.add_argument("--discount", type=float, default=0.98, help="γ do LTV")
+    parser.add_argument("--format", choices=("parquet", "json", "csv"), default="parquet", help="formato das tabelas")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="processos para painel/estados/contagens, por shards de clientes (0 = todos os núcleos)")
+    parser.add_argument("--chunk-rows", type=int, default=None,
+                        help="lê o input em blocos de N linhas (arquivos maiores que a memória)")
+    parser.add_argument("--segment-col", default=None,
+                        help=f"coluna de segmento (país, canal...) ou {COHORT_SEGMENT} para a coorte de aquisição; "
+                             "grava P por segmento e o ranking dos segmentos")
+    parser.add_argument("--expanded-tiers", type=int, default=None, metavar="N",
+                        help="também ajusta o espaço expandido (A em N faixas de gasto, R1..R(c−1) por meses sem "
+                             "compra) e grava P_expanded e expanded_states")
+    parser.add_argument("--bootstrap", type=int, default=None, metavar="B",
+                        help="intervalos de confiança por bootstrap de clientes com B réplicas (semente: --seed; "
+                             "processos: --jobs)")
+    parser.add_argument("--simulate", type=int, default=None, metavar="PATHS",
+                        help="simula PATHS caminhos da base atual no maior horizonte e grava simulation (quantis de "
+                             "churn e receita por mês) e simulation_totals (semente: --seed; processos: --jobs)")
+    parser.add_argument("--backtest", action="store_true",
+                        help="grava backtest: para cada mês de origem, P treinada até ele prevê as shares A/R/C "
+                             "em cada horizonte de --horizons (janela expansiva)")
+    parser.add_argument("--score", action="store_true",
+                        help="grava customer_scores: churn no maior horizonte e LTV por cliente, pelo estado atual "
+                             "(com --segment-col, pela P do segmento)")
+    state_group = parser.add_mutually_exclusive_group()
+    state_group.add_argument("--save-state", metavar="DIR", help="grava o estado incremental após o ajuste completo")
+    state_group.add_argument("--update-state", metavar="DIR",
+                             help="carrega o estado, incorpora só os meses novos do input e grava de volta "
+                                  "(regras e métrica vêm do estado salvo)")
+    args = parser.parse_args(argv)
+
+    if args.churn_gap <= args.risk_gap:
+        parser.error("--churn-gap precisa ser maior que --risk-gap")
+    if any(n < 1 for n in args.horizons):
+        parser.error("--horizons precisa ter valores >= 1")
+    if args.jobs < 0:
+        parser.error("--jobs precisa ser >= 0")
+    if args.chunk_rows is not None and args.chunk_rows < 1:
+        parser.error("--chunk-rows precisa ser >= 1")
+    if (args.start is None) != (args.end is None):
+        parser.error("use --start e --end juntos")
+    if args.expanded_tiers is not None and args.expanded_tiers < 1:
+        parser.error("--expanded-tiers precisa ser >= 1")
+    if args.bootstrap is not None and args.bootstrap < 1:
+        parser.error("--bootstrap precisa ser >= 1")
+    if args.simulate is not None and args.simulate < 1:
+        parser.error("--simulate precisa ser >= 1")
+    for flag, value in (("--segment-col", args.segment_col), ("--expanded-tiers", args.expanded_tiers),
+                        ("--bootstrap", args.bootstrap)):
+        if value is not None and args.update_state:
+            parser.error(f"{flag} não está disponível com --update-state (o estado não guarda o painel)")
+    if args.segment_col not in (None, COHORT_SEGMENT) and args.chunk_rows:
+        parser.error("--segment-col com coluna do arquivo requer leitura completa (sem --chunk-rows); "
+                     f"use {COHORT_SEGMENT} ou remova --chunk-rows")
+    if (args.format == "parquet" or args.save_state or args.update_state) and not HAS_PYARROW:
+        parser.error("saída em Parquet e estado incremental requerem pyarrow (ou use --format json/csv)")
+    return args
+
+
+def write_table(df: pd.DataFrame, out_dir: str, name: str, fmt: str) -> str:
+    path = os.path.join(out_dir, f"{name}.{fmt}")
+    if fmt == "parquet":
+        df.to_parquet(path)
+    elif fmt == "csv":
+        df.to_csv(path)
+    else:
+        df.to_json(path, orient="table", indent=2)
+    return path
+
+
+def aggregate_input(args: argparse.Namespace, customer_col: str, params: ModelParams, date_range, timings: dict):
+    """Agregação cliente-mês do input: em blocos (--chunk-rows) ou lendo o arquivo inteiro.
+
+    Retorna (agg, rótulos dos clientes, segmentos); segmentos = (segmento por
+    cliente, rótulos) quando --segment-col é uma coluna do arquivo, senão None.
+    """
+    if args.chunk_rows:
+        with stage_timer(timings, "stream_aggregate"):
+            acc = MonthlyAccumulator(customer_col, args.date_col, use_revenue=params.use_revenue,
+                                     neg_mode=params.neg_mode)
+            for chunk in iter_transaction_chunks(args.input, customer_col, args.date_col, args.chunk_rows,
+                                                 date_range=date_range):
+                acc.add(chunk)
+            return (*acc.result(), None)
+    segment_cols = [args.segment_col] if args.segment_col not in (None, COHORT_SEGMENT) else []
+    with stage_timer(timings, "load"):
+        transactions = load_transactions(args.input, customer_col, args.date_col, date_range=date_range,
+                                         segment_cols=segment_cols)
+    with stage_timer(timings, "aggregate"):
+        agg, labels = aggregate_monthly(transactions, customer_col, args.date_col, use_revenue=params.use_revenue,
+                                        neg_mode=params.neg_mode)
+    segments = None
+    if segment_cols:
+        with stage_timer(timings, "segments"):
+            segments = customer_segments(transactions, customer_col, args.segment_col, labels)
+    return agg, labels, segments
+
+
+def run(args: argparse.Namespace) -> dict:
+    timings = {}
+    params = ModelParams(
+        risk_gap_months=args.risk_gap,
+        churn_gap_months=args.churn_gap,
+        use_revenue=args.metric == "revenue",
+        neg_mode=args.neg_mode,
+        force_absorb=not args.no_force_absorb,
+        sample_n=args.sample_n,
+        seed=args.seed,
+    )
+    date_range = (args.start, args.end) if args.start is not None else None
+    if args.update_state:
+        with stage_timer(timings, "load_state"):
+            model = ModelState.load(args.update_state)
+        agg, labels, _ = aggregate_input(args, model.customer_col, model.params, date_range, timings)
+        with stage_timer(timings, "update"):
+            model.update_aggregated(agg, labels)
+        with stage_timer(timings, "save_state"):
+            model.save(args.update_state)
+        params = model.params
+    else:
+        agg, labels, segments = aggregate_input(args, args.customer_col, params, date_range, timings)
+        if args.jobs != 1 and (args.segment_col or args.expanded_tiers or args.bootstrap):
+            # segmentos, estados expandidos e bootstrap precisam do painel: shards devolvem o painel em vez do resumo
+            model = fit_aggregated_parallel(agg, labels, args.customer_col, params, args.jobs or None, timings)
+        elif args.jobs != 1:
+            # lote: shards devolvem só o resumo (ModelState), sem trafegar o painel
+            model = state_from_aggregated_parallel(agg, labels, args.customer_col, params, args.jobs or None, timings)
+        else:
+            model = fit_aggregated(agg, labels, args.customer_col, params, timings=timings)
+        if args.save_state:
+            with stage_timer(timings, "save_state"):
+                state = model if isinstance(model, ModelState) else state_from_model(
+                    model, customer_codes=agg[args.customer_col].unique())
+                state.save(args.save_state)
+
+    horizons = sorted(set(args.horizons))
+    with stage_timer(timings, "analytics"):
+        n = np.arange(1, horizons[-1] + 1)
+        curves = pd.DataFrame(
+            {s: model.churn_curve(horizons[-1], s) for s in ("A", "R")},
+            index=pd.Index(n, name="n_meses"),
+        )
+        ttc = model.time_to_churn()
+        ltv = model.ltv(discount=args.discount)
+
+    segment_model = None
+    if args.segment_col:
+        with stage_timer(timings, "segments"):
+            if args.segment_col == COHORT_SEGMENT:
+                segments = cohort_segments(model.panel, model.customer_col, len(model.customer_labels))
+            segment_model = fit_segments(model, *segments, args.segment_col)
+            leaderboard = segment_model.leaderboard(horizons[-1], discount=args.discount)
+
+    expanded = None
+    if args.expanded_tiers:
+        with stage_timer(timings, "expanded"):
+            expanded = fit_expanded(model, args.expanded_tiers)
+            expanded_states = expanded.summary(horizons[-1], discount=args.discount)
+
+    intervals = None
+    if args.bootstrap:
+        with stage_timer(timings, "bootstrap"):
+            boot = bootstrap(model, args.bootstrap, seed=args.seed, horizons=horizons, discount=args.discount,
+                             n_jobs=args.jobs)
+            intervals = boot.intervals()
+
+    simulation = None
+    if args.simulate:
+        with stage_timer(timings, "simulate"):
+            simulation = simulate(model, args.simulate, horizons[-1], seed=args.seed, n_jobs=args.jobs)
+
+    backtest = None
+    if args.backtest:
+        with stage_timer(timings, "backtest"):
+            # contagens por mês já guardadas no modelo (ou no estado incremental)
+            backtest = rolling_backtest(model.month_transitions, model.month_states, horizons=horizons,
+                                        force_absorb=params.force_absorb, months=model.months)
+
+    if args.score:
+        with stage_timer(timings, "score"):
+            scores = score_customers(model, horizons[-1], discount=args.discount, segments=segment_model)
+
+    with stage_timer(timings, "write"):
+        os.makedirs(args.out, exist_ok=True)
+        outputs = [
+            write_table(model.Nij_frame, args.out, "Nij", args.format),
+            write_table(model.P_frame, args.out, "P", args.format),
+            write_table(curves, args.out, "churn_curve", args.format),
+        ]
+        if ttc is not None:
+            # média (matriz fundamental), variância e percentis; distribuição completa em tabela própria
+            ttc_df = model.time_to_churn_summary().rename(columns={"media": "tempo_medio_ate_churn"})
+            outputs.append(write_table(ttc_df, args.out, "time_to_churn", args.format))
+            outputs.append(write_table(model.time_to_churn_distribution(), args.out, "time_to_churn_distribution",
+                                       args.format))
+        if ltv is not None:
+            ltv_df = pd.DataFrame({"ltv": ltv}, index=pd.Index(["A", "R"], name="state"))
+            outputs.append(write_table(ltv_df, args.out, "ltv", args.format))
+        if segment_model is not None:
+            outputs.append(write_table(segment_model.P_long(), args.out, "P_segments", args.format))
+            outputs.append(write_table(leaderboard, args.out, "segments", args.format))
+        if expanded is not None:
+            outputs.append(write_table(expanded.P_long(), args.out, "P_expanded", args.format))
+            outputs.append(write_table(expanded_states, args.out, "expanded_states", args.format))
+        if intervals is not None:
+            outputs.append(write_table(intervals, args.out, "bootstrap_intervals", args.format))
+        if simulation is not None:
+            outputs.append(write_table(simulation.monthly(), args.out, "simulation", args.format))
+            outputs.append(write_table(simulation.totals(), args.out, "simulation_totals", args.format))
+        if backtest is not None:
+            outputs.append(write_table(backtest, args.out, "backtest", args.format))
+        if args.score:
+            # uma linha por cliente, indexada pelo ID
+            outputs.append(write_table(scores.set_index(scores.columns[0]), args.out, "customer_scores", args.format))
+
+    summary = {
+        "input": os.path.abspath(args.input),
+        "params": vars(params),
+        "date_range": [str(d) for d in date_range] if date_range else None,
+        "n_customers_total": int(model.n_customers_total),
+        "n_customers_used": int(model.n_customers),
+        "panel_rows": int(model.panel_rows),
+        "P": model.P_frame.to_dict(orient="index"),
+        "churn_at_n": {s: {str(h): float(curves.loc[h, s]) for h in horizons} for s in ("A", "R")},
+        "time_to_churn": dict(zip(("A", "R"), map(float, ttc[0]))) if ttc is not None else None,
+        "ltv": dict(zip(("A", "R"), map(float, ltv))) if ltv is not None else None,
+        "segments": {"column": args.segment_col, "n_segments": segment_model.n_segments} if segment_model else None,
+        "expanded": {
+            "n_states": expanded.n_states,
+            "nnz": expanded.nnz,
+            # log-verossimilhança do próximo A/R/C: estados expandidos vs A/R/C
+            "log_likelihood_next_ARC": expanded.coarse_log_likelihood(),
+            "log_likelihood_ARC_model": log_likelihood(model.Nij),
+        } if expanded is not None else None,
+        "bootstrap": {
+            "n_boot": args.bootstrap,
+            "seed": args.seed,
+            "ci95": {m: [float(r.ic_inf), float(r.ic_sup)] for m, r in intervals.iterrows()},
+        } if intervals is not None else None,
+        "simulation": {
+            "n_paths": args.simulate,
+            "seed": args.seed,
+            "totals": simulation.totals().to_dict(orient="index"),
+        } if simulation is not None else None,
+        "backtest_mae": {str(h): float(v) for h, v in backtest.groupby("horizonte")["mae"].mean().items()}
+        if backtest is not None else None,
+        "outputs": outputs,
+        "timings_s": {k: round(v, 4) for k, v in timings.items()},
+    }
+    with open(os.path.join(args.out, "summary.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2, ensure_ascii=False)
+    return summary
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    t0 = time.perf_counter()
+    try:
+        summary = run(args)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"erro: {e}", file=sys.stderr)
+        return 1
+
+    print(f"clientes: {summary['n_customers_used']:,} de {summary['n_customers_total']:,} | "
+          f"painel: {summary['panel_rows']:,} linhas cliente-mês")
+    for name, secs in summary["timings_s"].items():
+        print(f"  {name:<16} {secs:>9.3f} s")
+    print(f"  {'total':<16} {time.perf_counter() - t0:>9.3f} s")
+    print(f"saídas em {os.path.abspath(args.out)}")
+    return 0
@@ -0,0 +1,215 @@
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .analytics import (
+    TRANSIENT, TTC_MAX_MONTHS, TTC_QUANTILES, churn_curve, expected_time_to_absorption, get_Q, is_absorbing,
+    ltv_by_state, reward_by_state, time_to_churn_distribution, time_to_churn_summary,
+)
+from .horizon import STACK_MAX_HORIZON, HorizonEngine, horizon_engine
+from .io import load_transactions
+from .panel import aggregate_monthly, assign_states, build_monthly_panel, month_index_to_timestamp, select_customers
+from .spectral import SpectralPower, spectral_power
+from .states import STATE_C, STATES
+from .transitions import counts_frame, matrix_frame, month_counts, transition_matrix
+
+
+@contextmanager
+def stage_timer(timings: Optional[dict], name: str):
+    # acumula em timings[name] o tempo (s) da etapa; sem dict, não mede nada
+    if timings is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - t0
+
+
+@dataclass(frozen=True)
+class ModelParams:
+    risk_gap_months: int = 1
+    churn_gap_months: int = 3
+    use_revenue: bool = True
+    neg_mode: str = "keep"  # "keep" | "clip" | "drop" (revenue < 0)
+    force_absorb: bool = True
+    sample_n: Optional[int] = None  # None = todos os clientes
+    seed: int = 42
+
+
+@dataclass
+class MarkovChurnModel:
+    """Modelo ajustado: contagens Nᵢⱼ, matriz P e o painel cliente × mês que as gerou.
+
+    Guarda também as contagens por mês (mesmo layout de `ModelState`), lidas
+    pelas validações e gráficos em vez de reagrupar o painel.
+    """
+
+    params: ModelParams
+    customer_col: str
+    Nij: np.ndarray
+    P: np.ndarray
+    panel: pd.DataFrame
+    customer_labels: pd.Index
+    states: tuple = STATES
+    n_customers_total: int = 0
+    months: np.ndarray = None  # _month_index de cada mês do painel (eixo 0 dos tensores abaixo)
+    month_transitions: np.ndarray = None  # (meses, K, K): transições do mês m para m+1
+    month_states: np.ndarray = None  # (meses, K): linhas cliente-mês por estado
+
+    @property
+    def Nij_frame(self) -> pd.DataFrame:
+        return counts_frame(self.Nij, self.states)
+
+    @property
+    def P_frame(self) -> pd.DataFrame:
+        return matrix_frame(self.P, self.states)
+
+    @property
+    def is_absorbing(self) -> bool:
+        return is_absorbing(self.P, STATE_C)
+
+    @property
+    def n_customers(self) -> int:
+        return int(self.panel[self.customer_col].nunique())
+
+    @property
+    def panel_rows(self) -> int:
+        return len(self.panel)
+
+    def state_index(self, state: str) -> int:
+        return self.states.index(state)
+
+    @property
+    def horizons(self) -> HorizonEngine:
+        # pilha P⁰..Pᴴ compartilhada por preview, curva de churn e projeção
+        return horizon_engine(self.P)
+
+    @property
+    def spectral(self) -> SpectralPower:
+        # Pⁿ em forma fechada, para horizontes longos ou fracionários
+        return spectral_power(self.P)
+
+    def churn_probability(self, n: float, start_state: str = "A") -> float:
+        # (Pⁿ)[start, C]: chance de estar em churn daqui a n meses
+        i = self.state_index(start_state)
+        if float(n).is_integer() and 0 <= n <= STACK_MAX_HORIZON:
+            return float(self.horizons.power(int(n))[i, STATE_C])
+        return self.spectral.entry(i, STATE_C, n)
+
+    def churn_curve(self, horizon: int, start_state: str = "A") -> np.ndarray:
+        return churn_curve(self.P, horizon, self.state_index(start_state))
+
+    def month_distribution(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            self.month_states / np.maximum(self.month_states.sum(axis=1, keepdims=True), 1),
+            index=pd.Index(month_index_to_timestamp(self.months), name="month_ts"),
+            columns=pd.Index(list(self.states), name="state"),
+        )
+
+    def last_month_distribution(self) -> np.ndarray:
+        counts = self.month_states[-1]
+        return counts / counts.sum()
+
+    def projection(self, horizon: int) -> pd.DataFrame:
+        # π₀ Pⁿ para n = 0..horizon, partindo da distribuição do último mês
+        pis = self.horizons.trajectory(self.last_month_distribution(), horizon)
+        pi_df = pd.DataFrame(pis, columns=list(self.states))
+        pi_df.index.name = "n_meses"
+        return pi_df
+
+    def time_to_churn(self):
+        """(tempo médio até churn por estado transitório, matriz fundamental N); None se C não é absorvente."""
+        if not self.is_absorbing:
+            return None
+        return expected_time_to_absorption(get_Q(self.P, TRANSIENT))
+
+    def time_to_churn_distribution(self, tol: float = 1e-9, max_months: int = TTC_MAX_MONTHS):
+        """P(T > n) e P(T = n) do tempo até churn por estado inicial (A, R); None se C não é absorvente."""
+        if not self.is_absorbing:
+            return None
+        return time_to_churn_distribution(get_Q(self.P, TRANSIENT), tol, max_months)
+
+    def time_to_churn_summary(self, quantiles=TTC_QUANTILES, tol: float = 1e-9, max_months: int = TTC_MAX_MONTHS):
+        """Média, variância e percentis do tempo até churn por estado inicial; None se C não é absorvente."""
+        if not self.is_absorbing:
+            return None
+        return time_to_churn_summary(get_Q(self.P, TRANSIENT), quantiles, tol, max_months)
+
+    def rewards(self, remove_negative: bool = True) -> pd.Series:
+        return reward_by_state(self.panel, use_revenue=self.params.use_revenue,
+                               remove_negative=remove_negative, states=self.states)
+
+    def ltv(self, discount: float = 0.98, remove_negative: bool = True):
+        """LTV descontado por estado transitório (A, R); None se C não é absorvente."""
+        if not self.is_absorbing:
+            return None
+        rewards = self.rewards(remove_negative).to_numpy(dtype=float)
+        return ltv_by_state(get_Q(self.P, TRANSIENT), rewards[list(TRANSIENT)], discount)
+
+
+def model_from_panel(panel: pd.DataFrame, customer_col: str, customer_labels: pd.Index, params: ModelParams,
+                     counts: np.ndarray = None, n_customers_total: int = 0) -> MarkovChurnModel:
+    # contagens por mês, Nᵢⱼ (soma dos meses, se ainda não contado) e P a partir do painel com estados
+    months, month_transitions, month_states = month_counts(
+        panel["_month_index"].to_numpy(), panel["state"].to_numpy(), panel["next_state"].to_numpy(), len(STATES),
+    )
+    if counts is None:
+        counts = month_transitions.sum(axis=0)
+    P = transition_matrix(counts, force_absorb=params.force_absorb)
+    return MarkovChurnModel(
+        params=params,
+        customer_col=customer_col,
+        Nij=counts,
+        P=P,
+        panel=panel,
+        customer_labels=customer_labels,
+        n_customers_total=n_customers_total,
+        months=months,
+        month_transitions=month_transitions,
+        month_states=month_states,
+    )
+
+
+def fit(transactions: pd.DataFrame, customer_col: str, date_col: str,
+        params: ModelParams = ModelParams(), timings: Optional[dict] = None) -> MarkovChurnModel:
+    """Ajusta o modelo A/R/C a partir de transações (uma linha por compra).
+
+    Mesmas etapas da aba ⚙️ Modelo: agregação mensal → painel esparso →
+    estados A/R/C → Nᵢⱼ → P. Com `timings`, grava o tempo (s) de cada etapa.
+    """
+    with stage_timer(timings, "aggregate"):
+        agg, customer_labels = aggregate_monthly(
+            transactions, customer_col, date_col, use_revenue=params.use_revenue, neg_mode=params.neg_mode,
+        )
+    return fit_aggregated(agg, customer_labels, customer_col, params, timings=timings)
+
+
+def fit_aggregated(agg: pd.DataFrame, customer_labels: pd.Index, customer_col: str,
+                   params: ModelParams = ModelParams(), timings: Optional[dict] = None) -> MarkovChurnModel:
+    # etapas a partir da agregação cliente-mês (formato de `aggregate_monthly`)
+    with stage_timer(timings, "panel"):
+        customers = select_customers(agg, customer_col, params.sample_n, params.seed)
+        panel = build_monthly_panel(
+            agg, customer_col, customers, end_month=int(agg["_month_index"].max()), use_revenue=params.use_revenue,
+        )
+    with stage_timer(timings, "states"):
+        panel = assign_states(panel, customer_col, params.risk_gap_months, params.churn_gap_months)
+    with stage_timer(timings, "transitions"):
+        model = model_from_panel(
+            panel, customer_col, customer_labels, params, n_customers_total=agg[customer_col].nunique(),
+        )
+    return model
+
+
+def fit_file(path: str, customer_col: str, date_col: str, params: ModelParams = ModelParams(),
+             date_range=None, timings: Optional[dict] = None) -> MarkovChurnModel:
+    # lê só as colunas do modelo (CSV/XLSX/Parquet/Feather/Arrow) e ajusta
+    with stage_timer(timings, "load"):
+        transactions = load_transactions(path, customer_col, date_col, date_range=date_range)
+    return fit(transactions, customer_col, date_col, params, timings=timings)
@@ -0,0 +1,305 @@
+"""Espaço de estados expandido (semi-Markov): A por faixa de gasto, R por meses sem compra, C.
+
+A regra A/R/C junta numa só classe clientes com 1 e com (gap − 1) meses sem
+compra; o teste de memória (8.2) mostra que essa história importa. Aqui cada
+linha do painel ganha um estado mais fino, estimado do mesmo painel:
+
+- A1..Aq: mês com compra, pela faixa (quantis) da métrica no mês;
+- R1..R(c−1): sem compra há 1..c−1 meses (c = gap de churn);
+- C: churn, absorvente.
+
+As transições entre estados expandidos são quase todas impossíveis (R1 só vai
+para A* ou R2, ...), então Nᵢⱼ e P ficam esparsas (scipy.sparse, quando
+instalado; senão arrays densos): ajuste, πPⁿ e tempo até churn / LTV custam
+pelo nº de transições possíveis, não por K².
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .engine import MarkovChurnModel, ModelParams
+from .panel import group_start_mask, shift_in_group
+from .states import NO_STATE, STATE_A, STATE_C, STATE_R, STATES
+
+try:
+    import scipy.sparse as sp
+    import scipy.sparse.linalg as spla
+except ImportError:  # sem scipy: mesmas contas com arrays densos (ok para dezenas de estados)
+    sp = None
+
+HAS_SCIPY = sp is not None
+
+EXPANDED_DTYPE = np.int16
+
+
+def expanded_labels(spend_tiers: int, churn_gap_months: int) -> tuple:
+    # A1..Aq, R1..R(c−1), C  (com uma faixa só, A fica "A")
+    a = ["A"] if spend_tiers == 1 else [f"A{t}" for t in range(1, spend_tiers + 1)]
+    return tuple(a + [f"R{g}" for g in range(1, churn_gap_months)] + ["C"])
+
+
+def spend_thresholds(panel: pd.DataFrame, metric: str, spend_tiers: int) -> np.ndarray:
+    """Cortes entre faixas de gasto: quantis da métrica nas linhas em A."""
+    values = panel.loc[panel["state"].to_numpy() == STATE_A, metric].to_numpy(dtype=float)
+    if spend_tiers <= 1 or not len(values):
+        return np.empty(0)
+    # cortes repetidos (muitos valores iguais) viram uma faixa só
+    return np.unique(np.quantile(values, np.arange(1, spend_tiers) / spend_tiers))
+
+
+def expanded_states(panel: pd.DataFrame, metric: str, thresholds: np.ndarray, churn_gap_months: int) -> np.ndarray:
+    """Código do estado expandido de cada linha do painel (já com `state` e `_months_since_purchase`)."""
+    state = panel["state"].to_numpy()
+    n_tiers = len(thresholds) + 1
+    out = np.full(len(panel), n_tiers + churn_gap_months - 1, dtype=EXPANDED_DTYPE)  # C
+
+    is_a = state == STATE_A
+    out[is_a] = np.searchsorted(thresholds, panel[metric].to_numpy(dtype=float)[is_a], side="right")
+
+    is_r = state == STATE_R
+    gap = panel["_months_since_purchase"].to_numpy()[is_r].astype(np.int64)
+    out[is_r] = n_tiers + np.clip(gap, 1, churn_gap_months - 1) - 1
+    return out
+
+
+def _matrix(rows, cols, values, k: int):
+    # matriz K×K a partir de triplas (i, j, valor) sem repetição: CSR ou densa
+    if HAS_SCIPY:
+        return sp.csr_matrix((values, (rows, cols)), shape=(k, k))
+    M = np.zeros((k, k))
+    M[rows, cols] = values
+    return M
+
+
+def log_likelihood(counts) -> float:
+    """Σ Nᵢⱼ log p̂ᵢⱼ da P estimada por frequência (denso ou esparso)."""
+    if HAS_SCIPY and sp.issparse(counts):
+        counts = counts.tocoo()
+        rows, n = counts.row, counts.data.astype(float)
+    else:
+        counts = np.asarray(counts, dtype=float)
+        rows, _ = np.nonzero(counts)
+        n = counts[counts > 0]
+    row_sums = np.bincount(rows, weights=n, minlength=counts.shape[0])
+    return float(np.sum(n * np.log(n / row_sums[rows])))
+
+
+def n_free_params(counts) -> int:
+    # parâmetros livres: por linha com dados, nº de transições observadas − 1
+    if HAS_SCIPY and sp.issparse(counts):
+        nnz_per_row = np.diff(counts.tocsr().indptr)
+    else:
+        nnz_per_row = (np.asarray(counts) > 0).sum(axis=1)
+    return int(np.maximum(nnz_per_row - 1, 0).sum())
+
+
+def estimate_P(counts, force_absorb: bool = True):
+    """P̂ por frequência: p̂ᵢⱼ = Nᵢⱼ / Σₖ Nᵢₖ só sobre as entradas não nulas (denso ou esparso).
+
+    Com `force_absorb`, a linha de C (o último estado) vira C→C = 1.
+    """
+    k = counts.shape[0]
+    if HAS_SCIPY and sp.issparse(counts):
+        coo = counts.tocoo()
+        rows, cols, n = coo.row, coo.col, coo.data.astype(float)
+    else:
+        rows, cols = np.nonzero(counts)
+        n = counts[rows, cols].astype(float)
+    row_sums = np.bincount(rows, weights=n, minlength=k)
+    values = n / row_sums[rows]
+    if force_absorb:
+        c = k - 1
+        keep = rows != c
+        rows, cols, values = np.r_[rows[keep], c], np.r_[cols[keep], c], np.r_[values[keep], 1.0]
+    return _matrix(rows, cols, values, k)
+
+
+@dataclass
+class ExpandedModel:
+    """Nᵢⱼ esparsa sobre o espaço expandido, mais ocupação e somas de reward por estado."""
+
+    params: ModelParams
+    labels: tuple
+    coarse: np.ndarray  # (K,) estado A/R/C de cada estado expandido
+    thresholds: np.ndarray  # cortes entre faixas de gasto de A
+    counts: object  # K×K (CSR com scipy, senão ndarray)
+    P: object  # K×K, estimada uma vez em `fit_expanded` (mesmo formato de `counts`)
+    occupancy: np.ndarray  # (K,) linhas cliente-mês por estado
+    last_counts: np.ndarray  # (K,) clientes por estado no último mês
+    reward_sum: np.ndarray  # (2, K): soma da métrica por estado [todas, só >= 0]
+    reward_rows: np.ndarray  # (2, K)
+
+    @property
+    def n_states(self) -> int:
+        return len(self.labels)
+
+    @property
+    def absorbing_state(self) -> int:
+        return self.n_states - 1
+
+    @property
+    def nnz(self) -> int:
+        return int(self.counts.nnz) if HAS_SCIPY and sp.issparse(self.counts) else int(np.count_nonzero(self.counts))
+
+    def P_frame(self) -> pd.DataFrame:
+        P = self.P
+        dense = P.toarray() if HAS_SCIPY else P
+        return pd.DataFrame(dense, index=pd.Index(self.labels, name="state"),
+                            columns=pd.Index(self.labels, name="next_state"))
+
+    def P_long(self) -> pd.DataFrame:
+        # só as entradas não nulas de P: (estado, próximo estado, probabilidade)
+        P = self.P
+        if HAS_SCIPY:
+            coo = P.tocoo()
+            rows, cols, values = coo.row, coo.col, coo.data
+        else:
+            rows, cols = np.nonzero(P)
+            values = P[rows, cols]
+        labels = np.array(self.labels, dtype=object)
+        return pd.DataFrame({"state": labels[rows], "next_state": labels[cols], "p": values}).set_index(
+            ["state", "next_state"])
+
+    def log_likelihood(self) -> float:
+        return log_likelihood(self.counts)
+
+    def coarse_counts(self) -> np.ndarray:
+        # K×3: transições do estado expandido para o próximo estado A/R/C
+        onehot = np.eye(len(STATES))[self.coarse]
+        return np.asarray(self.counts @ onehot)
+
+    def coarse_log_likelihood(self) -> float:
+        """Log-verossimilhança do próximo A/R/C dado o estado expandido (comparável à do modelo A/R/C)."""
+        return log_likelihood(self.coarse_counts())
+
+    def n_free_params(self) -> int:
+        return n_free_params(self.counts)
+
+    def initial_distribution(self, start_state: str) -> np.ndarray:
+        """π₀ sobre os estados expandidos: o próprio estado, ou um estado A/R/C pesado pela ocupação."""
+        pi0 = np.zeros(self.n_states)
+        if start_state in self.labels:
+            pi0[self.labels.index(start_state)] = 1.0
+            return pi0
+        members = self.coarse == STATES.index(start_state)
+        weights = self.occupancy * members
+        if weights.sum() == 0:
+            weights = members.astype(float)
+        return weights / weights.sum()
+
+    def trajectory(self, pi0, horizon: int) -> np.ndarray:
+        # πₙ = πₙ₋₁ P para n = 0..horizon (produto vetor × matriz esparsa), shape (horizon+1, K)
+        P = self.P
+        out = np.empty((int(horizon) + 1, self.n_states))
+        out[0] = pi0
+        for n in range(1, int(horizon) + 1):
+            out[n] = out[n - 1] @ P
+        return out
+
+    def churn_curve(self, horizon: int, start_state: str = "A") -> np.ndarray:
+        """P(C em n meses) para n = 1..horizon; `start_state` expandido (ex.: "R2") ou A/R/C."""
+        return self.trajectory(self.initial_distribution(start_state), horizon)[1:, self.absorbing_state]
+
+    def churn_by_state(self, horizon: int) -> np.ndarray:
+        # (Pⁿ)[:, C] para todos os estados de uma vez: uₙ = P uₙ₋₁, com u₀ = indicadora de C
+        P = self.P
+        u = np.zeros(self.n_states)
+        u[self.absorbing_state] = 1.0
+        for _ in range(int(horizon)):
+            u = P @ u
+        return u
+
+    def projection(self, horizon: int) -> pd.DataFrame:
+        # π₀ do último mês propagado e somado de volta em A/R/C
+        pis = self.trajectory(self.last_counts / max(self.last_counts.sum(), 1), horizon)
+        coarse = np.stack([pis[:, self.coarse == s].sum(axis=1) for s in range(len(STATES))], axis=1)
+        pi_df = pd.DataFrame(coarse, columns=list(STATES))
+        pi_df.index.name = "n_meses"
+        return pi_df
+
+    def _solve_transient(self, discount: float, rhs: np.ndarray) -> Optional[np.ndarray]:
+        # (I − γQ) x = rhs, com Q = P sem a linha/coluna de C (C é o último estado)
+        P = self.P
+        c = self.absorbing_state
+        if HAS_SCIPY:
+            row_c = P.getrow(c)
+            if not (row_c.nnz == 1 and np.isclose(row_c[0, c], 1.0)):
+                return None
+            A = sp.identity(c, format="csc") - discount * P[:c, :c].tocsc()
+            return spla.spsolve(A, rhs)
+        if not (np.isclose(P[c, c], 1.0) and np.isclose(P[c].sum(), 1.0)):
+            return None
+        return np.linalg.solve(np.eye(c) - discount * P[:c, :c], rhs)
+
+    def time_to_churn(self) -> Optional[pd.Series]:
+        """Tempo médio até churn por estado transitório expandido; None se C não é absorvente."""
+        t = self._solve_transient(1.0, np.ones(self.absorbing_state))
+        return None if t is None else pd.Series(t, index=pd.Index(self.labels[:-1], name="state"))
+
+    def rewards(self, remove_negative: bool = True) -> np.ndarray:
+        row = 1 if remove_negative else 0
+        rewards = np.divide(self.reward_sum[row], self.reward_rows[row],
+                            out=np.zeros(self.n_states), where=self.reward_rows[row] > 0)
+        rewards[self.absorbing_state] = 0.0
+        return rewards
+
+    def ltv(self, discount: float = 0.98, remove_negative: bool = True) -> Optional[pd.Series]:
+        """LTV descontado por estado transitório expandido; None se C não é absorvente."""
+        r = self.rewards(remove_negative)[:-1]
+        V = self._solve_transient(discount, r)
+        return None if V is None else pd.Series(V, index=pd.Index(self.labels[:-1], name="state"))
+
+    def summary(self, horizon: int = 12, discount: float = 0.98, remove_negative: bool = True) -> pd.DataFrame:
+        """Uma linha por estado expandido: ocupação, churn em 1 e `horizon` meses, tempo até churn e LTV."""
+        ttc = self.time_to_churn()
+        ltv = self.ltv(discount, remove_negative)
+        return pd.DataFrame({
+            "estado_base": [STATES[c] for c in self.coarse],
+            "linhas_painel": self.occupancy,
+            "P(→C em 1 mês)": self.churn_by_state(1),
+            f"churn_{horizon}m": self.churn_by_state(horizon),
+            "tempo_ate_churn": ttc.reindex(self.labels, fill_value=0.0).to_numpy() if ttc is not None else np.nan,
+            "ltv": ltv.reindex(self.labels, fill_value=0.0).to_numpy() if ltv is not None else np.nan,
+        }, index=pd.Index(self.labels, name="state"))
+
+
+def fit_expanded(model: MarkovChurnModel, spend_tiers: int = 3) -> ExpandedModel:
+    """Estima o modelo expandido a partir do painel do modelo A/R/C (mesmas regras de estado)."""
+    if spend_tiers < 1:
+        raise ValueError("spend_tiers precisa ser >= 1")
+    panel = model.panel
+    params = model.params
+    churn_gap = params.churn_gap_months
+    metric = "revenue" if (params.use_revenue and "revenue" in panel.columns) else "total_purchases"
+
+    thresholds = spend_thresholds(panel, metric, spend_tiers)
+    labels = expanded_labels(len(thresholds) + 1, churn_gap)
+    k = len(labels)
+    coarse = np.array([STATE_A] * (len(thresholds) + 1) + [STATE_R] * (churn_gap - 1) + [STATE_C])
+
+    state = expanded_states(panel, metric, thresholds, churn_gap)
+    next_state = shift_in_group(state, group_start_mask(panel[model.customer_col].to_numpy()), -1, fill=NO_STATE)
+
+    # Nᵢⱼ: pares i*K + j distintos e suas contagens (só as transições observadas, sem vetor K²)
+    valid = next_state >= 0
+    pairs, n = np.unique(state[valid].astype(np.int64) * k + next_state[valid], return_counts=True)
+    counts = _matrix(pairs // k, pairs % k, n, k)
+
+    value = panel[metric].to_numpy(dtype=float)
+    nonneg = value >= 0 if metric == "revenue" else np.ones(len(value), dtype=bool)
+    month = panel["_month_index"].to_numpy()
+    return ExpandedModel(
+        params=params,
+        labels=labels,
+        coarse=coarse,
+        thresholds=thresholds,
+        counts=counts,
+        P=estimate_P(counts, force_absorb=params.force_absorb),
+        occupancy=np.bincount(state, minlength=k),
+        last_counts=np.bincount(state[month == month.max()], minlength=k) if len(month) else np.zeros(k, dtype=int),
+        reward_sum=np.stack([np.bincount(state, weights=value, minlength=k),
+                             np.bincount(state[nonneg], weights=value[nonneg], minlength=k)]),
+        reward_rows=np.stack([np.bincount(state, minlength=k), np.bincount(state[nonneg], minlength=k)]),
+    )
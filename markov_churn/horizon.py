@@ -0,0 +1,83 @@
+"""Horizontes Pⁿ: pilha P⁰..Pᴴ por multiplicação iterativa, em cache por matriz P.
+
+Curva de churn (Pⁿ)[i, C] para n = 1..H, projeção π₀Pⁿ e o preview de um n
+isolado saem da mesma pilha: cada Pⁿ é calculado uma vez (Pⁿ = Pⁿ⁻¹·P) em vez de
+um `matrix_power` por n a cada rerun.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+HORIZON_CACHE_SIZE = 8  # matrizes P distintas mantidas em cache
+STACK_MAX_HORIZON = 600  # acima disso (ou n fracionário), Pⁿ vem da forma fechada (`spectral`)
+
+
+class HorizonEngine:
+    """Pilha P⁰..Pᴴ de uma matriz P, estendida sob demanda.
+
+    A pilha é compartilhada entre chamadas (cache por P), então `stack` e
+    `power` devolvem visões somente leitura; copie antes de alterar.
+    """
+
+    def __init__(self, P: np.ndarray):
+        self.P = np.array(P, dtype=float)
+        self.P.flags.writeable = False
+        self._stack = np.eye(self.P.shape[0])[None]  # (H+1, K, K), começa só com P⁰ = I
+        self._stack.flags.writeable = False
+        self._lock = threading.Lock()
+
+    @property
+    def horizon(self) -> int:
+        return len(self._stack) - 1
+
+    def stack(self, horizon: int) -> np.ndarray:
+        """P⁰..Pᴴ como array (H+1, K, K); só multiplica os passos ainda não calculados."""
+        horizon = int(horizon)
+        if horizon < 0:
+            raise ValueError("horizonte precisa ser >= 0")
+        with self._lock:
+            if horizon > self.horizon:
+                grown = np.empty((horizon + 1,) + self.P.shape)
+                grown[: len(self._stack)] = self._stack
+                for n in range(len(self._stack), horizon + 1):
+                    np.matmul(grown[n - 1], self.P, out=grown[n])
+                grown.flags.writeable = False
+                self._stack = grown
+            return self._stack[: horizon + 1]
+
+    def power(self, n: int) -> np.ndarray:
+        return self.stack(n)[int(n)]
+
+    def entry_curve(self, i: int, j: int, horizon: int) -> np.ndarray:
+        # (Pⁿ)[i, j] para n = 1..horizon
+        return self.stack(horizon)[1:, i, j].copy()
+
+    def trajectory(self, pi0, horizon: int) -> np.ndarray:
+        # π₀Pⁿ para n = 0..horizon, shape (horizon+1, K)
+        return np.asarray(pi0, dtype=float) @ self.stack(horizon)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def matrix_cached(factory, P: np.ndarray):
+    """`factory(P)` memorizado pelos valores de P (LRU de HORIZON_CACHE_SIZE por factory)."""
+    P = np.ascontiguousarray(P, dtype=float)
+    key = (factory, P.shape, P.tobytes())
+    with _cache_lock:
+        obj = _cache.get(key)
+        if obj is None:
+            obj = _cache[key] = factory(P)
+            same_kind = [k for k in _cache if k[0] is factory]
+            for k in same_kind[:-HORIZON_CACHE_SIZE]:
+                del _cache[k]
+        else:
+            _cache.move_to_end(key)
+        return obj
+
+
+def horizon_engine(P: np.ndarray) -> HorizonEngine:
+    """Engine compartilhado para esta P (mesmos valores = mesma pilha entre reruns)."""
+    return matrix_cached(HorizonEngine, P)
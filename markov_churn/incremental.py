@@ -0,0 +1,412 @@
+"""Atualização mensal incremental do modelo (sem reconstruir o painel inteiro).
+
+O estado persistido guarda, por cliente, o 1º mês com compra, o último mês com
+compra, o estado atual e se já passou por C (mais os rótulos dos clientes que
+apareceram na entrada sem nunca comprar); e, no agregado, Nᵢⱼ acumulado,
+transições e estados por mês e somas de reward por estado. Um novo mês avança
+os clientes um passo (mesmas regras de `assign_states`) e soma as novas
+transições. Sem compra, só muda de estado quem cruza o gap de risco ou de churn
+naquele mês; esses clientes saem de buckets pelo mês da última compra, e os
+demais entram só pelo total por estado (R→R, C→C). O custo de cada mês depende
+das linhas do mês novo e dos buckets que cruzam o gap, não do histórico nem de
+toda a base de clientes.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from .analytics import (
+    TRANSIENT, TTC_MAX_MONTHS, TTC_QUANTILES, churn_curve, expected_time_to_absorption, get_Q, is_absorbing,
+    ltv_by_state, time_to_churn_distribution, time_to_churn_summary,
+)
+from .engine import MarkovChurnModel, ModelParams
+from .panel import aggregate_monthly, group_start_mask, month_index_to_timestamp
+from .states import NO_STATE, STATE_A, STATE_C, STATE_DTYPE, STATE_R, STATES
+from .transitions import counts_frame, matrix_frame, transition_counts, transition_matrix
+
+K = len(STATES)
+
+
+@dataclass
+class ModelState:
+    params: ModelParams
+    customer_col: str
+    start_month: int  # _month_index do 1º mês do histórico
+    end_month: int  # último mês já processado
+    customers: pd.DataFrame  # customer, first_month, last_purchase_month, state, ever_churned
+    Nij: np.ndarray  # K×K acumulado
+    month_transitions: np.ndarray  # (meses, K, K): transições do mês m para m+1
+    month_states: np.ndarray  # (meses, K): linhas cliente-mês por estado
+    reward_sum: np.ndarray  # (2, K): soma da métrica por estado [todas, só >= 0]
+    reward_rows: np.ndarray  # (2, K): nº de linhas cliente-mês por estado [todas, só >= 0]
+    # rótulos dos clientes da entrada fora do painel (sem compra positiva, ex.: só devoluções)
+    other_customers: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=object))
+
+    @property
+    def P(self) -> np.ndarray:
+        return transition_matrix(self.Nij, force_absorb=self.params.force_absorb)
+
+    @property
+    def Nij_frame(self) -> pd.DataFrame:
+        return counts_frame(self.Nij)
+
+    @property
+    def P_frame(self) -> pd.DataFrame:
+        return matrix_frame(self.P)
+
+    @property
+    def n_customers(self) -> int:
+        return len(self.customers)
+
+    @property
+    def n_customers_total(self) -> int:
+        # como `MarkovChurnModel`: todos os clientes da entrada, com ou sem compra
+        return len(self.customers) + len(self.other_customers)
+
+    @property
+    def panel_rows(self) -> int:
+        return int(self.month_states.sum())
+
+    @property
+    def months(self) -> np.ndarray:
+        # _month_index de cada mês (eixo 0 de month_transitions / month_states)
+        return np.arange(self.start_month, self.end_month + 1)
+
+    def month_distribution(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            self.month_states / np.maximum(self.month_states.sum(axis=1, keepdims=True), 1),
+            index=pd.Index(month_index_to_timestamp(self.months), name="month_ts"),
+            columns=pd.Index(STATES, name="state"),
+        )
+
+    def churn_curve(self, horizon: int, start_state: str = "A") -> np.ndarray:
+        return churn_curve(self.P, horizon, STATES.index(start_state))
+
+    def time_to_churn(self):
+        if not is_absorbing(self.P, STATE_C):
+            return None
+        return expected_time_to_absorption(get_Q(self.P, TRANSIENT))
+
+    def time_to_churn_distribution(self, tol: float = 1e-9, max_months: int = TTC_MAX_MONTHS):
+        if not is_absorbing(self.P, STATE_C):
+            return None
+        return time_to_churn_distribution(get_Q(self.P, TRANSIENT), tol, max_months)
+
+    def time_to_churn_summary(self, quantiles=TTC_QUANTILES, tol: float = 1e-9, max_months: int = TTC_MAX_MONTHS):
+        if not is_absorbing(self.P, STATE_C):
+            return None
+        return time_to_churn_summary(get_Q(self.P, TRANSIENT), quantiles, tol, max_months)
+
+    def rewards(self, remove_negative: bool = True) -> pd.Series:
+        # mesma regra de `reward_by_state`: média por linha cliente-mês, reward(C) = 0
+        row = 1 if remove_negative else 0
+        rewards = np.divide(self.reward_sum[row], self.reward_rows[row],
+                            out=np.zeros(K), where=self.reward_rows[row] > 0)
+        rewards[STATE_C] = 0.0
+        return pd.Series(rewards, index=pd.Index(STATES, name="state"))
+
+    def ltv(self, discount: float = 0.98, remove_negative: bool = True):
+        if not is_absorbing(self.P, STATE_C):
+            return None
+        rewards = self.rewards(remove_negative).to_numpy(dtype=float)
+        return ltv_by_state(get_Q(self.P, TRANSIENT), rewards[list(TRANSIENT)], discount)
+
+    def update(self, transactions: pd.DataFrame, date_col: str) -> "ModelState":
+        """Incorpora transações de meses posteriores a `end_month` (um ou mais meses).
+
+        Meses sem nenhuma transação entre o último processado e o mais recente
+        também avançam os clientes. Transações de meses já processados exigem
+        reajuste completo (`fit`) e geram ValueError.
+        """
+        agg, labels = aggregate_monthly(
+            transactions, self.customer_col, date_col,
+            use_revenue=self.params.use_revenue, neg_mode=self.params.neg_mode,
+        )
+        return self.update_aggregated(agg, labels)
+
+    def update_aggregated(self, agg: pd.DataFrame, labels: pd.Index) -> "ModelState":
+        # mesma atualização, a partir da agregação cliente-mês (`aggregate_monthly` / `MonthlyAccumulator`)
+        if self.params.sample_n is not None:
+            raise ValueError("atualização incremental não suporta amostragem de clientes")
+        if agg.empty:
+            return self
+        if int(agg["_month_index"].min()) <= self.end_month:
+            last = month_index_to_timestamp([self.end_month])[0]
+            raise ValueError(
+                f"transações de meses já processados (até {pd.Timestamp(last):%Y-%m}); refaça o ajuste completo"
+            )
+        agg = agg.sort_values("_month_index", kind="stable")
+        agg = agg.assign(_label=labels.astype(str).to_numpy()[agg[self.customer_col].to_numpy()])
+        metric = "revenue" if self.params.use_revenue else "total_purchases"
+        new_end = int(agg["_month_index"].max())
+        month_rows = np.searchsorted(agg["_month_index"].to_numpy(), np.arange(self.end_month + 1, new_end + 2))
+        work = _CustomerArrays.from_state(self)
+        for m, lo, hi in zip(range(self.end_month + 1, new_end + 1), month_rows[:-1], month_rows[1:]):
+            self._step(m, agg.iloc[lo:hi], metric, work)
+        self.customers = work.frame()
+        seen = pd.Index(self.other_customers).append(pd.Index(agg["_label"].unique())).unique()
+        self.other_customers = seen[~seen.isin(work.labels)].to_numpy(dtype=object)
+        return self
+
+    def _step(self, m: int, month_agg: pd.DataFrame, metric: str, work: "_CustomerArrays") -> None:
+        # avança um mês: estado anterior -> estado em m, com as regras de `assign_states`.
+        # Só mudam de estado sem comprar os clientes cuja última compra foi em m − 1 (A → R)
+        # ou em m − gap de churn (→ C); os demais sem linha no mês repetem o estado (R→R, C→C)
+        # e entram nas contagens só pelo total por estado.
+        had_rows = ((month_agg["revenue"] > 0) if self.params.use_revenue
+                    else (month_agg["total_purchases"] > 0)).to_numpy()
+        pos = work.positions(month_agg["_label"].to_numpy(), had_rows, m)
+        in_panel = pos >= 0
+        pos, had_rows, value_rows = pos[in_panel], had_rows[in_panel], month_agg[metric].to_numpy(dtype=float)[in_panel]
+
+        gap = self.params.churn_gap_months
+        moved = np.unique(np.concatenate([pos, work.bucket(m - 1), work.bucket(m - gap)]))
+        had = np.zeros(len(moved), dtype=bool)
+        had[np.searchsorted(moved, pos)] = had_rows
+        value = np.zeros(len(moved), dtype=float)
+        value[np.searchsorted(moved, pos)] = value_rows
+
+        prev_state = work.state[moved]
+        last_purchase = np.where(had, m, work.last_purchase_month[moved]).astype(np.int32)
+        ever_churned = work.ever_churned[moved] | (~had & (m - last_purchase >= gap))
+        state = np.where(had, STATE_A, STATE_R).astype(STATE_DTYPE)
+        state[ever_churned] = STATE_C
+
+        # quem não foi movido fica no mesmo estado: diagonal de Nᵢⱼ e linhas com métrica 0
+        stayed = work.counts - np.bincount(prev_state[prev_state >= 0], minlength=K)
+        moved_counts = np.bincount(state, minlength=K)
+        step_counts = transition_counts(prev_state, state) + np.diag(stayed)
+        self._grow(m)
+        self.Nij = self.Nij + step_counts
+        self.month_transitions[m - 1 - self.start_month] += step_counts
+        self.month_states[m - self.start_month] = stayed + moved_counts
+
+        nonneg = value >= 0
+        self.reward_sum[0] += np.bincount(state, weights=value, minlength=K)
+        self.reward_rows[0] += stayed + moved_counts
+        self.reward_sum[1] += np.bincount(state[nonneg], weights=value[nonneg], minlength=K)
+        self.reward_rows[1] += stayed + np.bincount(state[nonneg], minlength=K)
+
+        work.last_purchase_month[moved] = last_purchase
+        work.ever_churned[moved] = ever_churned
+        work.state[moved] = state
+        work.counts = stayed + moved_counts
+        work.add_to_bucket(m, moved[had & ~ever_churned])
+        work.drop_buckets_before(m + 1 - gap)
+        self.end_month = m
+
+    def _grow(self, m: int) -> None:
+        extra = m - self.start_month + 1 - len(self.month_states)
+        if extra > 0:
+            self.month_states = np.concatenate([self.month_states, np.zeros((extra, K), dtype=np.int64)])
+            self.month_transitions = np.concatenate(
+                [self.month_transitions, np.zeros((extra, K, K), dtype=np.int64)])
+
+    def save(self, path: str) -> None:
+        # diretório com customers.parquet (um registro por cliente) + state.json (agregados)
+        os.makedirs(path, exist_ok=True)
+        self.customers.to_parquet(os.path.join(path, "customers.parquet"), index=False)
+        pd.DataFrame({"customer": self.other_customers}).to_parquet(
+            os.path.join(path, "other_customers.parquet"), index=False)
+        meta = {
+            "params": asdict(self.params),
+            "customer_col": self.customer_col,
+            "start_month": int(self.start_month),
+            "end_month": int(self.end_month),
+            "Nij": self.Nij.tolist(),
+            "month_transitions": self.month_transitions.tolist(),
+            "month_states": self.month_states.tolist(),
+            "reward_sum": self.reward_sum.tolist(),
+            "reward_rows": self.reward_rows.tolist(),
+        }
+        tmp = os.path.join(path, "state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, os.path.join(path, "state.json"))
+
+    @classmethod
+    def load(cls, path: str) -> "ModelState":
+        with open(os.path.join(path, "state.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        customers = pd.read_parquet(os.path.join(path, "customers.parquet"))
+        other_path = os.path.join(path, "other_customers.parquet")
+        # estados salvos antes de `other_customers` não têm o arquivo
+        other = pd.read_parquet(other_path)["customer"] if os.path.exists(other_path) else pd.Series([], dtype=object)
+        return cls(
+            params=ModelParams(**meta["params"]),
+            customer_col=meta["customer_col"],
+            start_month=meta["start_month"],
+            end_month=meta["end_month"],
+            customers=customers.astype({"state": STATE_DTYPE}),
+            Nij=np.asarray(meta["Nij"], dtype=np.int64),
+            month_transitions=np.asarray(meta["month_transitions"], dtype=np.int64).reshape(-1, K, K),
+            month_states=np.asarray(meta["month_states"], dtype=np.int64).reshape(-1, K),
+            reward_sum=np.asarray(meta["reward_sum"], dtype=float),
+            reward_rows=np.asarray(meta["reward_rows"], dtype=np.int64),
+            other_customers=other.to_numpy(dtype=object),
+        )
+
+
+class _CustomerArrays:
+    """`ModelState.customers` em arrays durante um `update`, com buckets pelo mês da última compra.
+
+    O bucket do mês b guarda as posições dos clientes (ainda não em C) cuja
+    última compra foi em b; entradas de quem comprou depois ficam no bucket
+    antigo e são descartadas na leitura. Um passo mensal lê só os buckets que
+    cruzam o gap (m − 1 e m − gap de churn) e os clientes com linha no mês.
+    """
+
+    def __init__(self, customers: pd.DataFrame, churn_gap_months: int, end_month: int):
+        # cópias: os passos escrevem no lugar
+        self.labels = customers["customer"].to_numpy(dtype=object, copy=True)
+        self.first_month = customers["first_month"].to_numpy(dtype=np.int32, copy=True)
+        self.last_purchase_month = customers["last_purchase_month"].to_numpy(dtype=np.int32, copy=True)
+        self.state = customers["state"].to_numpy(dtype=STATE_DTYPE, copy=True)
+        self.ever_churned = customers["ever_churned"].to_numpy(dtype=bool, copy=True)
+        self.counts = np.bincount(self.state[self.state >= 0], minlength=K)  # clientes por estado
+        self._index = pd.Index(self.labels)
+        self._new = {}  # rótulo -> posição dos clientes que entraram neste `update`
+        self._pending = []  # rótulos novos do mês, ainda não anexados aos arrays
+        # buckets que ainda podem cruzar um gap a partir de end_month + 1
+        live = ~self.ever_churned & (self.last_purchase_month > end_month - churn_gap_months)
+        live_pos = np.flatnonzero(live)
+        months, inverse = np.unique(self.last_purchase_month[live_pos], return_inverse=True)
+        self._buckets = {int(b): [live_pos[inverse == i]] for i, b in enumerate(months)}
+
+    @classmethod
+    def from_state(cls, state: "ModelState") -> "_CustomerArrays":
+        return cls(state.customers, state.params.churn_gap_months, state.end_month)
+
+    def positions(self, labels: np.ndarray, had_purchase: np.ndarray, m: int) -> np.ndarray:
+        """Posição de cada rótulo (-1 = fora do painel); quem compra pela 1ª vez em m entra em A."""
+        pos = self._index.get_indexer(labels)
+        for i in np.flatnonzero(pos < 0):
+            label = labels[i]
+            p = self._new.get(label, -1)
+            if p < 0 and had_purchase[i]:
+                p = self._new[label] = len(self.labels) + len(self._pending)
+                self._pending.append(label)
+            pos[i] = p
+        if self._pending:
+            n = len(self._pending)
+            self.labels = np.concatenate([self.labels, np.array(self._pending, dtype=object)])
+            self.first_month = np.concatenate([self.first_month, np.full(n, m, dtype=np.int32)])
+            self.last_purchase_month = np.concatenate([self.last_purchase_month, np.full(n, m, dtype=np.int32)])
+            self.state = np.concatenate([self.state, np.full(n, NO_STATE, dtype=STATE_DTYPE)])
+            self.ever_churned = np.concatenate([self.ever_churned, np.zeros(n, dtype=bool)])
+            self._pending = []
+        return pos
+
+    def bucket(self, b: int) -> np.ndarray:
+        # clientes fora de C com última compra em b (descarta entradas desatualizadas)
+        parts = self._buckets.get(b)
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        pos = np.concatenate(parts)
+        return pos[(self.last_purchase_month[pos] == b) & ~self.ever_churned[pos]]
+
+    def add_to_bucket(self, b: int, pos: np.ndarray) -> None:
+        self._buckets.setdefault(b, []).append(pos)
+
+    def drop_buckets_before(self, b: int) -> None:
+        # buckets que já cruzaram os dois gaps não voltam a ser lidos
+        for old in [k for k in self._buckets if k < b]:
+            del self._buckets[old]
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "customer": self.labels,
+            "first_month": self.first_month,
+            "last_purchase_month": self.last_purchase_month,
+            "state": self.state,
+            "ever_churned": self.ever_churned,
+        })
+
+
+def state_from_model(model: MarkovChurnModel, customer_codes=None) -> ModelState:
+    """Resume um modelo ajustado (painel completo) no estado incremental.
+
+    `customer_codes`: códigos dos clientes da entrada (padrão: todos de
+    `customer_labels`); os que não estão no painel vão para `other_customers`.
+    """
+    panel = model.panel
+    params = model.params
+    customer_col = model.customer_col
+    state = panel["state"].to_numpy()
+    # transições e estados por mês: já contados no ajuste (cópias: `update` soma no lugar)
+    month_transitions, month_states = model.month_transitions.copy(), model.month_states.copy()
+    start_month, end_month = int(model.months[0]), int(model.months[-1])
+
+    metric = "revenue" if params.use_revenue else "total_purchases"
+    value = panel[metric].to_numpy(dtype=float)
+    nonneg = value >= 0
+    reward_sum = np.stack([
+        np.bincount(state, weights=value, minlength=K),
+        np.bincount(state[nonneg], weights=value[nonneg], minlength=K),
+    ])
+    reward_rows = np.stack([np.bincount(state, minlength=K), np.bincount(state[nonneg], minlength=K)])
+
+    # última linha de cada cliente = situação no fim do histórico
+    group_end = np.roll(group_start_mask(panel[customer_col].to_numpy()), -1)
+    last = panel.loc[group_end]
+    labels = model.customer_labels.astype(str).to_numpy()
+    if customer_codes is None:
+        customer_codes = np.arange(len(labels))
+    other = np.setdiff1d(customer_codes, last[customer_col].to_numpy())
+    customers = pd.DataFrame({
+        "customer": labels[last[customer_col].to_numpy()],
+        "first_month": last["_first_purchase_month"].to_numpy(dtype=np.int32),
+        "last_purchase_month": last["_last_purchase_month"].to_numpy(dtype=np.int32),
+        "state": last["state"].to_numpy().astype(STATE_DTYPE),
+        "ever_churned": last["_ever_churned"].to_numpy(),
+    })
+    return ModelState(
+        params=params,
+        customer_col=customer_col,
+        start_month=start_month,
+        end_month=end_month,
+        customers=customers,
+        Nij=np.asarray(model.Nij, dtype=np.int64),
+        month_transitions=month_transitions,
+        month_states=month_states,
+        reward_sum=reward_sum,
+        reward_rows=reward_rows,
+        other_customers=labels[other].astype(object),
+    )
+
+
+def merge_states(states) -> ModelState:
+    """Junta estados de partições disjuntas de clientes (ex.: shards do ajuste paralelo).
+
+    Contagens e somas são aditivas; os arrays por mês são alinhados pelo 1º mês
+    de cada partição.
+    """
+    states = list(states)
+    if not states:
+        raise ValueError("nenhum estado para juntar (painel vazio)")
+    first = states[0]
+    start_month = min(s.start_month for s in states)
+    end_month = max(s.end_month for s in states)
+    n_months = end_month - start_month + 1
+    month_transitions = np.zeros((n_months, K, K), dtype=np.int64)
+    month_states = np.zeros((n_months, K), dtype=np.int64)
+    for s in states:
+        lo = s.start_month - start_month
+        month_transitions[lo:lo + len(s.month_transitions)] += s.month_transitions
+        month_states[lo:lo + len(s.month_states)] += s.month_states
+    return ModelState(
+        params=first.params,
+        customer_col=first.customer_col,
+        start_month=start_month,
+        end_month=end_month,
+        customers=pd.concat([s.customers for s in states], ignore_index=True),
+        Nij=sum(s.Nij for s in states),
+        month_transitions=month_transitions,
+        month_states=month_states,
+        reward_sum=sum(s.reward_sum for s in states),
+        reward_rows=sum(s.reward_rows for s in states),
+        other_customers=np.concatenate([s.other_customers for s in states]),
+    )
@@ -0,0 +1,281 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.dataset as pads
+    import pyarrow.parquet as pq
+except ImportError:  # sem pyarrow: só CSV/XLSX, lidos direto pelo pandas
+    pa = None
+
+HAS_PYARROW = pa is not None
+
+SNIFF_ROWS = 1000  # linhas lidas na pré-visualização (fase 1 do loader)
+
+# cópias colunares locais (Parquet/IPC) dos arquivos enviados, nomeadas pelo hash do conteúdo
+COLUMNAR_CACHE_DIR = os.environ.get("MARKOV_CHURN_CACHE_DIR", os.path.join(".cache", "markov_churn"))
+
+FILE_KINDS = {
+    ".csv": "csv",
+    ".xlsx": "excel",
+    ".xls": "excel",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "ipc",
+    ".arrow": "ipc",
+    ".ipc": "ipc",
+}
+
+
+class IngestionCache:
+    """LRU de DataFrames já parseados, limitado por memória (bytes)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._items = OrderedDict()  # key -> (DataFrame, bytes)
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._items:
+                self._nbytes -= self._items.pop(key)[1]
+            # frame maior que o teto inteiro: não cacheia (evita expulsar tudo à toa)
+            if size > self.max_bytes:
+                return
+            self._items[key] = (df, size)
+            self._nbytes += size
+            # LRU: expulsa os menos usados até caber no teto
+            while self._nbytes > self.max_bytes:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self._nbytes -= old_size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._nbytes, "max_bytes": self.max_bytes}
+
+
+def file_content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_kind(file_name: str) -> str:
+    ext = os.path.splitext(file_name.lower())[1]
+    kind = FILE_KINDS.get(ext)
+    if kind is None or (kind in ("parquet", "ipc") and pa is None):
+        raise ValueError("Formato inválido. Envie CSV, XLSX, Parquet, Feather ou Arrow.")
+    return kind
+
+
+def columnar_format(kind: str) -> str:
+    return "ipc" if kind == "ipc" else "parquet"
+
+
+def columnar_cache_path(digest: str, kind: str, cache_dir: str = COLUMNAR_CACHE_DIR) -> str:
+    fmt = columnar_format(kind)
+    return os.path.join(cache_dir, f"{digest}.{'arrow' if fmt == 'ipc' else 'parquet'}")
+
+
+def write_columnar_copy(data: bytes, kind: str, path: str) -> None:
+    """Grava `data` como arquivo colunar em `path` (escrita atômica).
+
+    Parquet/Feather/Arrow são gravados como vieram; CSV/XLSX são convertidos
+    para Parquet.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if kind in ("parquet", "ipc"):
+        with open(tmp_path, "wb") as fh:
+            fh.write(data)
+    elif kind == "csv":
+        try:
+            table = pacsv.read_csv(pa.BufferReader(data))
+        except pa.ArrowInvalid:
+            # inferência por bloco do pyarrow falhou (tipos mistos): usa o pandas
+            table = pa.Table.from_pandas(pd.read_csv(io.BytesIO(data)), preserve_index=False)
+        pq.write_table(table, tmp_path)
+    else:
+        df_xl = pd.read_excel(io.BytesIO(data))
+        # colunas object do Excel podem misturar tipos; string é sempre gravável
+        obj_cols = df_xl.columns[df_xl.dtypes == object]
+        df_xl[obj_cols] = df_xl[obj_cols].astype("string")
+        df_xl.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def normalize_categories(s: pd.Series, func) -> pd.Series:
+    # aplica func nas categorias (não em cada linha); se categorias colidirem
+    # após a normalização (ex.: " 123" e "123"), recodifica para unificá-las
+    cats = func(s.cat.categories.astype(str).to_series(index=None)).to_numpy()
+    uniques, inverse = np.unique(cats, return_inverse=True)
+    codes = s.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, inverse[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=uniques), index=s.index, name=s.name)
+
+
+def _date_filter_expression(dataset, date_col, date_range):
+    # pushdown só quando a coluna já é data/timestamp no arquivo colunar;
+    # colunas texto são filtradas depois do parse
+    field = dataset.schema.field(date_col)
+    if not (pa.types.is_timestamp(field.type) or pa.types.is_date(field.type)):
+        return None
+    start = pa.scalar(pd.Timestamp(date_range[0]).to_pydatetime()).cast(field.type, safe=False)
+    end = pa.scalar((pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)).to_pydatetime()).cast(field.type, safe=False)
+    return (pads.field(date_col) >= start) & (pads.field(date_col) < end)
+
+
+def read_transactions(source, kind: str, columns=None, dtypes=None, date_cols=(), nrows=None,
+                      customer_col=None, state_col=None, date_range=None) -> pd.DataFrame:
+    """Lê transações de `source` (caminho ou buffer) já no formato usado pelo modelo.
+
+    Com `columns`, lê apenas essas colunas (dtypes compactos em `dtypes`), já
+    converte `date_cols` para datetime e normaliza cliente/estado. `date_range`
+    (início, fim) filtra a primeira coluna de `date_cols`; em Parquet/Arrow
+    (`kind` = "parquet"/"ipc", `source` = caminho) o filtro é empurrado para a leitura.
+    """
+    if kind in ("parquet", "ipc"):
+        dataset = pads.dataset(source, format=kind)
+        if nrows is not None:
+            table = dataset.head(int(nrows), columns=columns)
+        else:
+            date_filter = None
+            if date_range and date_cols:
+                date_filter = _date_filter_expression(dataset, date_cols[0], date_range)
+            table = dataset.to_table(columns=columns, filter=date_filter)
+        df = table.to_pandas()
+        if dtypes:
+            df = df.astype(dtypes)
+    else:
+        parser_options = {}
+        if columns is not None:
+            parser_options["usecols"] = list(columns)
+        if dtypes:
+            parser_options["dtype"] = dict(dtypes)
+        if nrows is not None:
+            parser_options["nrows"] = int(nrows)
+        if kind == "csv":
+            df = pd.read_csv(source, **parser_options)
+        else:
+            df = pd.read_excel(source, **parser_options)
+    return _finish_frame(df, date_cols, customer_col, state_col, date_range)
+
+
+def _finish_frame(df: pd.DataFrame, date_cols=(), customer_col=None, state_col=None, date_range=None) -> pd.DataFrame:
+    # datas convertidas, filtro de período e cliente/estado normalizados
+    for c in date_cols:
+        df[c] = pd.to_datetime(df[c], errors="coerce")
+    if date_range and date_cols:
+        d = df[date_cols[0]]
+        keep = (d >= pd.Timestamp(date_range[0])) & (d < pd.Timestamp(date_range[1]) + pd.Timedelta(days=1))
+        df = df[keep].reset_index(drop=True)
+    if customer_col is not None and isinstance(df[customer_col].dtype, pd.CategoricalDtype):
+        df[customer_col] = normalize_categories(df[customer_col], lambda c: c.str.strip())
+    if state_col is not None and isinstance(df[state_col].dtype, pd.CategoricalDtype):
+        df[state_col] = normalize_categories(df[state_col], lambda c: c.str.strip().str.upper())
+    return df
+
+
+def iter_transaction_chunks(path: str, customer_col: str, date_col: str, chunk_rows: int = 1_000_000,
+                            state_col=None, date_range=None):
+    """Lê o arquivo em blocos de até `chunk_rows` linhas, só com as colunas do modelo.
+
+    Cada bloco sai como em `load_transactions` (datas convertidas, cliente
+    normalizado, revenue calculado, linhas sem cliente/data removidas). CSV usa o
+    leitor em partes do pandas e Parquet/Arrow lê por lotes (com projeção de
+    colunas e filtro de datas na leitura); XLSX não tem leitura em partes e vem
+    num bloco só.
+    """
+    kind = file_kind(path)
+    if kind in ("parquet", "ipc"):
+        dataset = pads.dataset(path, format=kind)
+        use_cols, dtypes = model_columns(dataset.schema.names, customer_col, date_col, state_col)
+        date_filter = _date_filter_expression(dataset, date_col, date_range) if date_range else None
+        chunks = (
+            batch.to_pandas().astype(dtypes)
+            for batch in dataset.to_batches(columns=use_cols, filter=date_filter, batch_size=int(chunk_rows))
+        )
+    elif kind == "csv":
+        header = read_transactions(path, kind, nrows=0).columns
+        use_cols, dtypes = model_columns(header, customer_col, date_col, state_col)
+        chunks = pd.read_csv(path, usecols=use_cols, dtype=dtypes, chunksize=int(chunk_rows))
+    else:
+        header = read_transactions(path, kind, nrows=0).columns
+        use_cols, dtypes = model_columns(header, customer_col, date_col, state_col)
+        chunks = iter([pd.read_excel(path, usecols=use_cols, dtype=dtypes)])
+
+    for chunk in chunks:
+        chunk = _finish_frame(chunk, (date_col,), customer_col, state_col, date_range)
+        add_revenue(chunk)
+        yield chunk.dropna(subset=[customer_col, date_col])
+
+
+def model_columns(columns, customer_col: str, date_col: str, state_col=None, segment_cols=()):
+    """Colunas e dtypes compactos que o modelo usa: cliente, data, Price/Quantity, estado e segmentos."""
+    has_price_qty = ("Price" in columns) and ("Quantity" in columns)
+    use_cols = list(dict.fromkeys(
+        [customer_col, date_col]
+        + (["Price", "Quantity"] if has_price_qty else [])
+        + ([state_col] if state_col else [])
+        + list(segment_cols)
+    ))
+    dtypes = {customer_col: "category"}
+    if has_price_qty:
+        dtypes.update({"Price": "float32", "Quantity": "float32"})
+    if state_col:
+        dtypes[state_col] = "category"
+    for c in segment_cols:
+        dtypes.setdefault(c, "category")
+    return use_cols, dtypes
+
+
+def add_revenue(df: pd.DataFrame) -> bool:
+    # revenue = Price × Quantity, quando as duas colunas existem
+    if ("Price" in df.columns) and ("Quantity" in df.columns):
+        df["revenue"] = df["Price"] * df["Quantity"]
+        return True
+    return False
+
+
+def load_transactions(path: str, customer_col: str, date_col: str, state_col=None, date_range=None,
+                      segment_cols=()) -> pd.DataFrame:
+    """Lê um arquivo (CSV/XLSX/Parquet/Feather/Arrow) só com as colunas do modelo.
+
+    Mesmo caminho da aba 📥 Dados: projeção de colunas, dtypes compactos, data
+    convertida, revenue calculado e linhas sem cliente/data removidas.
+    `segment_cols` (país, canal...) são lidas junto, como category.
+    """
+    kind = file_kind(path)
+    if kind in ("parquet", "ipc"):
+        header = pads.dataset(path, format=kind).schema.names
+    else:
+        header = read_transactions(path, kind, nrows=0).columns
+    use_cols, dtypes = model_columns(header, customer_col, date_col, state_col, segment_cols)
+    df = read_transactions(
+        path, kind, columns=use_cols, dtypes=dtypes, date_cols=(date_col,),
+        customer_col=customer_col, state_col=state_col, date_range=date_range,
+    )
+    add_revenue(df)
+    return df.dropna(subset=[customer_col, date_col])
+
+
+def date_bounds(path: str, fmt: str, date_col: str):
+    # min/max da coluna de data lendo só essa coluna do arquivo colunar
+    d = pd.to_datetime(pads.dataset(path, format=fmt).to_table(columns=[date_col]).to_pandas()[date_col], errors="coerce")
+    if d.isna().all():
+        return None
+    return d.min().date(), d.max().date()
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+
+from .states import NO_STATE, STATE_A, STATE_C, STATE_DTYPE, STATE_R, encode_customers
+
+# tratamento de revenue < 0 (devoluções/estornos)
+NEG_MODES = ("keep", "clip", "drop")
+
+
+def month_index_to_timestamp(month_index) -> np.ndarray:
+    # _month_index = ano*12 + mês (1-12)  ->  primeiro dia do mês
+    months_since_epoch = np.asarray(month_index, dtype=np.int64) - (1970 * 12 + 1)
+    return months_since_epoch.astype("datetime64[M]").astype("datetime64[ns]")
+
+
+def aggregate_monthly(df: pd.DataFrame, customer_col: str, date_col: str, use_revenue: bool,
+                      neg_mode: str = "keep"):
+    """Agrega transações em uma linha por cliente-mês.
+
+    Retorna (agg, customer_labels): em `agg` o cliente vira código int32 e o mês
+    vira `_month_index` = ano*12 + mês, com `month_ts`, `revenue` (soma da métrica)
+    e `total_purchases` (nº de linhas). Sem revenue, a métrica é a contagem de eventos.
+    """
+    if neg_mode not in NEG_MODES:
+        raise ValueError(f"neg_mode inválido: {neg_mode!r} (use um de {NEG_MODES})")
+
+    df = df.copy(deep=False)
+    if use_revenue and "revenue" in df.columns:
+        if neg_mode == "clip":
+            df["revenue"] = df["revenue"].clip(lower=0)
+        elif neg_mode == "drop":
+            df = df[df["revenue"] >= 0]
+        metric_col = "revenue"
+    else:
+        metric_col = "_events"
+        df[metric_col] = 1
+
+    # mês real (YYYY-MM) e índice sequencial ano+mês
+    month_ts = pd.to_datetime(df[date_col], errors="coerce").dt.to_period("M").dt.to_timestamp()
+
+    # cliente como código int32 (ordem dos IDs preservada); rótulos guardados para exibição
+    customer_codes, customer_labels = encode_customers(df[customer_col])
+    keep = (customer_codes >= 0) & month_ts.notna().to_numpy()
+    month_ts = month_ts[keep]
+
+    monthly = pd.DataFrame({
+        customer_col: customer_codes[keep],
+        "_month_index": (month_ts.dt.year * 12 + month_ts.dt.month).to_numpy(dtype=np.int32),
+        "_month_ts": month_ts.to_numpy(),
+        "_metric": df[metric_col].to_numpy()[keep],
+    })
+    agg = (
+        monthly.groupby([customer_col, "_month_index"], as_index=False)
+               .agg(
+                   month_ts=("_month_ts", "min"),
+                   revenue=("_metric", "sum"),
+                   total_purchases=("_metric", "size")
+               )
+    )
+    return agg, customer_labels
+
+
+def select_customers(agg: pd.DataFrame, customer_col: str, sample_n=None, seed: int = 42) -> np.ndarray:
+    # todos os clientes da agregação, ou uma amostra aleatória reprodutível
+    customers = np.unique(agg[customer_col].to_numpy())
+    if sample_n is None:
+        return customers
+    rng = np.random.default_rng(seed)
+    return rng.choice(customers, size=min(int(sample_n), len(customers)), replace=False)
+
+
+def build_monthly_panel(agg: pd.DataFrame, customer_col: str, customers, end_month: int,
+                        use_revenue: bool) -> pd.DataFrame:
+    """Painel cliente × mês esparso: do 1º mês com compra de cada cliente até `end_month`.
+
+    Em vez do produto cartesiano clientes × meses (filtrado depois), cada cliente
+    gera só as linhas que serão usadas: memória proporcional ao painel final.
+    `agg` tem uma linha por cliente-mês com `_month_index`, `revenue` e `total_purchases`.
+    """
+    # compra no mês (mesma regra usada para o estado A)
+    had = (agg["revenue"] > 0) if use_revenue else (agg["total_purchases"] > 0)
+    in_sample = agg[customer_col].isin(customers)
+
+    first = (
+        agg.loc[had & in_sample]
+           .groupby(customer_col, observed=True)["_month_index"].min()
+           .sort_index()
+    )
+    first_month = first.to_numpy(dtype=np.int32)
+
+    # expansão de intervalos: cliente c ocupa as linhas [row_start[c], row_start[c] + lengths[c])
+    lengths = np.maximum(int(end_month) - first_month.astype(np.int64) + 1, 0)
+    row_start = np.cumsum(lengths) - lengths
+    n_rows = int(lengths.sum())
+
+    cust_pos = np.repeat(np.arange(len(first)), lengths)
+    month_index = (first_month[cust_pos] + (np.arange(n_rows) - row_start[cust_pos])).astype(np.int32)
+
+    # espalha os valores agregados nas posições do painel (meses sem linha ficam 0)
+    code = first.index.get_indexer(agg[customer_col])
+    valid = code >= 0
+    agg_month = agg["_month_index"].to_numpy(dtype=np.int64)
+    valid[valid] = agg_month[valid] >= first_month[code[valid]]
+    pos = row_start[code[valid]] + (agg_month[valid] - first_month[code[valid]])
+
+    revenue = np.zeros(n_rows, dtype=np.float64)
+    revenue[pos] = agg["revenue"].to_numpy(dtype=np.float64)[valid]
+    total_purchases = np.zeros(n_rows, dtype=np.int32)
+    total_purchases[pos] = agg["total_purchases"].to_numpy(dtype=np.int32)[valid]
+
+    panel = pd.DataFrame({
+        customer_col: first.index.to_numpy()[cust_pos],
+        "_month_index": month_index,
+        "month_ts": month_index_to_timestamp(month_index),
+        "revenue": revenue,
+        "total_purchases": total_purchases,
+    })
+    panel["_had_purchase"] = (revenue > 0) if use_revenue else (total_purchases > 0)
+    panel["_first_purchase_month"] = first_month[cust_pos]
+    return panel
+
+
+def group_start_mask(keys) -> np.ndarray:
+    # True na primeira linha de cada grupo (chaves contíguas, painel ordenado)
+    keys = np.asarray(keys)
+    mask = np.ones(len(keys), dtype=bool)
+    if len(keys) > 1:
+        mask[1:] = keys[1:] != keys[:-1]
+    return mask
+
+
+def propagate_absorbing(is_absorbing, group_start) -> np.ndarray:
+    """Churn absorvente vetorizado: True a partir da 1ª ocorrência dentro do grupo.
+
+    Equivale a `groupby(cliente).transform(lambda s: s.cummax())`, mas com dois
+    cumulativos de máximo sobre inteiros: posição de início do grupo de cada linha
+    e posição da última ocorrência até a linha. Se a última ocorrência é do próprio
+    grupo (>= início), a linha já passou por C.
+    """
+    is_absorbing = np.asarray(is_absorbing, dtype=bool)
+    pos = np.arange(len(is_absorbing))
+    start = np.maximum.accumulate(np.where(group_start, pos, 0))
+    last_hit = np.maximum.accumulate(np.where(is_absorbing, pos, -1))
+    return last_hit >= start
+
+
+def shift_in_group(values, group_start, periods: int, fill=-1) -> np.ndarray:
+    """`groupby(...).shift(periods)` para periods = ±1 em painel ordenado por grupo.
+
+    Sem sair do dtype inteiro: posições sem vizinho no mesmo grupo recebem `fill`.
+    """
+    values = np.asarray(values)
+    group_start = np.asarray(group_start, dtype=bool)
+    out = np.full(len(values), fill, dtype=values.dtype)
+    if len(values) == 0:
+        return out
+    if periods == -1:
+        out[:-1] = values[1:]
+        group_end = np.empty_like(group_start)
+        group_end[:-1] = group_start[1:]
+        group_end[-1] = True
+        out[group_end] = fill
+    elif periods == 1:
+        out[1:] = values[:-1]
+        out[group_start] = fill
+    else:
+        raise ValueError("shift_in_group só suporta periods = 1 ou -1")
+    return out
+
+
+def assign_states(panel: pd.DataFrame, customer_col: str, risk_gap_months: int, churn_gap_months: int) -> pd.DataFrame:
+    """Classifica cada linha do painel em A/R/C (códigos int8) e calcula o próximo estado.
+
+    - A: houve compra no mês
+    - R: sem compra e gap < `churn_gap_months` (o gap de risco só documenta a regra:
+      sem compra o cliente já é R)
+    - C: sem compra e gap >= `churn_gap_months`; depois de C, sempre C (absorvente)
+
+    Espera o painel de `build_monthly_panel` (ordenado por cliente e mês, com a 1ª
+    linha de cada cliente sendo um mês com compra). Adiciona `_last_purchase_month`,
+    `_months_since_purchase`, `_ever_churned`, `state` e `next_state` (NO_STATE na
+    última linha de cada cliente).
+    """
+    if churn_gap_months <= risk_gap_months:
+        raise ValueError("O gap de churn (C) precisa ser maior que o gap de risco (R).")
+
+    # meses desde a última compra: a 1ª linha de cada cliente é mês com compra,
+    # então o último índice com compra (cumulativo) nunca cruza para o cliente anterior
+    had_purchase = panel["_had_purchase"].to_numpy()
+    month_idx = panel["_month_index"].to_numpy()
+    last_purchase_pos = np.maximum.accumulate(np.where(had_purchase, np.arange(len(panel)), 0))
+    last_purchase_month = month_idx[last_purchase_pos] if len(panel) else month_idx
+    months_since = (month_idx - last_purchase_month).astype(np.int16)
+
+    # estado (códigos int8: A=0, R=1, C=2)
+    state = np.full(len(panel), STATE_R, dtype=STATE_DTYPE)  # sem compra e gap < c -> R
+    state[had_purchase] = STATE_A
+    state[~had_purchase & (months_since >= churn_gap_months)] = STATE_C
+
+    # churn absorvente: depois de C, sempre C
+    group_start = group_start_mask(panel[customer_col].to_numpy())
+    ever_churned = propagate_absorbing(state == STATE_C, group_start)
+    state[ever_churned] = STATE_C
+
+    panel = panel.copy(deep=False)
+    panel["_last_purchase_month"] = last_purchase_month
+    panel["_months_since_purchase"] = months_since
+    panel["_ever_churned"] = ever_churned
+    panel["state"] = state
+    panel["next_state"] = shift_in_group(state, group_start, -1, fill=NO_STATE)
+    return panel
@@ -0,0 +1,121 @@
+"""Ajuste paralelo: clientes divididos em shards processados num pool de processos.
+
+Painel, estados e contagens são independentes por cliente. A agregação
+cliente-mês é dividida em faixas contíguas de códigos de cliente, balanceadas
+pelo nº esperado de linhas do painel; cada processo monta o painel da sua faixa,
+classifica A/R/C e conta Nᵢⱼ (ou resume tudo num `ModelState`). A junção é exata:
+contagens somam e, como as faixas são contíguas, os painéis concatenados em
+ordem já saem ordenados por cliente e mês.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .engine import MarkovChurnModel, ModelParams, model_from_panel, stage_timer
+from .incremental import ModelState, merge_states, state_from_model
+from .panel import aggregate_monthly, assign_states, build_monthly_panel, select_customers
+from .transitions import transition_counts
+
+
+def default_jobs() -> int:
+    return os.cpu_count() or 1
+
+
+def shard_bounds(agg: pd.DataFrame, customer_col: str, customers: np.ndarray, end_month: int, n_shards: int):
+    """Faixas [lo, hi) de `customers` (ordenados) com nº parecido de linhas de painel."""
+    first = agg.groupby(customer_col)["_month_index"].min().reindex(customers).to_numpy()
+    weight = np.cumsum(end_month - first + 1)
+    cuts = np.searchsorted(weight, weight[-1] * np.arange(1, n_shards) / n_shards) if len(weight) else []
+    bounds = np.unique(np.concatenate([[0], cuts, [len(customers)]])).astype(np.int64)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _split(agg: pd.DataFrame, customer_col: str, customers: np.ndarray, end_month: int, n_shards: int):
+    # linhas de agg por shard (agg ordenado por cliente: fatias contíguas)
+    codes = agg[customer_col].to_numpy()
+    for lo, hi in shard_bounds(agg, customer_col, customers, end_month, n_shards):
+        row_lo = np.searchsorted(codes, customers[lo], side="left")
+        row_hi = np.searchsorted(codes, customers[hi - 1], side="right")
+        yield agg.iloc[row_lo:row_hi], customers[lo:hi]
+
+
+def _shard_panel(agg_shard, customer_col, customers, end_month, params):
+    panel = build_monthly_panel(agg_shard, customer_col, customers, end_month, use_revenue=params.use_revenue)
+    panel = assign_states(panel, customer_col, params.risk_gap_months, params.churn_gap_months)
+    return panel, transition_counts(panel["state"].to_numpy(), panel["next_state"].to_numpy())
+
+
+def _shard_state(agg_shard, customer_col, customers, end_month, params, customer_labels):
+    # shard sem nenhuma linha de painel (só clientes sem compra positiva, ex.: só devoluções): nada a somar
+    panel, counts = _shard_panel(agg_shard, customer_col, customers, end_month, params)
+    if panel.empty:
+        return None
+    # clientes fora do painel: calculados uma vez, após a junção
+    model = model_from_panel(panel, customer_col, customer_labels, params, counts=counts)
+    return state_from_model(model, customer_codes=np.empty(0, dtype=np.int64))
+
+
+def _map_shards(fn, agg, customer_col, customers, end_month, params, n_jobs, *extra):
+    n_jobs = max(int(n_jobs or default_jobs()), 1)
+    shards = list(_split(agg, customer_col, customers, end_month, n_jobs))
+    args = [(a, customer_col, c, end_month, params, *extra) for a, c in shards]
+    if n_jobs == 1 or len(shards) == 1:
+        return [fn(*a) for a in args]
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(shards))) as pool:
+        return list(pool.map(fn, *zip(*args)))
+
+
+def panel_with_states(agg: pd.DataFrame, customer_col: str, customers, end_month: int, params: ModelParams,
+                      n_jobs: int = 1):
+    """`build_monthly_panel` + `assign_states` em shards; retorna (painel, Nᵢⱼ)."""
+    customers = np.sort(np.asarray(customers))
+    parts = _map_shards(_shard_panel, agg, customer_col, customers, end_month, params, n_jobs)
+    panel = pd.concat([p for p, _ in parts], ignore_index=True)
+    return panel, sum(c for _, c in parts)
+
+
+def fit_aggregated_parallel(agg: pd.DataFrame, customer_labels: pd.Index, customer_col: str,
+                            params: ModelParams = ModelParams(), n_jobs: Optional[int] = None,
+                            timings: Optional[dict] = None) -> MarkovChurnModel:
+    # `fit_aggregated` com painel, estados e Nᵢⱼ calculados em `n_jobs` processos
+    with stage_timer(timings, "shards"):
+        customers = select_customers(agg, customer_col, params.sample_n, params.seed)
+        panel, counts = panel_with_states(agg, customer_col, customers, int(agg["_month_index"].max()), params, n_jobs)
+    with stage_timer(timings, "transitions"):
+        model = model_from_panel(
+            panel, customer_col, customer_labels, params, counts=counts, n_customers_total=agg[customer_col].nunique(),
+        )
+    return model
+
+
+def state_from_aggregated_parallel(agg: pd.DataFrame, customer_labels: pd.Index, customer_col: str,
+                                   params: ModelParams = ModelParams(), n_jobs: Optional[int] = None,
+                                   timings: Optional[dict] = None) -> ModelState:
+    """Como `fit_aggregated_parallel`, mas cada shard devolve só o resumo (`ModelState`), sem o painel.
+
+    Nᵢⱼ, contagens por mês e somas de reward são somados; é o caminho do lote,
+    onde o painel completo não é necessário.
+    """
+    with stage_timer(timings, "shards"):
+        customers = np.sort(select_customers(agg, customer_col, params.sample_n, params.seed))
+        states = _map_shards(_shard_state, agg, customer_col, customers, int(agg["_month_index"].max()), params,
+                             n_jobs, customer_labels)
+    with stage_timer(timings, "merge"):
+        state = merge_states(s for s in states if s is not None)
+        # como `n_customers_total` do ajuste: todos os clientes da entrada, inclusive fora da amostra
+        seen = pd.Index(customer_labels.astype(str).to_numpy()[agg[customer_col].unique()])
+        state.other_customers = seen[~seen.isin(state.customers["customer"])].to_numpy(dtype=object)
+    return state
+
+
+def fit_parallel(transactions: pd.DataFrame, customer_col: str, date_col: str, params: ModelParams = ModelParams(),
+                 n_jobs: Optional[int] = None, timings: Optional[dict] = None) -> MarkovChurnModel:
+    """`fit` em `n_jobs` processos (padrão: todos os núcleos)."""
+    with stage_timer(timings, "aggregate"):
+        agg, customer_labels = aggregate_monthly(
+            transactions, customer_col, date_col, use_revenue=params.use_revenue, neg_mode=params.neg_mode,
+        )
+    return fit_aggregated_parallel(agg, customer_labels, customer_col, params, n_jobs, timings)
@@ -0,0 +1,99 @@
+"""Score por cliente: churn em n meses e LTV esperado a partir do estado atual de cada cliente.
+
+A situação no último mês do painel (A/R/C) é um código por cliente; as
+probabilidades (Pⁿ)[i, C] e o LTV por estado são calculados uma vez (K valores,
+ou S × K com P por segmento) e cada cliente recebe o seu por indexação — um
+único lookup vetorizado, sem laço por cliente.
+"""
+import numpy as np
+import pandas as pd
+
+from .analytics import TRANSIENT
+from .horizon import STACK_MAX_HORIZON, horizon_engine
+from .panel import group_start_mask
+from .spectral import spectral_power
+from .states import STATE_C, STATES, decode_states
+
+K = len(STATES)
+
+
+def current_states(model) -> pd.DataFrame:
+    """Uma linha por cliente com o estado no último mês e os meses desde a última compra.
+
+    Aceita o modelo ajustado (última linha de cada cliente no painel) ou o
+    estado incremental (`ModelState.customers`). Colunas: `customer` (ID),
+    `customer_code` (código no modelo; -1 no estado incremental), `state` (código)
+    e `months_since_purchase`.
+    """
+    if hasattr(model, "panel"):
+        panel = model.panel
+        codes = panel[model.customer_col].to_numpy()
+        last = np.roll(group_start_mask(codes), -1)  # última linha de cada cliente
+        return pd.DataFrame({
+            "customer": model.customer_labels.astype(str).to_numpy()[codes[last]],
+            "customer_code": codes[last],
+            "state": panel["state"].to_numpy()[last],
+            "months_since_purchase": panel["_months_since_purchase"].to_numpy()[last],
+        })
+    cust = model.customers
+    return pd.DataFrame({
+        "customer": cust["customer"].astype(str).to_numpy(),
+        "customer_code": np.full(len(cust), -1),
+        "state": cust["state"].to_numpy(),
+        "months_since_purchase": (model.end_month - cust["last_purchase_month"].to_numpy()).astype(np.int16),
+    })
+
+
+def _churn_by_state(P: np.ndarray, horizon: int) -> np.ndarray:
+    # (Pⁿ)[:, C]: da pilha até STACK_MAX_HORIZON, acima disso pela forma fechada
+    if horizon <= STACK_MAX_HORIZON:
+        return horizon_engine(P).power(horizon)[:, STATE_C]
+    return np.clip(spectral_power(P).power(horizon)[:, STATE_C], 0.0, 1.0)
+
+
+def _ltv_by_state(ltv) -> np.ndarray:
+    # LTV(A), LTV(R) -> K valores com LTV(C) = 0 (em lote: (S, 2) -> (S, K)); None (C não absorvente) -> NaN
+    if ltv is None:
+        return np.full(K, np.nan)
+    ltv = np.asarray(ltv, dtype=float)
+    out = np.zeros(ltv.shape[:-1] + (K,))
+    out[..., list(TRANSIENT)] = ltv
+    return out
+
+
+def score_customers(model, horizon: int = 12, discount: float = 0.98, remove_negative: bool = True,
+                    segments=None) -> pd.DataFrame:
+    """Churn em `horizon` meses e LTV esperado para cada cliente, pelo estado atual.
+
+    Com `segments` (`SegmentModel` do mesmo modelo), cada cliente usa a P do seu
+    segmento; clientes sem segmento (ou sem transições do seu estado no segmento)
+    ficam com a P global, e LTV não finito no segmento cai no LTV global.
+    """
+    horizon = int(horizon)
+    if horizon < 0:
+        raise ValueError("horizonte precisa ser >= 0")
+    cur = current_states(model)
+    state = cur["state"].to_numpy().astype(np.int64)
+
+    churn = _churn_by_state(model.P, horizon)[state]
+    ltv = _ltv_by_state(model.ltv(discount=discount, remove_negative=remove_negative))[state]
+
+    out = pd.DataFrame({
+        model.customer_col: cur["customer"].to_numpy(),
+        "state": decode_states(state),
+        "months_since_purchase": cur["months_since_purchase"].to_numpy(),
+    })
+    if segments is not None:
+        if segments.customer_segment is None or (cur["customer_code"].to_numpy() < 0).any():
+            raise ValueError("score por segmento requer o modelo ajustado (com painel) usado nos segmentos")
+        seg = segments.customer_segment[cur["customer_code"].to_numpy()]
+        use = seg >= 0
+        # estado sem nenhuma transição observada no segmento: fica com a P global
+        use[use] = segments.Nij[seg[use], state[use]].sum(axis=-1) > 0
+        churn[use] = segments.power(horizon)[seg[use], state[use], STATE_C]
+        seg_ltv = _ltv_by_state(segments.ltv(discount, remove_negative))[seg[use], state[use]]
+        ltv[use] = np.where(np.isnan(seg_ltv), ltv[use], seg_ltv)
+        out.insert(1, "segment", pd.Categorical.from_codes(seg, categories=segments.labels))
+    out[f"churn_{horizon}m"] = churn
+    out["ltv"] = ltv
+    return out
@@ -0,0 +1,238 @@
+"""Matrizes P por segmento (país, canal, coorte de aquisição) num tensor (segmentos × K × K).
+
+Cada cliente recebe um segmento e as linhas do painel herdam o segmento do
+cliente: todas as contagens saem de um único `np.bincount`. Normalização das
+linhas, C absorvente, Pⁿ, tempo até churn e LTV são calculados em lote sobre o
+eixo dos segmentos, sem laço em Python por segmento.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .analytics import (
+    TRANSIENT, TTC_MAX_MONTHS, TTC_QUANTILES, absorption_survival, absorption_time_moments, solve_batched,
+    survival_quantiles,
+)
+from .engine import MarkovChurnModel, ModelParams
+from .panel import month_index_to_timestamp
+from .states import CUSTOMER_DTYPE, STATE_C, STATES, encode_customers
+from .transitions import matrix_frame, segment_transition_counts, transition_matrix
+
+K = len(STATES)
+COHORT_SEGMENT = "_cohort"  # segmento = coorte de aquisição (mês da 1ª compra)
+
+
+def customer_segments(transactions: pd.DataFrame, customer_col: str, segment_col: str, customer_labels: pd.Index):
+    """Segmento de cada cliente a partir de uma coluna das transações.
+
+    Cliente com mais de um valor fica com o mais frequente (empate: menor rótulo).
+    Retorna (segmento por código de cliente, rótulos dos segmentos); -1 = sem segmento.
+    """
+    codes, labels = encode_customers(transactions[customer_col])
+    to_model = pd.Index(customer_labels).get_indexer(labels)  # códigos locais -> códigos do modelo
+    customer = np.where(codes >= 0, to_model[codes], -1)
+    segment, segment_labels = encode_customers(transactions[segment_col])
+
+    keep = (customer >= 0) & (segment >= 0)
+    pairs, n = np.unique(customer[keep].astype(np.int64) * len(segment_labels) + segment[keep], return_counts=True)
+    pair_customer, pair_segment = np.divmod(pairs, len(segment_labels))
+    # por cliente, o par mais frequente (e o menor segmento no empate) fica em 1º
+    order = np.lexsort((pair_segment, -n, pair_customer))
+    first = order[np.r_[True, pair_customer[order][1:] != pair_customer[order][:-1]]] if len(order) else order
+
+    out = np.full(len(customer_labels), -1, dtype=CUSTOMER_DTYPE)
+    out[pair_customer[first]] = pair_segment[first]
+    return out, pd.Index(segment_labels.astype(str), name=segment_col)
+
+
+def cohort_segments(panel: pd.DataFrame, customer_col: str, n_customers: int):
+    # coorte = mês da 1ª compra (1ª linha de cada cliente no painel); rótulos AAAA-MM
+    first = panel.groupby(customer_col, sort=False)["_month_index"].min()
+    months, segment = np.unique(first.to_numpy(), return_inverse=True)
+    out = np.full(n_customers, -1, dtype=CUSTOMER_DTYPE)
+    out[first.index.to_numpy()] = segment
+    labels = pd.DatetimeIndex(month_index_to_timestamp(months)).strftime("%Y-%m")
+    return out, pd.Index(labels, name="coorte")
+
+
+@dataclass
+class SegmentModel:
+    """Nᵢⱼ e P de todos os segmentos: tensores (S, K, K), mais clientes e somas de reward por segmento."""
+
+    params: ModelParams
+    segment_col: str
+    labels: pd.Index  # rótulo de cada segmento (eixo 0 dos tensores)
+    Nij: np.ndarray  # (S, K, K)
+    P: np.ndarray  # (S, K, K), estimada uma vez em `fit_segments`
+    n_customers: np.ndarray  # (S,)
+    reward_sum: np.ndarray  # (2, S, K): soma da métrica por estado [todas, só >= 0]
+    reward_rows: np.ndarray  # (2, S, K): nº de linhas cliente-mês por estado [todas, só >= 0]
+    states: tuple = STATES
+    customer_segment: np.ndarray = None  # segmento de cada código de cliente do modelo (-1 = nenhum)
+
+    @property
+    def n_segments(self) -> int:
+        return len(self.labels)
+
+    def segment_index(self, segment) -> int:
+        return self.labels.get_loc(str(segment))
+
+    def P_frame(self, segment) -> pd.DataFrame:
+        return matrix_frame(self.P[self.segment_index(segment)], self.states)
+
+    def P_long(self) -> pd.DataFrame:
+        # tensor P em formato longo: linhas (segmento, estado), colunas = próximo estado
+        index = pd.MultiIndex.from_product([self.labels, list(self.states)], names=[self.labels.name, "state"])
+        return pd.DataFrame(self.P.reshape(-1, len(self.states)), index=index,
+                            columns=pd.Index(list(self.states), name="next_state"))
+
+    @property
+    def is_absorbing(self) -> np.ndarray:
+        P = self.P
+        others = P[:, STATE_C].sum(axis=-1) - P[:, STATE_C, STATE_C]
+        return np.isclose(others, 0.0) & np.isclose(P[:, STATE_C, STATE_C], 1.0)
+
+    def power(self, n: int) -> np.ndarray:
+        # Pⁿ de todos os segmentos, (S, K, K)
+        return np.linalg.matrix_power(self.P, int(n))
+
+    def churn_probability(self, n: int, start_state: str = "A") -> np.ndarray:
+        return self.power(n)[:, self.states.index(start_state), STATE_C]
+
+    def churn_curve(self, horizon: int, start_state: str = "A") -> np.ndarray:
+        # (Pⁿ)[start, C] para n = 1..horizon, shape (S, horizon): propaga só a linha do estado inicial
+        P = self.P
+        row = P[:, self.states.index(start_state)]
+        curve = np.empty((len(P), int(horizon)))
+        for n in range(int(horizon)):
+            curve[:, n] = row[:, STATE_C]
+            row = np.einsum("sk,skj->sj", row, P)
+        return curve
+
+    def rewards(self, remove_negative: bool = True) -> np.ndarray:
+        # mesma regra de `reward_by_state`, por segmento: (S, K), reward(C) = 0
+        row = 1 if remove_negative else 0
+        rewards = np.divide(self.reward_sum[row], self.reward_rows[row],
+                            out=np.zeros(self.reward_sum[row].shape), where=self.reward_rows[row] > 0)
+        rewards[:, STATE_C] = 0.0
+        return rewards
+
+    def _transient_system(self, discount: float = 1.0) -> np.ndarray:
+        t = list(TRANSIENT)
+        Q = self.P[:, t][:, :, t]
+        return np.eye(len(t)) - discount * Q
+
+    def time_to_churn(self) -> np.ndarray:
+        """Tempo médio até churn (S, 2) para A e R; NaN se C não é absorvente ou I − Q é singular."""
+        t = solve_batched(self._transient_system(), np.ones((self.n_segments, len(TRANSIENT))))
+        t[~self.is_absorbing] = np.nan
+        return t
+
+    def time_to_churn_survival(self, tol: float = 1e-9, max_months: int = TTC_MAX_MONTHS) -> np.ndarray:
+        """P(T > n) por segmento e estado inicial, (S, 2, n_max + 1); NaN onde C não é absorvente."""
+        t = list(TRANSIENT)
+        absorbing = self.is_absorbing
+        S = absorption_survival(self.P[absorbing][:, t][:, :, t], tol, max_months)
+        out = np.full((self.n_segments, len(t), S.shape[-1]), np.nan)
+        out[absorbing] = S
+        return out
+
+    def time_to_churn_summary(self, quantiles=TTC_QUANTILES, tol: float = 1e-9,
+                              max_months: int = TTC_MAX_MONTHS) -> pd.DataFrame:
+        """Média, variância e percentis do tempo até churn, uma linha por (segmento, estado inicial)."""
+        t = list(TRANSIENT)
+        mean, var = absorption_time_moments(self.P[:, t][:, :, t])
+        mean[~self.is_absorbing] = np.nan
+        var[~self.is_absorbing] = np.nan
+        pct = survival_quantiles(self.time_to_churn_survival(tol, max_months), quantiles)
+        index = pd.MultiIndex.from_product([self.labels, [self.states[i] for i in t]],
+                                           names=[self.labels.name, "state"])
+        out = pd.DataFrame({"media": mean.ravel(), "variancia": var.ravel(), "desvio_padrao": np.sqrt(var.ravel())},
+                           index=index)
+        for j, q in enumerate(quantiles):
+            out[f"p{100 * q:g}"] = pct[..., j].ravel()
+        return out
+
+    def ltv(self, discount: float = 0.98, remove_negative: bool = True) -> np.ndarray:
+        """LTV descontado (S, 2) para A e R; NaN nos mesmos casos de `time_to_churn`."""
+        rewards = self.rewards(remove_negative)[:, list(TRANSIENT)]
+        V = solve_batched(self._transient_system(discount), rewards)
+        V[~self.is_absorbing] = np.nan
+        return V
+
+    def leaderboard(self, horizon: int = 12, discount: float = 0.98, remove_negative: bool = True) -> pd.DataFrame:
+        """Uma linha por segmento (ordenada pelo churn em `horizon` meses a partir de A)."""
+        P = self.P
+        churn_h = self.power(horizon)[:, list(TRANSIENT), STATE_C]
+        ttc = self.time_to_churn()
+        ttc_median = survival_quantiles(self.time_to_churn_survival(), (0.5,))[..., 0]
+        ltv = self.ltv(discount, remove_negative)
+        board = pd.DataFrame({
+            "clientes": self.n_customers,
+            "transicoes": self.Nij.sum(axis=(1, 2)),
+            "P(A→C)": P[:, 0, STATE_C],
+            "P(R→C)": P[:, 1, STATE_C],
+            f"churn_{horizon}m_A": churn_h[:, 0],
+            f"churn_{horizon}m_R": churn_h[:, 1],
+            "tempo_ate_churn_A": ttc[:, 0],
+            "tempo_ate_churn_R": ttc[:, 1],
+            "tempo_ate_churn_p50_A": ttc_median[:, 0],
+            "tempo_ate_churn_p50_R": ttc_median[:, 1],
+            "ltv_A": ltv[:, 0],
+            "ltv_R": ltv[:, 1],
+        }, index=self.labels)
+        return board.sort_values(f"churn_{horizon}m_A", ascending=False, kind="stable")
+
+
+def fit_segments(model: MarkovChurnModel, segments: np.ndarray, labels: pd.Index,
+                 segment_col: str = COHORT_SEGMENT) -> SegmentModel:
+    """Tensor de Nᵢⱼ por segmento a partir do painel do modelo global (um único bincount).
+
+    `segments[código do cliente]` é o código do segmento (-1 = fora de todos).
+    """
+    panel = model.panel
+    segments = np.asarray(segments)
+    n_segments = len(labels)
+    seg_row = segments[panel[model.customer_col].to_numpy()]
+    state = panel["state"].to_numpy()
+    Nij = segment_transition_counts(seg_row, state, panel["next_state"].to_numpy(), n_segments, K)
+
+    customers = np.unique(panel[model.customer_col].to_numpy())
+    seg_customers = segments[customers]
+    n_customers = np.bincount(seg_customers[seg_customers >= 0], minlength=n_segments)
+
+    metric = "revenue" if (model.params.use_revenue and "revenue" in panel.columns) else "total_purchases"
+    values = panel[metric].to_numpy(dtype=float)
+    valid = seg_row >= 0
+    key = seg_row[valid].astype(np.int64) * K + state[valid]
+    values = values[valid]
+    # [todas as linhas, só revenue >= 0] (com nº de compras, as duas são iguais)
+    keep = [np.ones(len(key), dtype=bool), values >= 0 if metric == "revenue" else np.ones(len(key), dtype=bool)]
+    size = n_segments * K
+    reward_sum = np.stack([np.bincount(key[m], weights=values[m], minlength=size) for m in keep])
+    reward_rows = np.stack([np.bincount(key[m], minlength=size) for m in keep])
+
+    return SegmentModel(
+        params=model.params,
+        segment_col=segment_col,
+        labels=pd.Index(labels.astype(str), name=labels.name or segment_col),
+        Nij=Nij,
+        P=transition_matrix(Nij, force_absorb=model.params.force_absorb),
+        n_customers=n_customers,
+        reward_sum=reward_sum.reshape(2, n_segments, K),
+        reward_rows=reward_rows.reshape(2, n_segments, K),
+        customer_segment=segments,
+    )
+
+
+def segment_model(model: MarkovChurnModel, segment_col: str = COHORT_SEGMENT,
+                  transactions: pd.DataFrame = None) -> SegmentModel:
+    """P por segmento: coorte de aquisição (`COHORT_SEGMENT`) ou uma coluna de `transactions` (país, canal...)."""
+    if segment_col == COHORT_SEGMENT:
+        segments, labels = cohort_segments(model.panel, model.customer_col, len(model.customer_labels))
+    else:
+        if transactions is None or segment_col not in transactions.columns:
+            raise KeyError(f"coluna de segmento não encontrada nas transações: {segment_col!r}")
+        segments, labels = customer_segments(transactions, model.customer_col, segment_col, model.customer_labels)
+    return fit_segments(model, segments, labels, segment_col)
@@ -0,0 +1,131 @@
+"""Simulação Monte Carlo da base atual: distribuição (não só a média π₀Pⁿ) de churn e receita por mês.
+
+Na cadeia, clientes no mesmo estado são intercambiáveis (mesma linha de P):
+sortear a trajetória de cada cliente e contar quantos foram de i para j tem a
+mesma distribuição que sortear, por estado, uma multinomial(nᵢ, P[i]). Então
+cada caminho da base inteira custa K sorteios por mês, qualquer que seja o nº
+de clientes. Os caminhos saem em lotes (um sorteio vetorizado por estado e mês
+para o lote todo) e os lotes podem ser divididos num pool de processos. Cada
+lote tem a sua semente, derivada de `seed`, então o resultado não depende de
+`n_jobs`.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from .parallel import default_jobs
+from .scoring import current_states
+from .states import STATE_C, STATES
+
+K = len(STATES)
+SIMULATION_BATCH_PATHS = 2_000  # caminhos por lote (cada lote = uma semente e uma tarefa do pool)
+
+
+def initial_counts(model) -> np.ndarray:
+    # clientes por estado no último mês (modelo ajustado ou estado incremental)
+    return np.bincount(current_states(model)["state"].to_numpy().astype(np.int64), minlength=K)
+
+
+def _simulation_matrix(P: np.ndarray) -> np.ndarray:
+    # estado sem transições observadas (linha zerada) fica parado; linhas renormalizadas contra arredondamento
+    P = np.array(P, dtype=float)
+    empty = P.sum(axis=1) <= 0
+    P[empty, np.flatnonzero(empty)] = 1.0
+    return P / P.sum(axis=1, keepdims=True)
+
+
+def simulate_counts(P: np.ndarray, counts0: np.ndarray, horizon: int, n_paths: int, seed_seq):
+    """`n_paths` caminhos da base: (clientes por estado (caminhos, H+1, K), novos churns por mês (caminhos, H))."""
+    rng = np.random.default_rng(seed_seq)
+    counts = np.tile(np.asarray(counts0, dtype=np.int64), (n_paths, 1))
+    state_counts = np.empty((n_paths, horizon + 1, K), dtype=np.int64)
+    new_churn = np.zeros((n_paths, horizon), dtype=np.int64)
+    state_counts[:, 0] = counts
+    for t in range(horizon):
+        nxt = np.zeros_like(counts)
+        for i in range(K):
+            moved = rng.multinomial(counts[:, i], P[i])  # (caminhos, K): destinos de quem estava em i
+            nxt += moved
+            if i != STATE_C:
+                new_churn[:, t] += moved[:, STATE_C]
+        counts = nxt
+        state_counts[:, t + 1] = counts
+    return state_counts, new_churn
+
+
+@dataclass
+class SimulationResult:
+    """Caminhos simulados da base: clientes por estado e novos churns por mês, com o reward de cada estado."""
+
+    n_paths: int
+    seed: int
+    horizon: int
+    rewards: np.ndarray  # (K,): reward médio mensal por estado (C = 0)
+    state_counts: np.ndarray  # (caminhos, H+1, K); mês 0 = base atual
+    new_churn: np.ndarray  # (caminhos, H): clientes que entraram em C no mês n
+
+    @property
+    def revenue(self) -> np.ndarray:
+        # (caminhos, H): receita esperada no mês n dado o nº de clientes em cada estado
+        return self.state_counts[:, 1:] @ self.rewards
+
+    def _paths(self) -> dict:
+        return {
+            "clientes_C": self.state_counts[:, 1:, STATE_C],
+            "novos_churn": self.new_churn,
+            "receita": self.revenue,
+        }
+
+    def monthly(self, quantiles=(0.05, 0.5, 0.95)) -> pd.DataFrame:
+        """Uma linha por mês n = 1..H: média e quantis de clientes em C, novos churns e receita."""
+        cols = {}
+        for name, values in self._paths().items():
+            cols[f"{name}_media"] = values.mean(axis=0)
+            for q, v in zip(quantiles, np.quantile(values, quantiles, axis=0)):
+                cols[f"{name}_p{100 * q:g}"] = v
+        return pd.DataFrame(cols, index=pd.Index(np.arange(1, self.horizon + 1), name="n_meses"))
+
+    def totals(self, quantiles=(0.05, 0.5, 0.95)) -> pd.DataFrame:
+        """Acumulado no horizonte (novos churns, receita) e clientes em C no fim: média e quantis."""
+        paths = self._paths()
+        totals = {
+            "novos_churn_total": paths["novos_churn"].sum(axis=1),
+            "receita_total": paths["receita"].sum(axis=1),
+            "clientes_C_final": paths["clientes_C"][:, -1],
+        }
+        rows = {name: [v.mean(), *np.quantile(v, quantiles)] for name, v in totals.items()}
+        columns = ["media"] + [f"p{100 * q:g}" for q in quantiles]
+        return pd.DataFrame.from_dict(rows, orient="index", columns=columns).rename_axis("metrica")
+
+
+def simulate(model, n_paths: int = 1000, horizon: int = 12, seed: int = 42, remove_negative: bool = True,
+             n_jobs: int = 1) -> SimulationResult:
+    """Simula `n_paths` caminhos da base atual por `horizon` meses (lotes em `n_jobs` processos; 0/None = todos)."""
+    if n_paths < 1:
+        raise ValueError("n_paths precisa ser >= 1")
+    if horizon < 1:
+        raise ValueError("horizonte precisa ser >= 1")
+    P = _simulation_matrix(model.P)
+    counts0 = initial_counts(model)
+    rewards = model.rewards(remove_negative).to_numpy(dtype=float)
+
+    sizes = [min(SIMULATION_BATCH_PATHS, n_paths - lo) for lo in range(0, n_paths, SIMULATION_BATCH_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    n_jobs = max(int(n_jobs or default_jobs()), 1)
+    if n_jobs == 1 or len(sizes) == 1:
+        batches = [simulate_counts(P, counts0, horizon, b, s) for b, s in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(sizes))) as pool:
+            batches = list(pool.map(simulate_counts, repeat(P), repeat(counts0), repeat(horizon), sizes, seeds))
+
+    return SimulationResult(
+        n_paths=n_paths,
+        seed=seed,
+        horizon=horizon,
+        rewards=rewards,
+        state_counts=np.concatenate([b[0] for b in batches]),
+        new_churn=np.concatenate([b[1] for b in batches]),
+    )
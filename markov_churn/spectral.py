@@ -0,0 +1,114 @@
+"""Pⁿ em forma fechada para n arbitrário (milhares de meses ou fracionário), em tempo constante.
+
+P é decomposta uma vez e cada Pⁿ custa o mesmo para qualquer n:
+- autovalores: P = V diag(λ) V⁻¹  ⇒  Pⁿ = V diag(λⁿ) V⁻¹, quando V é bem condicionada;
+- senão (P defeituosa ou quase), forma canônica da cadeia absorvente (a mesma
+  Q/R da seção 5): P = [[Q, R], [0, 1]]  ⇒  Pⁿ = [[Qⁿ, (I − Q)⁻¹(I − Qⁿ)R], [0, 1]],
+  com Qⁿ 2×2 pela fórmula de Sylvester, que cobre autovalor repetido (bloco de Jordan);
+- sem nenhuma das duas, potência inteira por quadrados (`matrix_power`).
+"""
+import numpy as np
+
+from .analytics import is_absorbing
+from .horizon import horizon_engine, matrix_cached
+from .states import STATE_C
+
+EIGEN_MAX_COND = 1e8  # condicionamento máximo de V para usar a decomposição espectral
+CHECK_TOL = 1e-9  # tolerância das conferências numéricas
+IMAG_TOL = 1e-9  # parte imaginária residual aceita ao voltar para real
+
+
+def _real(M):
+    M = np.asarray(M)
+    if np.iscomplexobj(M):
+        if np.abs(M.imag).max(initial=0.0) > IMAG_TOL:
+            raise ValueError("Pⁿ com n fracionário não é real para esta P (autovalor negativo ou complexo)")
+        return M.real
+    return M
+
+
+def power_2x2(Q: np.ndarray, n: float) -> np.ndarray:
+    """Qⁿ de uma matriz 2×2 pela fórmula de Sylvester (autovalores iguais: forma de Jordan)."""
+    Q = np.asarray(Q, dtype=float)
+    I = np.eye(2)
+    half_tr = np.trace(Q) / 2
+    disc = complex(half_tr * half_tr - np.linalg.det(Q))
+    if abs(disc) <= 1e-14 * max(1.0, half_tr * half_tr):
+        # λ repetido: Qⁿ = λⁿ⁻¹ (nQ − (n − 1)λI)
+        lam = complex(half_tr)
+        if lam == 0:
+            return I if n == 0 else (Q if n == 1 else np.zeros((2, 2)))
+        return _real(lam ** (n - 1) * (n * Q - (n - 1) * lam * I))
+    s = np.sqrt(disc)
+    l1, l2 = half_tr + s, half_tr - s
+    return _real((l1 ** n * (Q - l2 * I) - l2 ** n * (Q - l1 * I)) / (l1 - l2))
+
+
+class SpectralPower:
+    """Decomposição única de P; `power(n)` e `entry(i, j, n)` em tempo constante em n."""
+
+    def __init__(self, P: np.ndarray, absorbing_state: int = STATE_C):
+        self.P = np.array(P, dtype=float)
+        k = self.P.shape[0]
+        self.method = "power"
+
+        w, V = np.linalg.eig(self.P)
+        if np.linalg.cond(V) < EIGEN_MAX_COND:
+            V_inv = np.linalg.inv(V)
+            if np.allclose((V * w) @ V_inv, self.P, atol=CHECK_TOL):
+                self.method = "eigen"
+                self._w = w.astype(complex)
+                self._V = V.astype(complex)
+                self._V_inv = V_inv.astype(complex)
+                return
+
+        transient = [i for i in range(k) if i != absorbing_state]
+        if len(transient) == 2 and is_absorbing(self.P, absorbing_state):
+            Q = self.P[np.ix_(transient, transient)]
+            if abs(np.linalg.det(np.eye(2) - Q)) > CHECK_TOL:  # algum transitório nunca absorve: sem forma canônica
+                self.method = "canonical"
+                self._transient = transient
+                self._absorbing = absorbing_state
+                self._Q = Q
+                self._N = np.linalg.inv(np.eye(2) - Q)  # matriz fundamental
+                self._R = self.P[transient, absorbing_state]
+
+    def power(self, n: float) -> np.ndarray:
+        n = self._check_n(n)
+        if self.method == "eigen":
+            return _real((self._V * self._w ** n) @ self._V_inv)
+        if self.method == "canonical":
+            t, c = self._transient, self._absorbing
+            Qn = power_2x2(self._Q, n)
+            Pn = np.zeros_like(self.P)
+            Pn[np.ix_(t, t)] = Qn
+            Pn[t, c] = self._N @ (np.eye(2) - Qn) @ self._R  # Σₖ₌₀ⁿ⁻¹ Qᵏ R
+            Pn[c, c] = 1.0
+            return Pn
+        if not float(n).is_integer():
+            raise ValueError("P sem decomposição estável: só potências inteiras")
+        return np.linalg.matrix_power(self.P, int(n))
+
+    def entry(self, i: int, j: int, n: float) -> float:
+        # (Pⁿ)[i, j]; no caminho espectral é Σₖ V[i,k] λₖⁿ V⁻¹[k,j] (O(K), sem montar Pⁿ)
+        if self.method == "eigen":
+            n = self._check_n(n)
+            return float(_real(np.sum(self._V[i] * self._w ** n * self._V_inv[:, j])))
+        return float(self.power(n)[i, j])
+
+    def check(self, horizon: int = 240) -> float:
+        """Maior erro absoluto contra a multiplicação repetida (pilha P⁰..Pᴴ)."""
+        stack = horizon_engine(self.P).stack(horizon)
+        return float(max(np.abs(self.power(n) - stack[n]).max() for n in range(horizon + 1)))
+
+    @staticmethod
+    def _check_n(n: float) -> float:
+        n = float(n)
+        if n < 0 or not np.isfinite(n):
+            raise ValueError("n precisa ser finito e >= 0")
+        return int(n) if n.is_integer() else n
+
+
+def spectral_power(P: np.ndarray) -> SpectralPower:
+    """Decomposição compartilhada para esta P (feita uma vez por matriz)."""
+    return matrix_cached(SpectralPower, P)
@@ -0,0 +1,40 @@
+"""Memoização por etapa do pipeline: carga → agregação → painel → estados → transições → P → análises.
+
+Cada etapa guarda o último resultado junto com a chave que o gerou: a chave da
+etapa de cima mais os parâmetros da própria etapa (`stage_key`). Num rerun com
+a mesma chave o resultado guardado volta sem recálculo. Mudar um parâmetro muda
+a chave da etapa que o usa e, em cascata, a de todas as etapas abaixo dela; as
+de cima continuam válidas.
+"""
+import hashlib
+import time
+
+
+def stage_key(*parts) -> str:
+    """Chave curta e determinística para a etapa (hash do `repr` da chave de cima + parâmetros)."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+class StageCache:
+    """Último resultado de cada etapa, com a chave que o gerou (uma entrada por etapa)."""
+
+    def __init__(self):
+        self._entries = {}  # etapa -> (chave, resultado)
+        self.last_run = {}  # etapa -> (reaproveitada?, segundos) da última chamada
+
+    def run(self, stage: str, key: str, compute, *args, **kwargs):
+        """Resultado de `compute(*args, **kwargs)` para `key`; recalcula só se a chave da etapa mudou."""
+        entry = self._entries.get(stage)
+        if entry is not None and entry[0] == key:
+            self.last_run[stage] = (True, 0.0)
+            return entry[1]
+        self._entries.pop(stage, None)  # libera o resultado antigo antes de calcular o novo
+        t0 = time.perf_counter()
+        value = compute(*args, **kwargs)
+        self._entries[stage] = (key, value)
+        self.last_run[stage] = (False, time.perf_counter() - t0)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.last_run.clear()
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+# estados carregados como códigos int8 no pipeline; rótulos só na exibição
+STATES = ("A", "R", "C")
+STATE_A, STATE_R, STATE_C = 0, 1, 2
+NO_STATE = -1  # sem estado (ex.: next_state na última linha do cliente)
+
+STATE_DTYPE = np.int8
+CUSTOMER_DTYPE = np.int32
+
+
+def decode_states(codes) -> pd.Categorical:
+    # códigos -> rótulos A/R/C (NO_STATE vira NaN)
+    return pd.Categorical.from_codes(np.asarray(codes, dtype=np.int64), categories=list(STATES))
+
+
+def encode_customers(values):
+    """Fatoriza IDs de cliente em códigos int32 (ordem lexicográfica dos rótulos).
+
+    Retorna (códigos, rótulos); `rótulos[código]` devolve o ID original. Colunas
+    category reaproveitam os códigos já existentes.
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        cats = values.cat.categories
+        if cats.is_monotonic_increasing:
+            return values.cat.codes.to_numpy().astype(CUSTOMER_DTYPE), pd.Index(cats)
+    codes, labels = pd.factorize(values.astype(str).where(values.notna()), sort=True)
+    return codes.astype(CUSTOMER_DTYPE), pd.Index(labels)
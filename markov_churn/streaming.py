@@ -0,0 +1,99 @@
+"""Ajuste fora da memória: o arquivo é lido em blocos e só a agregação cliente-mês fica em RAM.
+
+Cada bloco é agregado por cliente × mês (`aggregate_monthly`) e somado num
+acumulador compacto; o DataFrame de transações inteiro nunca existe. O pico de
+memória fica limitado pelo nº de pares cliente-mês (mais um bloco), não pelo nº
+de linhas do arquivo. A ordem das linhas (por data ou não) não importa.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .engine import MarkovChurnModel, ModelParams, fit_aggregated, stage_timer
+from .io import iter_transaction_chunks
+from .panel import aggregate_monthly, month_index_to_timestamp
+from .states import CUSTOMER_DTYPE
+
+
+class MonthlyAccumulator:
+    """Soma de revenue e nº de compras por cliente × mês, alimentada bloco a bloco."""
+
+    def __init__(self, customer_col: str, date_col: str, use_revenue: bool = True, neg_mode: str = "keep",
+                 compact_rows: int = 100_000):
+        self.customer_col = customer_col
+        self.date_col = date_col
+        self.use_revenue = use_revenue
+        self.neg_mode = neg_mode
+        self.compact_rows = int(compact_rows)
+        self.rows_read = 0
+        self._labels = pd.Index([], dtype=object)  # código global -> ID (ordem de chegada)
+        self._store = None  # agregação já compactada
+        self._pending = []  # agregações de blocos ainda não somadas ao store
+        self._pending_rows = 0
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        self.rows_read += len(chunk)
+        agg, labels = aggregate_monthly(chunk, self.customer_col, self.date_col,
+                                        use_revenue=self.use_revenue, neg_mode=self.neg_mode)
+        if agg.empty:
+            return
+
+        # códigos do bloco -> códigos globais (IDs novos entram no fim)
+        labels = pd.Index(labels.astype(str))
+        global_code = self._labels.get_indexer(labels)
+        if (global_code < 0).any():
+            self._labels = self._labels.append(labels[global_code < 0])
+            global_code = self._labels.get_indexer(labels)
+        agg[self.customer_col] = global_code[agg[self.customer_col].to_numpy()].astype(CUSTOMER_DTYPE)
+
+        self._pending.append(agg.drop(columns="month_ts"))
+        self._pending_rows += len(agg)
+        # compacta quando o pendente passa do tamanho do store: custo amortizado linear
+        if self._pending_rows > max(len(self._store) if self._store is not None else 0, self.compact_rows):
+            self._compact()
+
+    def _compact(self) -> None:
+        parts = ([self._store] if self._store is not None else []) + self._pending
+        if not parts:
+            return
+        self._store = (
+            pd.concat(parts, ignore_index=True)
+              .groupby([self.customer_col, "_month_index"], as_index=False, sort=False)
+              .agg(revenue=("revenue", "sum"), total_purchases=("total_purchases", "sum"))
+        )
+        self._pending = []
+        self._pending_rows = 0
+
+    @property
+    def nbytes(self) -> int:
+        store = int(self._store.memory_usage(deep=True).sum()) if self._store is not None else 0
+        return store + sum(int(p.memory_usage(deep=True).sum()) for p in self._pending)
+
+    def result(self):
+        """(agg, customer_labels) no mesmo formato de `aggregate_monthly`."""
+        self._compact()
+        if self._store is None:
+            raise ValueError("nenhuma transação válida (cliente e data) no arquivo")
+
+        # recodifica clientes na ordem lexicográfica dos IDs, como `encode_customers`
+        order = np.argsort(self._labels.to_numpy(dtype=object).astype(str), kind="stable")
+        rank = np.empty(len(order), dtype=CUSTOMER_DTYPE)
+        rank[order] = np.arange(len(order), dtype=CUSTOMER_DTYPE)
+        labels = pd.Index(self._labels[order])
+
+        agg = self._store.assign(**{self.customer_col: rank[self._store[self.customer_col].to_numpy()]})
+        agg = agg.sort_values([self.customer_col, "_month_index"], ignore_index=True)
+        agg.insert(2, "month_ts", month_index_to_timestamp(agg["_month_index"].to_numpy()))
+        return agg, labels
+
+
+def fit_streaming(path: str, customer_col: str, date_col: str, params: ModelParams = ModelParams(),
+                  chunk_rows: int = 1_000_000, date_range=None, timings: Optional[dict] = None) -> MarkovChurnModel:
+    """`fit_file` sem carregar o arquivo inteiro: leitura em blocos de `chunk_rows` linhas."""
+    acc = MonthlyAccumulator(customer_col, date_col, use_revenue=params.use_revenue, neg_mode=params.neg_mode)
+    with stage_timer(timings, "stream_aggregate"):
+        for chunk in iter_transaction_chunks(path, customer_col, date_col, chunk_rows, date_range=date_range):
+            acc.add(chunk)
+        agg, customer_labels = acc.result()
+    return fit_aggregated(agg, customer_labels, customer_col, params, timings=timings)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from .states import STATES
+
+
+def transition_counts(state, next_state, k: int = len(STATES)) -> np.ndarray:
+    """Matriz K×K de contagens Nᵢⱼ a partir de códigos de estado.
+
+    Cada par (i, j) vira o inteiro i*K + j e tudo é contado com um único
+    `np.bincount`. Pares com código negativo (sem próximo estado) são ignorados.
+    """
+    state = np.asarray(state)
+    next_state = np.asarray(next_state)
+    valid = (state >= 0) & (next_state >= 0)
+    pairs = state[valid].astype(np.int64) * k + next_state[valid]
+    return np.bincount(pairs, minlength=k * k).reshape(k, k)
+
+
+def segment_transition_counts(segment, state, next_state, n_segments: int, k: int = len(STATES)) -> np.ndarray:
+    """Tensor (segmentos × K × K) de contagens Nᵢⱼ, um por segmento, num único `np.bincount`.
+
+    Mesma ideia de `transition_counts` com a chave (s*K + i)*K + j; linhas com
+    segmento negativo (cliente sem segmento) são ignoradas.
+    """
+    segment = np.asarray(segment)
+    state = np.asarray(state)
+    next_state = np.asarray(next_state)
+    valid = (segment >= 0) & (state >= 0) & (next_state >= 0)
+    keys = (segment[valid].astype(np.int64) * k + state[valid]) * k + next_state[valid]
+    return np.bincount(keys, minlength=n_segments * k * k).reshape(n_segments, k, k)
+
+
+def month_counts(month, state, next_state, k: int = len(STATES)):
+    """Contagens por mês: (meses `_month_index`, transições (M, K, K) do mês m para m+1, linhas por estado (M, K)).
+
+    O mês faz o papel do segmento em `segment_transition_counts`; os estados por
+    mês saem de mais um `np.bincount`. Meses sem linhas entram zerados; painel
+    vazio (ex.: shard só com clientes sem compra positiva) dá zero meses.
+    """
+    month = np.asarray(month)
+    state = np.asarray(state)
+    if not len(month):
+        return np.arange(0), np.zeros((0, k, k), dtype=np.int64), np.zeros((0, k), dtype=np.int64)
+    start, end = int(month.min()), int(month.max())
+    n_months = end - start + 1
+    offset = (month - start).astype(np.int64)
+    transitions = segment_transition_counts(offset, state, next_state, n_months, k)
+    month_states = np.bincount(offset * k + state, minlength=n_months * k).reshape(n_months, k)
+    return np.arange(start, end + 1), transitions, month_states
+
+
+def counts_frame(counts: np.ndarray, states=STATES) -> pd.DataFrame:
+    # Nᵢⱼ com rótulos (linhas = estado atual, colunas = próximo estado)
+    return pd.DataFrame(
+        counts,
+        index=pd.Index(list(states), name="state"),
+        columns=pd.Index(list(states), name="next_state"),
+    )
+
+
+def transition_matrix(counts: np.ndarray, force_absorb: bool = True, absorbing_state: int = None) -> np.ndarray:
+    """P estimada por frequência relativa: p̂ᵢⱼ = Nᵢⱼ / Σₖ Nᵢₖ (linhas sem dados ficam 0).
+
+    Com `force_absorb`, a linha do estado absorvente (C por padrão) vira C→C = 1.
+    """
+    counts = np.asarray(counts, dtype=float)
+    row_sums = counts.sum(axis=-1, keepdims=True)
+    P = np.divide(counts, row_sums, out=np.zeros_like(counts), where=row_sums > 0)
+    if force_absorb:
+        c = counts.shape[-1] - 1 if absorbing_state is None else absorbing_state
+        P[..., c, :] = 0.0
+        P[..., c, c] = 1.0
+    return P
+
+
+def matrix_frame(P: np.ndarray, states=STATES) -> pd.DataFrame:
+    # P com rótulos (mesmo layout de Nᵢⱼ)
+    return pd.DataFrame(
+        P,
+        index=pd.Index(list(states), name="state"),
+        columns=pd.Index(list(states), name="next_state"),
+    )
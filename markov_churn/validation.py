@@ -0,0 +1,295 @@
+import math
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .panel import group_start_mask, month_index_to_timestamp, shift_in_group
+from .states import NO_STATE, STATES
+from .transitions import matrix_frame, month_counts, transition_counts, transition_matrix
+
+try:
+    from scipy.stats import chi2 as chi2_dist
+except ImportError:  # sem scipy: p-valor pela aproximação de Wilson–Hilferty
+    chi2_dist = None
+
+
+def build_P_from_panel(panel_df: pd.DataFrame, customer_col: str, states=STATES, force_absorb: bool = True) -> pd.DataFrame:
+    # próximo estado recalculado dentro do recorte (o último mês do recorte não tem próximo)
+    state_v = panel_df["state"].to_numpy()
+    next_v = shift_in_group(state_v, group_start_mask(panel_df[customer_col].to_numpy()), -1, fill=NO_STATE)
+    counts = transition_counts(state_v, next_v, len(states))
+    return matrix_frame(transition_matrix(counts, force_absorb=force_absorb), states)
+
+
+def month_dist(panel_df: pd.DataFrame, month_value, states=STATES) -> np.ndarray:
+    counts = np.bincount(panel_df.loc[panel_df["month_ts"] == month_value, "state"].to_numpy(), minlength=len(states))
+    return counts / counts.sum() if counts.sum() else counts.astype(float)
+
+
+def mae(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(np.abs(a - b)))
+
+
+def log_loss(y_true: np.ndarray, p_pred: np.ndarray, eps: float = 1e-15, weights=None) -> float:
+    # weights: nº de linhas por par (y, p) — mesmas métricas sobre contagens agregadas
+    p = np.clip(p_pred, eps, 1 - eps)
+    return float(np.average(-(y_true*np.log(p) + (1-y_true)*np.log(1-p)), weights=weights))
+
+
+def brier_score(y_true: np.ndarray, p_pred: np.ndarray, weights=None) -> float:
+    return float(np.average((p_pred - y_true)**2, weights=weights))
+
+
+def confusion_counts(y_true: np.ndarray, p_pred: np.ndarray, thr: float, weights=None):
+    w = np.ones(len(y_true), dtype=np.int64) if weights is None else np.asarray(weights)
+    y_hat = (p_pred >= thr).astype(int)
+    tp = int(w[(y_hat==1) & (y_true==1)].sum())
+    fp = int(w[(y_hat==1) & (y_true==0)].sum())
+    tn = int(w[(y_hat==0) & (y_true==0)].sum())
+    fn = int(w[(y_hat==0) & (y_true==1)].sum())
+    return tp, fp, tn, fn
+
+
+@dataclass
+class ThresholdSweep:
+    """Matriz de confusão em todos os limiares distintos (uma linha por limiar, do maior para o menor)."""
+
+    curve: pd.DataFrame  # threshold, tp, fp, tn, fn, tpr, fpr, precision, accuracy
+
+    def row(self, thr: float) -> pd.Series:
+        # linha da curva com previsão positiva se p >= thr: busca binária, sem recontar
+        thresholds = self.curve["threshold"].to_numpy()
+        return self.curve.iloc[np.searchsorted(-thresholds, -thr, side="right") - 1]
+
+    def at(self, thr: float):
+        # (tp, fp, tn, fn), mesmo formato de `confusion_counts`
+        r = self.row(thr)
+        return int(r.tp), int(r.fp), int(r.tn), int(r.fn)
+
+    @property
+    def auc(self) -> float:
+        # área sob a ROC (trapézios; empates de p viram um único ponto)
+        tpr, fpr = self.curve["tpr"].to_numpy(), self.curve["fpr"].to_numpy()
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    @property
+    def average_precision(self) -> float:
+        # área sob a curva precisão × recall: Σ (Δ recall) · precisão
+        recall = self.curve["tpr"].to_numpy()
+        return float(np.sum(np.diff(recall) * self.curve["precision"].to_numpy()[1:]))
+
+
+def threshold_sweep(y_true: np.ndarray, p_pred: np.ndarray, weights=None) -> ThresholdSweep:
+    """ROC, precisão × recall e confusão em cada limiar com uma ordenação e somas acumuladas (O(n log n))."""
+    y = np.asarray(y_true, dtype=float)
+    p = np.asarray(p_pred, dtype=float)
+    w = np.ones(len(y)) if weights is None else np.asarray(weights, dtype=float)
+    order = np.argsort(-p, kind="stable")
+    p, y, w = p[order], y[order], w[order]
+    last = np.r_[np.flatnonzero(np.diff(p)), len(p) - 1] if len(p) else np.array([], dtype=int)
+    # 1ª linha: limiar +inf (ninguém previsto como churn)
+    tp = np.r_[0.0, np.cumsum(w * y)[last]]
+    fp = np.r_[0.0, np.cumsum(w * (1 - y))[last]]
+    pos, neg = tp[-1], fp[-1]
+    curve = pd.DataFrame({
+        "threshold": np.r_[np.inf, p[last]],
+        "tp": tp,
+        "fp": fp,
+        "tn": neg - fp,
+        "fn": pos - tp,
+        "tpr": tp / pos if pos else np.zeros_like(tp),
+        "fpr": fp / neg if neg else np.zeros_like(fp),
+        "precision": np.divide(tp, tp + fp, out=np.ones_like(tp), where=(tp + fp) > 0),
+        "accuracy": (tp + neg - fp) / (pos + neg) if pos + neg else np.zeros_like(tp),
+    })
+    return ThresholdSweep(curve=curve)
+
+
+def reliability_curve(y_true: np.ndarray, p_pred: np.ndarray, weights=None, n_bins: int = 10) -> pd.DataFrame:
+    # por faixa de probabilidade prevista: p médio, taxa real e amostra (faixas vazias ficam de fora)
+    y = np.asarray(y_true, dtype=float)
+    p = np.asarray(p_pred, dtype=float)
+    w = np.ones(len(y)) if weights is None else np.asarray(weights, dtype=float)
+    bins = np.minimum((p * n_bins).astype(np.int64), n_bins - 1)
+    n = np.bincount(bins, weights=w, minlength=n_bins)
+    out = pd.DataFrame({
+        "faixa_inf": np.arange(n_bins) / n_bins,
+        "p_medio": np.bincount(bins, weights=w * p, minlength=n_bins) / np.where(n > 0, n, 1),
+        "taxa_real": np.bincount(bins, weights=w * y, minlength=n_bins) / np.where(n > 0, n, 1),
+        "amostra": n,
+    })
+    return out[n > 0].reset_index(drop=True)
+
+
+def l1_matrix_norm(Pa, Pb) -> float:
+    A = np.asarray(Pa, dtype=float)
+    B = np.asarray(Pb, dtype=float)
+    return float(np.mean(np.abs(A - B)))
+
+
+def month_tensors(panel_df: pd.DataFrame, k: int = len(STATES)):
+    """(meses, transições (M, K, K), estados (M, K)) de um painel ou recorte; o modelo ajustado já guarda os seus."""
+    return month_counts(panel_df["_month_index"].to_numpy(), panel_df["state"].to_numpy(),
+                        panel_df["next_state"].to_numpy(), k)
+
+
+def rolling_backtest(month_transitions: np.ndarray, month_states: np.ndarray, horizons=(1, 3, 6),
+                     window=None, min_train_months: int = 3, force_absorb: bool = True,
+                     months=None) -> pd.DataFrame:
+    """Backtest com origem móvel: para cada mês t, P treinada só com transições até t prevê π(t+h) = π(t)Pʰ.
+
+    `window=None` usa todo o histórico até t (janela expansiva); um inteiro usa
+    só os últimos `window` meses de transições. Cada janela sai de somas
+    acumuladas por mês (Nᵢⱼ da janela = acumulado[t] − acumulado[início]),
+    então o custo por origem é O(K²), sem remontar o painel. Retorna uma linha
+    por (origem, horizonte) com π previsto, π real e MAE; com `months`
+    (`_month_index` de cada mês), também o mês da origem (`mes_origem`).
+    """
+    n_months, k = month_states.shape
+    horizons = sorted({int(h) for h in horizons})
+    cum = np.concatenate([np.zeros((1, k, k)), np.cumsum(month_transitions, axis=0)])
+
+    # origem t: transições dos meses [lo, t) (todas com t como último mês observado)
+    origins = np.arange(min_train_months, n_months - horizons[0])
+    if not len(origins):
+        return pd.DataFrame(columns=["origem", "mes_origem", "horizonte", "mae"])
+    lo = np.zeros_like(origins) if window is None else np.maximum(origins - int(window), 0)
+    P = transition_matrix(cum[origins] - cum[lo], force_absorb=force_absorb)
+
+    totals = month_states.sum(axis=1, keepdims=True)
+    shares = np.divide(month_states, totals, out=np.zeros(month_states.shape), where=totals > 0)
+    pi = shares[origins]
+    frames = []
+    for h in range(1, horizons[-1] + 1):
+        pi = np.einsum("ok,okj->oj", pi, P)
+        if h not in horizons:
+            continue
+        ok = origins + h < n_months
+        real = shares[origins[ok] + h]
+        frames.append(pd.DataFrame({
+            "origem": origins[ok],
+            "horizonte": h,
+            **{f"prev_{s}": pi[ok, i] for i, s in enumerate(STATES)},
+            **{f"real_{s}": real[:, i] for i, s in enumerate(STATES)},
+            "mae": np.abs(pi[ok] - real).mean(axis=1),
+        }))
+    out = pd.concat(frames, ignore_index=True)
+    if months is not None:
+        out.insert(1, "mes_origem", month_index_to_timestamp(np.asarray(months)[out["origem"].to_numpy()]))
+    return out
+
+
+def history_counts(panel_df: pd.DataFrame, customer_col: str, order: int = 2, k: int = len(STATES)) -> np.ndarray:
+    """Tensor (K,)*(order+1) de contagens N[s(t−order+1), …, s(t), s(t+1)] num único `np.bincount`.
+
+    Os estados anteriores saem de `shift_in_group` aplicado em cadeia (painel
+    ordenado por cliente e mês); linhas sem histórico completo ou sem próximo
+    estado ficam de fora.
+    """
+    if order < 2:
+        raise ValueError("ordem precisa ser >= 2")
+    state = panel_df["state"].to_numpy()
+    start = group_start_mask(panel_df[customer_col].to_numpy())
+    cols = [state]
+    for _ in range(order - 1):
+        cols.insert(0, shift_in_group(cols[0], start, 1, fill=NO_STATE))
+    cols.append(panel_df["next_state"].to_numpy())
+    valid = np.logical_and.reduce([c != NO_STATE for c in cols])
+    key = np.zeros(int(valid.sum()), dtype=np.int64)
+    for c in cols:
+        key = key * k + c[valid]
+    return np.bincount(key, minlength=k ** (order + 1)).reshape((k,) * (order + 1))
+
+
+def chi2_sf(x, df) -> np.ndarray:
+    # P(χ²(df) > x); df = 0 -> NaN. Sem scipy, aproximação de Wilson–Hilferty
+    x = np.atleast_1d(np.asarray(x, dtype=float))
+    df = np.atleast_1d(np.asarray(df, dtype=float))
+    out = np.full(np.broadcast(x, df).shape, np.nan)
+    x, df = np.broadcast_arrays(x, df)
+    ok = df > 0
+    if chi2_dist is not None:
+        out[ok] = chi2_dist.sf(x[ok], df[ok])
+    else:
+        v = 2.0 / (9.0 * df[ok])
+        z = (np.cbrt(x[ok] / df[ok]) - (1.0 - v)) / np.sqrt(v)
+        out[ok] = [0.5 * math.erfc(zi / math.sqrt(2.0)) for zi in z]
+    return out
+
+
+@dataclass
+class OrderTestResult:
+    """Ordem r−1 (H₀) vs ordem r: razão de verossimilhança G², qui-quadrado de Pearson e tabelas por contexto."""
+
+    order: int
+    n: int  # transições com histórico completo (amostra efetiva do teste)
+    g2: float
+    chi2: float
+    df: int
+    p_value: float  # do G²
+    p_value_chi2: float
+    sparse_share: float  # fração das células com contagem esperada < 5 (χ² pouco confiável se alta)
+    contexts: pd.DataFrame  # um teste por histórico mantido em H₀ (ordem 2: estado atual)
+    histories: pd.DataFrame  # um vetor de próximo estado por histórico completo, vs o de H₀
+
+
+def markov_order_test(counts: np.ndarray, states=STATES) -> OrderTestResult:
+    """Testa se o estado mais antigo do histórico muda a distribuição do próximo estado.
+
+    `counts` vem de `history_counts(..., order=r)`. Em H₀ o próximo estado só
+    depende dos r−1 estados mais recentes: esperado Eₕₘⱼ = Nₕₘ· N·ₘⱼ / N·ₘ·, com
+    G² = 2 Σ N log(N/E) e gl = Σₘ (linhas observadas − 1)(colunas observadas − 1).
+    Tudo em arrays, sem laço por contexto.
+    """
+    counts = np.asarray(counts, dtype=float)
+    order = counts.ndim - 1
+    k = counts.shape[-1]
+    N = counts.reshape(k, -1, k)  # (estado mais antigo, histórico mantido em H₀, próximo estado)
+    row = N.sum(axis=2)  # (K, M)
+    col = N.sum(axis=0)  # (M, K)
+    tot = col.sum(axis=1)  # (M,)
+    E = np.divide(row[:, :, None] * col[None], tot[None, :, None], out=np.zeros_like(N), where=tot[None, :, None] > 0)
+    g2_cells = 2.0 * N * np.log(np.divide(N, E, out=np.ones_like(N), where=N > 0))
+    chi2_cells = np.divide((N - E) ** 2, E, out=np.zeros_like(N), where=E > 0)
+
+    df_ctx = np.maximum(((row > 0).sum(axis=0) - 1) * ((col > 0).sum(axis=1) - 1), 0)
+    g2_ctx = g2_cells.sum(axis=(0, 2))
+    chi2_ctx = chi2_cells.sum(axis=(0, 2))
+    g2, chi2, df = float(g2_ctx.sum()), float(chi2_ctx.sum()), int(df_ctx.sum())
+
+    names = [f"prev{lag}" if lag > 1 else "prev" for lag in range(order - 1, 0, -1)] + ["curr"]
+    labels = np.asarray(states)
+    ctx_codes = np.unravel_index(np.arange(N.shape[1]), (k,) * (order - 1))
+    contexts = pd.DataFrame({
+        **{name: labels[c] for name, c in zip(names[1:], ctx_codes)},
+        "amostra": tot.astype(np.int64),
+        "G2": g2_ctx,
+        "chi2": chi2_ctx,
+        "gl": df_ctx,
+        "p_valor": chi2_sf(g2_ctx, df_ctx),
+    })[tot > 0].reset_index(drop=True)
+
+    p1 = np.divide(col, tot[:, None], out=np.zeros_like(col), where=tot[:, None] > 0)
+    p2 = np.divide(N, row[:, :, None], out=np.zeros_like(N), where=row[:, :, None] > 0)
+    hist_codes = np.unravel_index(np.arange(N.shape[0] * N.shape[1]), (k,) * order)
+    histories = pd.DataFrame({
+        **{name: labels[c] for name, c in zip(names, hist_codes)},
+        "amostra": row.ravel().astype(np.int64),
+        "div_L1_media": np.abs(p2 - p1[None]).mean(axis=2).ravel(),
+        "G2": g2_cells.sum(axis=2).ravel(),
+    })[row.ravel() > 0].reset_index(drop=True)
+
+    observed = E > 0
+    return OrderTestResult(
+        order=order,
+        n=int(counts.sum()),
+        g2=g2,
+        chi2=chi2,
+        df=df,
+        p_value=float(chi2_sf(g2, df)[0]),
+        p_value_chi2=float(chi2_sf(chi2, df)[0]),
+        sparse_share=float((E[observed] < 5).mean()) if observed.any() else float("nan"),
+        contexts=contexts,
+        histories=histories,
+    )
@@ -0,0 +1,15 @@
+import pytest
+
+from markov_churn import ModelParams, fit
+
+from tests.helpers import CUSTOMER_COL, DATE_COL, synthetic_transactions
+
+
+@pytest.fixture(scope="session")
+def transactions():
+    return synthetic_transactions()
+
+
+@pytest.fixture(scope="session")
+def model(transactions):
+    return fit(transactions, CUSTOMER_COL, DATE_COL, ModelParams())
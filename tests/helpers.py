@@ -0,0 +1,102 @@
+"""Dados sintéticos e caminhos de referência (o pandas do app original) usados pelos testes."""
+import numpy as np
+import pandas as pd
+
+CUSTOMER_COL = "Customer ID"
+DATE_COL = "InvoiceDate"
+
+
+def synthetic_transactions(n_customers: int = 400, n_months: int = 24, n_returns_only: int = 150,
+                           seed: int = 7) -> pd.DataFrame:
+    """Transações sintéticas: compras esparsas, devoluções avulsas e clientes só com devolução.
+
+    Os clientes só com devolução ficam no fim da faixa de IDs, então num ajuste
+    em shards alguns shards inteiros não têm nenhuma linha de painel.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2021-01-01")
+    rows = []
+    for c in range(n_customers):
+        months = np.sort(rng.choice(n_months, size=rng.integers(1, 10), replace=False))
+        for m in months:
+            for _ in range(rng.integers(1, 4)):
+                day = int(rng.integers(0, 28))
+                price = float(rng.integers(1, 100))
+                qty = -1 if rng.random() < 0.05 else int(rng.integers(1, 5))
+                rows.append((f"C{c:05d}", start + pd.DateOffset(months=int(m), days=day), price, qty))
+    for c in range(n_customers, n_customers + n_returns_only):
+        rows.append((f"C{c:05d}", start + pd.DateOffset(months=int(rng.integers(0, 3))), 10.0, -1))
+    df = pd.DataFrame(rows, columns=[CUSTOMER_COL, DATE_COL, "Price", "Quantity"])
+    df["revenue"] = df["Price"] * df["Quantity"]
+    return df
+
+
+def baseline_monthly_agg(df: pd.DataFrame, use_revenue: bool = True) -> pd.DataFrame:
+    # agregação cliente-mês como no app original (cliente como texto)
+    df = df.copy()
+    metric_col = "revenue" if use_revenue else "_events"
+    if not use_revenue:
+        df[metric_col] = 1
+    df["_month_ts"] = pd.to_datetime(df[DATE_COL], errors="coerce").dt.to_period("M").dt.to_timestamp()
+    df = df.dropna(subset=[CUSTOMER_COL, "_month_ts"]).copy()
+    df["_month_index"] = df["_month_ts"].dt.year * 12 + df["_month_ts"].dt.month
+    return (
+        df.groupby([CUSTOMER_COL, "_month_index"], as_index=False)
+          .agg(month_ts=("_month_ts", "min"), revenue=(metric_col, "sum"), total_purchases=(metric_col, "size"))
+    )
+
+
+def baseline_panel(agg: pd.DataFrame, customers, use_revenue: bool = True) -> pd.DataFrame:
+    """Painel do app original: produto cartesiano clientes × meses, filtrado a partir da 1ª compra."""
+    all_months = np.arange(int(agg["_month_index"].min()), int(agg["_month_index"].max()) + 1)
+    panel = pd.MultiIndex.from_product([customers, all_months], names=[CUSTOMER_COL, "_month_index"]).to_frame(
+        index=False)
+    panel = panel.merge(agg[[CUSTOMER_COL, "_month_index", "revenue", "total_purchases"]],
+                        on=[CUSTOMER_COL, "_month_index"], how="left")
+    panel["revenue"] = panel["revenue"].fillna(0.0)
+    panel["total_purchases"] = panel["total_purchases"].fillna(0).astype(int)
+    panel = panel.sort_values([CUSTOMER_COL, "_month_index"]).reset_index(drop=True)
+    panel["_had_purchase"] = panel["revenue"] > 0 if use_revenue else panel["total_purchases"] > 0
+    first_purchase = (
+        panel[panel["_had_purchase"]].groupby(CUSTOMER_COL)["_month_index"].min()
+        .rename("_first_purchase_month").reset_index()
+    )
+    panel = panel.merge(first_purchase, on=CUSTOMER_COL, how="left")
+    return panel[panel["_month_index"] >= panel["_first_purchase_month"]].reset_index(drop=True)
+
+
+def baseline_states(panel: pd.DataFrame, risk_gap_months: int = 1, churn_gap_months: int = 3) -> pd.DataFrame:
+    # estados A/R/C (rótulos texto) e próximo estado como no app original
+    panel = panel.copy()
+    panel["_last_purchase_month"] = np.where(panel["_had_purchase"], panel["_month_index"], np.nan)
+    panel["_last_purchase_month"] = panel.groupby(CUSTOMER_COL)["_last_purchase_month"].ffill()
+    panel["_months_since_purchase"] = panel["_month_index"] - panel["_last_purchase_month"]
+    panel["state"] = "R"
+    panel.loc[panel["_had_purchase"], "state"] = "A"
+    panel.loc[(~panel["_had_purchase"]) & (panel["_months_since_purchase"] >= risk_gap_months), "state"] = "R"
+    panel.loc[(~panel["_had_purchase"]) & (panel["_months_since_purchase"] >= churn_gap_months), "state"] = "C"
+    panel["_ever_churned"] = panel.groupby(CUSTOMER_COL)["state"].transform(lambda s: (s == "C").cummax())
+    panel.loc[panel["_ever_churned"], "state"] = "C"
+    panel["next_state"] = panel.groupby(CUSTOMER_COL)["state"].shift(-1)
+    return panel
+
+
+def baseline_counts(panel: pd.DataFrame) -> np.ndarray:
+    # Nᵢⱼ via groupby().size().unstack() como no app original
+    states = ["A", "R", "C"]
+    trans = panel.dropna(subset=["next_state"]).copy()
+    trans["state"] = pd.Categorical(trans["state"], categories=states, ordered=True)
+    trans["next_state"] = pd.Categorical(trans["next_state"], categories=states, ordered=True)
+    return (
+        trans.groupby(["state", "next_state"], observed=False).size()
+             .unstack(fill_value=0).reindex(index=states, columns=states, fill_value=0).to_numpy()
+    )
+
+
+def assert_same_counts(a, b):
+    # mesmas contagens (Nᵢⱼ, tensores por mês) e mesma P em dois ajustes
+    np.testing.assert_array_equal(a.Nij, b.Nij)
+    np.testing.assert_array_equal(a.months, b.months)
+    np.testing.assert_array_equal(a.month_transitions, b.month_transitions)
+    np.testing.assert_array_equal(a.month_states, b.month_states)
+    np.testing.assert_allclose(a.P, b.P)
@@ -0,0 +1,36 @@
+import importlib
+
+import numpy as np
+import pytest
+
+from markov_churn import bootstrap, customer_contributions
+
+from tests.helpers import CUSTOMER_COL
+
+
+def test_contributions_sum_to_model(model):
+    X = customer_contributions(model)
+    assert len(X) == model.panel[CUSTOMER_COL].nunique()
+    np.testing.assert_array_equal(X[:, :9].sum(axis=0).reshape(3, 3), model.Nij)
+
+
+def test_estimate_matches_model(model):
+    res = bootstrap(model, n_boot=20, horizons=(3, 12))
+    np.testing.assert_allclose(res.estimate["P"][0], model.P)
+    np.testing.assert_allclose(res.estimate["churn"][0, :, 0], [model.churn_probability(h, "A") for h in (3, 12)])
+    np.testing.assert_allclose(res.estimate["time_to_churn"][0], model.time_to_churn()[0])
+    np.testing.assert_allclose(res.estimate["ltv"][0], model.ltv())
+    table = res.intervals(0.9)
+    assert (table["ic_inf"] <= table["ic_sup"]).all()
+    assert table.loc["P(A→C)", "estimativa"] == pytest.approx(model.P[0, 2])
+
+
+def test_same_replicates_with_and_without_pool(model, monkeypatch):
+    # lotes pequenos: várias sementes por lote, repartidas entre processos
+    module = importlib.import_module("markov_churn.bootstrap")  # `markov_churn.bootstrap` é a função
+    monkeypatch.setattr(module, "BOOTSTRAP_BATCH_CELLS", 10 * model.panel[CUSTOMER_COL].nunique())
+    serial = bootstrap(model, n_boot=45, seed=3, n_jobs=1)
+    pooled = bootstrap(model, n_boot=45, seed=3, n_jobs=2)
+    for key in serial.replicates:
+        np.testing.assert_array_equal(serial.replicates[key], pooled.replicates[key])
+    assert not np.array_equal(serial.replicates["P"][0], serial.replicates["P"][1])
@@ -0,0 +1,55 @@
+import json
+
+import numpy as np
+import pytest
+
+from markov_churn.cli import main
+
+from tests.helpers import CUSTOMER_COL, DATE_COL
+
+
+@pytest.fixture(scope="module")
+def transactions_csv(transactions, tmp_path_factory):
+    path = tmp_path_factory.mktemp("cli") / "transacoes.csv"
+    transactions[[CUSTOMER_COL, DATE_COL, "Price", "Quantity"]].to_csv(path, index=False)
+    return path
+
+
+def test_cli_summary_matches_fit(model, transactions_csv, tmp_path):
+    out = tmp_path / "out"
+    assert main([str(transactions_csv), "--out", str(out), "--format", "json", "--horizons", "3", "12"]) == 0
+    summary = json.loads((out / "summary.json").read_text(encoding="utf-8"))
+    assert summary["n_customers_total"] == model.n_customers_total
+    assert summary["panel_rows"] == len(model.panel)
+    P = np.array([[summary["P"][i][j] for j in "ARC"] for i in "ARC"])
+    np.testing.assert_allclose(P, model.P)
+    assert summary["churn_at_n"]["A"]["12"] == pytest.approx(model.churn_probability(12, "A"))
+    assert {"Nij.json", "P.json", "churn_curve.json", "summary.json"} <= {p.name for p in out.iterdir()}
+
+
+def test_cli_rejects_bad_gaps(transactions_csv, tmp_path):
+    with pytest.raises(SystemExit):
+        main([str(transactions_csv), "--out", str(tmp_path), "--risk-gap", "3", "--churn-gap", "2"])
+
+
+def test_cli_customer_totals_match_across_paths(model, transactions, transactions_csv, tmp_path):
+    # clientes sem compra positiva contam no total também pelo ModelState (lote e atualização incremental)
+    assert model.n_customers_total > model.n_customers
+
+    def totals(*argv):
+        out = tmp_path / f"out{len(list(tmp_path.iterdir()))}"
+        assert main([*map(str, argv), "--out", str(out), "--format", "json"]) == 0
+        summary = json.loads((out / "summary.json").read_text(encoding="utf-8"))
+        return summary["n_customers_total"], summary["n_customers_used"]
+
+    expected = (model.n_customers_total, model.n_customers)
+    assert totals(transactions_csv, "--save-state", tmp_path / "estado") == expected
+    assert totals(transactions_csv, "--jobs", 2) == expected
+
+    month = transactions[DATE_COL].dt.to_period("M")
+    cut = month.min() + 12
+    cols = [CUSTOMER_COL, DATE_COL, "Price", "Quantity"]
+    transactions.loc[month < cut, cols].to_csv(tmp_path / "antes.csv", index=False)
+    transactions.loc[month >= cut, cols].to_csv(tmp_path / "depois.csv", index=False)
+    totals(tmp_path / "antes.csv", "--jobs", 2, "--save-state", tmp_path / "incremental")
+    assert totals(tmp_path / "depois.csv", "--update-state", tmp_path / "incremental") == expected
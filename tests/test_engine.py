@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from markov_churn import ModelParams, decode_states, fit, transition_matrix
+
+from tests.helpers import (
+    CUSTOMER_COL, DATE_COL, baseline_counts, baseline_monthly_agg, baseline_panel, baseline_states,
+)
+
+
+@pytest.mark.parametrize("gaps", [(1, 3), (2, 4)])
+@pytest.mark.parametrize("use_revenue", [True, False])
+def test_states_and_counts_match_original_app(transactions, gaps, use_revenue):
+    risk, churn = gaps
+    agg = baseline_monthly_agg(transactions, use_revenue)
+    ref = baseline_states(baseline_panel(agg, agg[CUSTOMER_COL].unique(), use_revenue), risk, churn)
+    model = fit(transactions, CUSTOMER_COL, DATE_COL,
+                ModelParams(risk_gap_months=risk, churn_gap_months=churn, use_revenue=use_revenue))
+
+    panel = model.panel
+    np.testing.assert_array_equal(model.customer_labels[panel[CUSTOMER_COL].to_numpy()], ref[CUSTOMER_COL])
+    np.testing.assert_array_equal(panel["_month_index"], ref["_month_index"])
+    np.testing.assert_array_equal(np.asarray(decode_states(panel["state"])), ref["state"])
+    np.testing.assert_array_equal(pd.Series(decode_states(panel["next_state"])).astype(object).fillna("-"),
+                                  ref["next_state"].fillna("-"))
+    np.testing.assert_array_equal(model.Nij, baseline_counts(ref))
+    np.testing.assert_allclose(model.P, transition_matrix(baseline_counts(ref), force_absorb=True))
+
+
+def test_fit_counts_all_customers(model, transactions):
+    assert model.n_customers_total == transactions[CUSTOMER_COL].nunique()
+    np.testing.assert_allclose(model.P.sum(axis=1), 1.0)
+    assert model.is_absorbing
+
+
+def test_churn_gap_must_exceed_risk_gap(transactions):
+    with pytest.raises(ValueError):
+        fit(transactions, CUSTOMER_COL, DATE_COL, ModelParams(risk_gap_months=3, churn_gap_months=3))
+
+
+def test_month_counts_match_panel(model):
+    # contagens por mês guardadas no modelo = reagrupar o painel
+    panel = model.panel
+    np.testing.assert_array_equal(model.months, np.arange(panel["_month_index"].min(), panel["_month_index"].max() + 1))
+    np.testing.assert_array_equal(model.month_transitions.sum(axis=0), model.Nij)
+    ref = pd.crosstab(panel["_month_index"], panel["state"]).reindex(model.months, fill_value=0)
+    np.testing.assert_array_equal(model.month_states, ref.reindex(columns=[0, 1, 2], fill_value=0).to_numpy())
+    last = panel["_month_index"] == panel["_month_index"].max()
+    np.testing.assert_allclose(model.last_month_distribution(),
+                               np.bincount(panel.loc[last, "state"], minlength=3) / last.sum())
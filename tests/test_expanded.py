@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from markov_churn import expanded, fit_expanded
+
+from tests.helpers import CUSTOMER_COL
+
+
+def _dense(M):
+    return M.toarray() if hasattr(M, "toarray") else np.asarray(M)
+
+
+@pytest.mark.parametrize("tiers", [1, 3])
+def test_rows_sum_to_one_and_churn_absorbs(model, tiers):
+    ex = fit_expanded(model, spend_tiers=tiers)
+    P = _dense(ex.P)
+    c = ex.absorbing_state
+    assert ex.labels[c] == "C" and P.shape == (ex.n_states, ex.n_states)
+    observed = _dense(ex.counts).sum(axis=1) > 0
+    np.testing.assert_allclose(P.sum(axis=1)[observed | (np.arange(ex.n_states) == c)], 1.0)
+    assert P[c, c] == 1.0 and P[c].sum() == 1.0
+    # horizonte longo: toda a massa termina em C
+    np.testing.assert_allclose(ex.churn_by_state(2000), 1.0, atol=1e-6)
+    np.testing.assert_allclose(ex.trajectory(ex.initial_distribution("A"), 24).sum(axis=1), 1.0)
+
+
+def test_collapses_to_coarse_counts(model):
+    # somando os estados expandidos de volta em A/R/C, Nᵢⱼ é a do modelo A/R/C
+    ex = fit_expanded(model, spend_tiers=3)
+    by_coarse = np.zeros((3, 3), dtype=np.int64)
+    np.add.at(by_coarse, ex.coarse, ex.coarse_counts().astype(np.int64))
+    np.testing.assert_array_equal(by_coarse, model.Nij)
+    assert ex.occupancy.sum() == len(model.panel)
+
+
+def test_analytics_match_dense_algebra(model):
+    ex = fit_expanded(model, spend_tiers=3)
+    P = _dense(ex.P)
+    c = ex.absorbing_state
+    np.testing.assert_allclose(ex.churn_by_state(12), np.linalg.matrix_power(P, 12)[:, c], atol=1e-12)
+    Q = P[:c, :c]
+    np.testing.assert_allclose(ex.time_to_churn().to_numpy(), np.linalg.solve(np.eye(c) - Q, np.ones(c)))
+    np.testing.assert_allclose(ex.ltv(0.98).to_numpy(), np.linalg.solve(np.eye(c) - 0.98 * Q, ex.rewards()[:-1]))
+
+
+def test_dense_fallback_without_scipy(model, monkeypatch):
+    sparse = fit_expanded(model, spend_tiers=3)
+    ref = _dense(sparse.counts), _dense(sparse.P), sparse.time_to_churn(), sparse.log_likelihood()
+    monkeypatch.setattr(expanded, "HAS_SCIPY", False)
+    dense = fit_expanded(model, spend_tiers=3)
+    assert isinstance(dense.counts, np.ndarray)
+    np.testing.assert_array_equal(dense.counts, ref[0])
+    np.testing.assert_allclose(dense.P, ref[1])
+    np.testing.assert_allclose(dense.time_to_churn(), ref[2])
+    assert dense.log_likelihood() == pytest.approx(ref[3])
+
+
+def test_counts_match_dense_bincount_and_P_is_estimated_once(model):
+    ex = fit_expanded(model, spend_tiers=3)
+    k = ex.n_states
+    state = expanded.expanded_states(model.panel, "revenue", ex.thresholds, model.params.churn_gap_months)
+    nxt = np.r_[state[1:], -1]
+    nxt[np.r_[model.panel[CUSTOMER_COL].to_numpy()[1:] != model.panel[CUSTOMER_COL].to_numpy()[:-1], True]] = -1
+    ok = nxt >= 0
+    ref = np.bincount(state[ok].astype(np.int64) * k + nxt[ok], minlength=k * k).reshape(k, k)
+    np.testing.assert_array_equal(_dense(ex.counts), ref)
+    assert ex.P is ex.P
+    np.testing.assert_allclose(_dense(ex.P), _dense(expanded.estimate_P(ex.counts)))
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from markov_churn import HorizonEngine, SpectralPower, horizon_engine
+
+
+def test_stack_matches_matrix_power(model):
+    engine = HorizonEngine(model.P)
+    engine.stack(4)  # cresce em duas etapas: 0..4 e depois 5..24
+    stack = engine.stack(24)
+    assert stack.shape == (25, 3, 3)
+    for n in range(25):
+        np.testing.assert_allclose(stack[n], np.linalg.matrix_power(model.P, n), atol=1e-12)
+        np.testing.assert_allclose(engine.power(n), np.linalg.matrix_power(model.P, n), atol=1e-12)
+
+
+def test_curve_and_trajectory(model):
+    engine = HorizonEngine(model.P)
+    ref = [np.linalg.matrix_power(model.P, n)[0, 2] for n in range(1, 13)]
+    np.testing.assert_allclose(engine.entry_curve(0, 2, 12), ref, atol=1e-12)
+    np.testing.assert_allclose(model.churn_curve(12, "A"), ref, atol=1e-12)
+    pi0 = model.last_month_distribution()
+    np.testing.assert_allclose(engine.trajectory(pi0, 6)[6], pi0 @ np.linalg.matrix_power(model.P, 6), atol=1e-12)
+
+
+def test_engine_shared_per_matrix(model):
+    assert horizon_engine(model.P) is horizon_engine(model.P.copy())
+    assert horizon_engine(model.P) is not horizon_engine(np.eye(3))
+    with pytest.raises(ValueError):
+        HorizonEngine(model.P).stack(-1)
+
+
+def _jordan_P(a=0.6, b=0.3):
+    # Q = [[a, b], [0, a]]: autovalor repetido sem base de autovetores (P defeituosa)
+    return np.array([[a, b, 1 - a - b], [0.0, a, 1 - a], [0.0, 0.0, 1.0]])
+
+
+def test_spectral_matches_matrix_power(model):
+    sp = SpectralPower(model.P)
+    assert sp.method == "eigen"
+    for n in (0, 1, 7, 36, 240):
+        ref = np.linalg.matrix_power(model.P, n)
+        np.testing.assert_allclose(sp.power(n), ref, atol=1e-10)
+        assert sp.entry(0, 2, n) == pytest.approx(ref[0, 2], abs=1e-10)
+    assert sp.check(60) < 1e-10
+    assert model.churn_probability(5000, "A") == pytest.approx(sp.entry(0, 2, 5000))
+
+
+@pytest.mark.parametrize("P", [_jordan_P(), np.array([[0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, 1.0]])])
+def test_spectral_canonical_fallback(P):
+    sp = SpectralPower(P)
+    assert sp.method == "canonical"
+    for n in range(0, 30):
+        np.testing.assert_allclose(sp.power(n), np.linalg.matrix_power(P, n), atol=1e-10)
+
+
+@pytest.mark.parametrize("P", [np.array([[0.7, 0.2, 0.1], [0.3, 0.5, 0.2], [0.0, 0.0, 1.0]]), _jordan_P()])
+def test_spectral_fractional_powers_compose(P):
+    sp = SpectralPower(P)
+    half = sp.power(0.5)
+    np.testing.assert_allclose(half @ half, P, atol=1e-9)
+    np.testing.assert_allclose(sp.power(2.5), sp.power(2) @ half, atol=1e-9)
+    np.testing.assert_allclose(sp.power(2.5).sum(axis=1), 1.0, atol=1e-9)
+
+
+def test_spectral_integer_fallback_without_canonical_form():
+    # estado 0 não é absorvente: sem forma canônica, só potências inteiras
+    P = _jordan_P()
+    sp = SpectralPower(P, absorbing_state=0)
+    assert sp.method == "power"
+    np.testing.assert_allclose(sp.power(12), np.linalg.matrix_power(P, 12))
+    with pytest.raises(ValueError):
+        sp.power(0.5)
+    with pytest.raises(ValueError):
+        sp.power(-1)
+
+
+def test_shared_stack_is_read_only(model):
+    engine = horizon_engine(model.P)
+    for view in (engine.stack(6), engine.power(3), engine.power(0), engine.P):
+        with pytest.raises(ValueError):
+            view[0, 0] = 0.5
+    curve = engine.entry_curve(0, 2, 6)
+    curve[:] = 0.0  # cópia: não altera a pilha
+    np.testing.assert_allclose(engine.power(3), np.linalg.matrix_power(model.P, 3), atol=1e-12)
+    np.testing.assert_allclose(model.churn_curve(6, "A")[2], engine.power(3)[0, 2])
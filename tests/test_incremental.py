@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from markov_churn import ModelParams, fit, state_from_model
+from markov_churn.incremental import _CustomerArrays
+
+from tests.helpers import CUSTOMER_COL, DATE_COL, assert_same_counts
+
+
+def assert_same_state(a, b):
+    assert_same_counts(a, b)
+    np.testing.assert_allclose(a.reward_sum, b.reward_sum)
+    np.testing.assert_array_equal(a.reward_rows, b.reward_rows)
+    cols = ["customer", "first_month", "last_purchase_month", "state", "ever_churned"]
+    assert sorted(a.other_customers) == sorted(b.other_customers)
+    a = a.customers.sort_values("customer").reset_index(drop=True)[cols]
+    b = b.customers.sort_values("customer").reset_index(drop=True)[cols]
+    assert a.astype(b.dtypes.to_dict()).equals(b)
+
+
+@pytest.mark.parametrize("params", [
+    ModelParams(),
+    ModelParams(churn_gap_months=2),
+    ModelParams(risk_gap_months=2, churn_gap_months=5, use_revenue=False),
+])
+def test_monthly_updates_match_full_fit(transactions, params):
+    # histórico até um corte + meses seguintes incorporados um a um = ajuste completo
+    month = transactions[DATE_COL].dt.to_period("M")
+    cut = month.min() + 12
+    state = state_from_model(fit(transactions[month < cut], CUSTOMER_COL, DATE_COL, params))
+    for m in sorted(month[month >= cut].unique()):
+        state.update(transactions[month == m], DATE_COL)
+    assert_same_state(state, state_from_model(fit(transactions, CUSTOMER_COL, DATE_COL, params)))
+
+
+def test_update_spanning_a_month_without_transactions(transactions):
+    # vários meses numa chamada, um deles sem nenhuma transação: todos avançam pelos buckets
+    month = transactions[DATE_COL].dt.to_period("M")
+    cut = month.min() + 12
+    data = transactions[month != cut + 2]
+    month = data[DATE_COL].dt.to_period("M")
+    state = state_from_model(fit(data[month < cut], CUSTOMER_COL, DATE_COL, ModelParams()))
+    state.update(data[month >= cut], DATE_COL)
+    assert_same_state(state, state_from_model(fit(data, CUSTOMER_COL, DATE_COL, ModelParams())))
+
+
+def test_step_reads_only_the_buckets_crossing_a_gap(transactions, monkeypatch):
+    # num mês sem transações, só quem comprou em m − 1 (A → R) ou em m − 3 (R → C) é movido
+    month = transactions[DATE_COL].dt.to_period("M")
+    state = state_from_model(fit(transactions[month < month.min() + 12], CUSTOMER_COL, DATE_COL, ModelParams()))
+    cust = state.customers
+    m = state.end_month + 1
+    crossing = (~cust["ever_churned"] & cust["last_purchase_month"].isin([m - 1, m - 3])).sum()
+    assert 0 < crossing < len(cust) // 2
+
+    read = []
+    bucket = _CustomerArrays.bucket
+    monkeypatch.setattr(_CustomerArrays, "bucket", lambda self, b: read.append(bucket(self, b)) or read[-1])
+    no_rows = pd.DataFrame({"_label": [], "revenue": [], "total_purchases": []})
+    state._step(m, no_rows, "revenue", _CustomerArrays.from_state(state))
+    assert sum(len(r) for r in read) == crossing
+    assert state.month_states[-1].sum() == len(cust)
+
+
+def test_saved_state_round_trip(transactions, tmp_path):
+    state = state_from_model(fit(transactions, CUSTOMER_COL, DATE_COL, ModelParams()))
+    state.save(str(tmp_path / "estado"))
+    loaded = type(state).load(str(tmp_path / "estado"))
+    assert_same_counts(state, loaded)
+    np.testing.assert_allclose(loaded.reward_sum, state.reward_sum)
+    assert loaded.n_customers_total == state.n_customers_total
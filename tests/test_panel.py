@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from markov_churn import build_monthly_panel, group_start_mask, propagate_absorbing, shift_in_group
+
+from tests.helpers import CUSTOMER_COL, baseline_monthly_agg, baseline_panel
+
+PANEL_COLS = [CUSTOMER_COL, "_month_index", "revenue", "total_purchases", "_had_purchase", "_first_purchase_month"]
+
+
+@pytest.mark.parametrize("use_revenue", [True, False])
+@pytest.mark.parametrize("sample", [None, 120])
+def test_sparse_panel_matches_cartesian_product(transactions, use_revenue, sample):
+    agg = baseline_monthly_agg(transactions, use_revenue)
+    customers = agg[CUSTOMER_COL].unique()
+    if sample:
+        customers = np.random.default_rng(0).choice(customers, size=sample, replace=False)
+    ref = baseline_panel(agg, customers, use_revenue)
+
+    panel = build_monthly_panel(agg, CUSTOMER_COL, customers, end_month=int(agg["_month_index"].max()),
+                                use_revenue=use_revenue)
+    panel = panel.sort_values([CUSTOMER_COL, "_month_index"]).reset_index(drop=True)
+    assert len(panel) == len(ref)
+    for col in PANEL_COLS:
+        np.testing.assert_array_equal(panel[col].to_numpy(), ref[col].to_numpy(), err_msg=col)
+    np.testing.assert_array_equal(panel["month_ts"].dt.year * 12 + panel["month_ts"].dt.month,
+                                  panel["_month_index"])
+
+
+def test_propagate_absorbing_matches_groupby_cummax():
+    # painel ordenado por cliente com C esparso: True a partir do 1º C de cada cliente
+    rng = np.random.default_rng(1)
+    customer = np.repeat(np.arange(300), rng.integers(1, 30, size=300))
+    is_churn = rng.random(len(customer)) < 0.08
+    ref = pd.Series(is_churn).groupby(customer).transform(lambda s: s.cummax()).to_numpy(dtype=bool)
+    np.testing.assert_array_equal(propagate_absorbing(is_churn, group_start_mask(customer)), ref)
+
+
+def test_group_start_mask():
+    np.testing.assert_array_equal(group_start_mask([3, 3, 5, 5, 5, 7]), [True, False, True, False, False, True])
+    assert group_start_mask([]).shape == (0,)
+
+
+@pytest.mark.parametrize("periods", [1, -1])
+def test_shift_in_group_matches_groupby_shift(periods):
+    rng = np.random.default_rng(2)
+    customer = np.repeat(np.arange(200), rng.integers(1, 12, size=200))
+    values = rng.integers(0, 3, size=len(customer)).astype(np.int8)
+    ref = pd.Series(values).groupby(customer).shift(periods).fillna(-1).to_numpy(dtype=np.int8)
+    out = shift_in_group(values, group_start_mask(customer), periods)
+    assert out.dtype == np.int8
+    np.testing.assert_array_equal(out, ref)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from markov_churn import (
+    ModelParams, aggregate_monthly, fit, fit_parallel, merge_states, state_from_aggregated_parallel, state_from_model,
+)
+
+from tests.helpers import CUSTOMER_COL, DATE_COL, assert_same_counts
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2, 8])
+def test_fit_parallel_matches_serial(transactions, n_jobs):
+    params = ModelParams()
+    serial = fit(transactions, CUSTOMER_COL, DATE_COL, params)
+    sharded = fit_parallel(transactions, CUSTOMER_COL, DATE_COL, params, n_jobs=n_jobs)
+    assert_same_counts(serial, sharded)
+    assert sharded.panel.equals(serial.panel)
+
+
+@pytest.mark.parametrize("n_jobs", [2, 8])
+def test_sharded_state_matches_serial_with_empty_shards(transactions, n_jobs):
+    # clientes só com devolução no fim da faixa: shards sem linha de painel não podem quebrar o ajuste
+    params = ModelParams()
+    agg, labels = aggregate_monthly(transactions, CUSTOMER_COL, DATE_COL, use_revenue=True)
+    serial = state_from_model(fit(transactions, CUSTOMER_COL, DATE_COL, params))
+    sharded = state_from_aggregated_parallel(agg, labels, CUSTOMER_COL, params, n_jobs=n_jobs)
+    assert_same_counts(serial, sharded)
+    np.testing.assert_allclose(sharded.reward_sum, serial.reward_sum)
+    np.testing.assert_array_equal(sharded.reward_rows, serial.reward_rows)
+    assert sorted(sharded.customers["customer"]) == sorted(serial.customers["customer"])
+
+
+def test_merge_states_needs_at_least_one_state():
+    with pytest.raises(ValueError):
+        merge_states([])
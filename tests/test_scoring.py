@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from markov_churn import score_customers, segment_model, state_from_model
+
+from tests.helpers import CUSTOMER_COL
+
+
+def _reference(model, horizon):
+    # por cliente: estado da última linha no painel, (Pⁿ)[estado, C] e LTV do estado
+    last = model.panel.groupby(CUSTOMER_COL).tail(1)
+    Pn = np.linalg.matrix_power(model.P, horizon)
+    ltv = dict(zip("AR", model.ltv()), C=0.0)
+    states = np.array(list("ARC"))[last["state"].to_numpy()]
+    return (model.customer_labels[last[CUSTOMER_COL].to_numpy()].to_numpy(), states,
+            Pn[last["state"].to_numpy(), 2], np.array([ltv[s] for s in states]))
+
+
+@pytest.mark.parametrize("horizon", [0, 6, 12])
+def test_scores_match_per_customer_loop(model, horizon):
+    scores = score_customers(model, horizon)
+    customers, states, churn, ltv = _reference(model, horizon)
+    np.testing.assert_array_equal(scores[CUSTOMER_COL], customers)
+    np.testing.assert_array_equal(np.asarray(scores["state"]), states)
+    np.testing.assert_allclose(scores[f"churn_{horizon}m"], churn, atol=1e-12)
+    np.testing.assert_allclose(scores["ltv"], ltv)
+
+
+def test_scores_from_incremental_state(model):
+    from_model = score_customers(model, 12).sort_values(CUSTOMER_COL).reset_index(drop=True)
+    from_state = score_customers(state_from_model(model), 12).sort_values(CUSTOMER_COL).reset_index(drop=True)
+    np.testing.assert_array_equal(from_state[CUSTOMER_COL], from_model[CUSTOMER_COL])
+    np.testing.assert_array_equal(from_state["months_since_purchase"], from_model["months_since_purchase"])
+    np.testing.assert_allclose(from_state["churn_12m"], from_model["churn_12m"])
+    np.testing.assert_allclose(from_state["ltv"], from_model["ltv"])
+
+
+def test_scores_by_segment_use_segment_P(model):
+    seg = segment_model(model)
+    scores = score_customers(model, 12, segments=seg)
+    Pn = np.linalg.matrix_power(seg.P, 12)
+    code = np.array(list("ARC"))
+    for row in scores.sample(60, random_state=0).itertuples(index=False):
+        s, i = seg.segment_index(row.segment), int(np.flatnonzero(code == row.state)[0])
+        expected = Pn[s, i, 2] if seg.Nij[s, i].sum() > 0 else np.linalg.matrix_power(model.P, 12)[i, 2]
+        assert row.churn_12m == pytest.approx(expected, abs=1e-12)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from markov_churn import (
+    aggregate_monthly, assign_states, build_monthly_panel, model_from_panel, segment_model, transition_matrix,
+)
+from markov_churn.segments import COHORT_SEGMENT, cohort_segments, customer_segments, fit_segments
+
+from tests.helpers import CUSTOMER_COL, DATE_COL
+
+
+@pytest.fixture(scope="module")
+def with_country(transactions):
+    # país por cliente, com algumas linhas "XX" avulsas: vale o valor mais frequente
+    df = transactions.copy()
+    df["Country"] = np.array(["BR", "PT", "US"])[df[CUSTOMER_COL].str[1:].astype(int) % 3]
+    noise = np.random.default_rng(5).random(len(df)) < 0.03
+    df.loc[noise & (df.groupby(CUSTOMER_COL).cumcount() > 0).to_numpy(), "Country"] = "XX"
+    return df
+
+
+def _refit(transactions, params, end_month):
+    # ajuste só com os clientes do segmento, na mesma janela (mesmo último mês) do ajuste global
+    agg, labels = aggregate_monthly(transactions, CUSTOMER_COL, DATE_COL, params.use_revenue, params.neg_mode)
+    panel = build_monthly_panel(agg, CUSTOMER_COL, np.unique(agg[CUSTOMER_COL]), end_month, params.use_revenue)
+    panel = assign_states(panel, CUSTOMER_COL, params.risk_gap_months, params.churn_gap_months)
+    return model_from_panel(panel, CUSTOMER_COL, labels, params)
+
+
+@pytest.mark.parametrize("segment_col", ["Country", COHORT_SEGMENT])
+def test_segments_match_per_segment_refit(model, with_country, segment_col):
+    if segment_col == COHORT_SEGMENT:
+        segments, labels = cohort_segments(model.panel, CUSTOMER_COL, len(model.customer_labels))
+    else:
+        segments, labels = customer_segments(with_country, CUSTOMER_COL, segment_col, model.customer_labels)
+    seg = fit_segments(model, segments, labels, segment_col)
+
+    used = np.unique(model.panel[CUSTOMER_COL].to_numpy())
+    end = int(model.panel["_month_index"].max())
+    for s in range(seg.n_segments):
+        ids = model.customer_labels[used[segments[used] == s]]
+        assert seg.n_customers[s] == len(ids)
+        if not len(ids):  # segmento só de clientes sem compra (ex.: só devoluções): nada a reajustar
+            assert seg.Nij[s].sum() == 0
+            continue
+        sub = _refit(with_country[with_country[CUSTOMER_COL].isin(ids)], model.params, end)
+        np.testing.assert_array_equal(seg.Nij[s], sub.Nij)
+        np.testing.assert_allclose(seg.P[s], sub.P)
+        np.testing.assert_allclose(seg.rewards()[s], sub.rewards().to_numpy())
+        np.testing.assert_allclose(seg.churn_curve(12)[s], sub.churn_curve(12, "A"), atol=1e-12)
+        np.testing.assert_allclose(seg.ltv()[s], sub.ltv())
+        if abs(np.linalg.det(np.eye(2) - sub.P[:2, :2])) < 1e-12:  # ex.: coorte do último mês, sem transições
+            assert np.isnan(seg.time_to_churn()[s]).all()
+        else:
+            np.testing.assert_allclose(seg.time_to_churn()[s], sub.time_to_churn()[0])
+    np.testing.assert_array_equal(seg.Nij.sum(axis=0), model.Nij)
+
+
+def test_customer_segment_is_most_frequent_value(model, with_country):
+    segments, labels = customer_segments(with_country, CUSTOMER_COL, "Country", model.customer_labels)
+    expected = with_country.groupby(CUSTOMER_COL)["Country"].agg(lambda s: s.value_counts().sort_index().idxmax())
+    got = pd.Series(np.asarray(labels)[segments], index=model.customer_labels)
+    np.testing.assert_array_equal(got.loc[expected.index], expected)
+
+
+def test_P_is_estimated_once(model):
+    seg = segment_model(model)
+    assert seg.P is seg.P
+    np.testing.assert_allclose(seg.P, transition_matrix(seg.Nij, force_absorb=model.params.force_absorb))
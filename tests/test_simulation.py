@@ -0,0 +1,34 @@
+import numpy as np
+
+from markov_churn import simulate, state_from_model
+from markov_churn.simulation import initial_counts
+from markov_churn.states import STATE_C
+
+
+def test_mean_paths_match_expected_counts(model):
+    # E[clientes por estado no mês n] = n₀ · Pⁿ
+    sim = simulate(model, n_paths=4000, horizon=6, seed=1)
+    counts0 = initial_counts(model)
+    for n in (1, 3, 6):
+        expected = counts0 @ np.linalg.matrix_power(model.P, n)
+        paths = sim.state_counts[:, n]
+        tol = 5 * paths.std(axis=0) / np.sqrt(sim.n_paths) + 1e-9
+        assert np.all(np.abs(paths.mean(axis=0) - expected) <= tol)
+
+
+def test_paths_conserve_customers_and_count_new_churn(model):
+    sim = simulate(model, n_paths=500, horizon=12, seed=2)
+    assert np.all(sim.state_counts.sum(axis=2) == initial_counts(model).sum())
+    # C absorvente: novos churns do mês = aumento de clientes em C
+    np.testing.assert_array_equal(sim.new_churn, np.diff(sim.state_counts[:, :, STATE_C], axis=1))
+    np.testing.assert_allclose(sim.revenue, sim.state_counts[:, 1:] @ sim.rewards)
+
+
+def test_result_does_not_depend_on_jobs_or_model_form(model):
+    # lotes com sementes próprias: mesmo resultado em 1 ou vários processos, e do estado incremental
+    serial = simulate(model, n_paths=4500, horizon=4, seed=3, n_jobs=1)
+    pooled = simulate(model, n_paths=4500, horizon=4, seed=3, n_jobs=2)
+    from_state = simulate(state_from_model(model), n_paths=4500, horizon=4, seed=3)
+    np.testing.assert_array_equal(serial.state_counts, pooled.state_counts)
+    np.testing.assert_array_equal(serial.state_counts, from_state.state_counts)
+    np.testing.assert_array_equal(serial.new_churn, from_state.new_churn)
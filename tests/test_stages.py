@@ -0,0 +1,49 @@
+from markov_churn.stages import StageCache, stage_key
+
+
+def _pipeline(cache, calls, gap, horizon):
+    # duas etapas encadeadas: a chave de baixo inclui a de cima
+    def compute(name, value):
+        calls.append(name)
+        return value
+
+    k_states = stage_key("carga", gap)
+    states = cache.run("estados", k_states, compute, "estados", gap * 10)
+    k_curve = stage_key(k_states, horizon)
+    return cache.run("curva", k_curve, compute, "curva", (states, horizon))
+
+
+def test_same_key_is_reused():
+    cache, calls = StageCache(), []
+    first = _pipeline(cache, calls, 3, 12)
+    assert _pipeline(cache, calls, 3, 12) is first
+    assert calls == ["estados", "curva"]
+    assert cache.last_run["estados"] == (True, 0.0) and cache.last_run["curva"] == (True, 0.0)
+
+
+def test_changed_parameter_invalidates_only_downstream():
+    cache, calls = StageCache(), []
+    _pipeline(cache, calls, 3, 12)
+    assert _pipeline(cache, calls, 3, 6) == (30, 6)  # só o horizonte mudou
+    assert calls == ["estados", "curva", "curva"]
+    assert cache.last_run["estados"][0] and not cache.last_run["curva"][0]
+    assert _pipeline(cache, calls, 4, 6) == (40, 6)  # gap mudou: as duas etapas
+    assert calls[3:] == ["estados", "curva"]
+
+
+def test_one_entry_per_stage_and_clear():
+    cache, calls = StageCache(), []
+    _pipeline(cache, calls, 3, 12)
+    _pipeline(cache, calls, 4, 12)
+    _pipeline(cache, calls, 3, 12)  # a entrada de gap=3 foi substituída: recalcula
+    assert calls.count("estados") == 3
+    cache.clear()
+    assert cache.last_run == {}
+    _pipeline(cache, calls, 3, 12)
+    assert calls.count("estados") == 4
+
+
+def test_stage_key_is_deterministic():
+    assert stage_key("a", 1, (2, 3)) == stage_key("a", 1, (2, 3))
+    assert stage_key("a", 1) != stage_key("a", 2) != stage_key(("a", 1))
+    assert len(stage_key()) == 32
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from markov_churn import STATES, decode_states, encode_customers
+
+
+def test_encode_customers_round_trip():
+    ids = pd.Series(["c10", "c2", None, "c10", "a"])
+    codes, labels = encode_customers(ids)
+    assert codes.dtype == np.int32
+    assert list(labels) == sorted(labels)
+    assert codes[2] == -1
+    np.testing.assert_array_equal(labels[codes[[0, 1, 3, 4]]], ids[[0, 1, 3, 4]])
+
+
+def test_encode_customers_reuses_category_codes():
+    ids = pd.Series(pd.Categorical(["b", "a", "b"], categories=["a", "b"]))
+    codes, labels = encode_customers(ids)
+    np.testing.assert_array_equal(codes, [1, 0, 1])
+    assert list(labels) == ["a", "b"]
+
+
+def test_decode_states():
+    out = decode_states(np.array([0, 1, 2, -1], dtype=np.int8))
+    assert list(out.categories) == list(STATES)
+    assert list(out[:3]) == ["A", "R", "C"]
+    assert pd.isna(out[3])
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from markov_churn import MonthlyAccumulator, ModelParams, aggregate_monthly, fit, fit_file, fit_streaming
+
+from tests.helpers import CUSTOMER_COL, DATE_COL, assert_same_counts
+
+
+@pytest.fixture(scope="module")
+def transactions_csv(transactions, tmp_path_factory):
+    path = tmp_path_factory.mktemp("dados") / "transacoes.csv"
+    transactions.drop(columns="revenue").to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("neg_mode", ["keep", "clip", "drop"])
+def test_accumulator_matches_aggregate_monthly(transactions, neg_mode):
+    # blocos pequenos e compactação frequente: mesma agregação que de uma vez
+    acc = MonthlyAccumulator(CUSTOMER_COL, DATE_COL, use_revenue=True, neg_mode=neg_mode, compact_rows=200)
+    for lo in range(0, len(transactions), 337):
+        acc.add(transactions.iloc[lo:lo + 337])
+    agg, labels = acc.result()
+    ref, ref_labels = aggregate_monthly(transactions, CUSTOMER_COL, DATE_COL, use_revenue=True, neg_mode=neg_mode)
+    np.testing.assert_array_equal(labels.astype(str), ref_labels.astype(str))
+    pd.testing.assert_frame_equal(agg, ref, check_dtype=False)
+
+
+@pytest.mark.parametrize("chunk_rows", [250, 10_000])
+def test_fit_streaming_matches_in_memory_fit(transactions, transactions_csv, chunk_rows):
+    params = ModelParams()
+    streamed = fit_streaming(transactions_csv, CUSTOMER_COL, DATE_COL, params, chunk_rows=chunk_rows)
+    in_memory = fit(transactions, CUSTOMER_COL, DATE_COL, params)
+    assert_same_counts(streamed, fit_file(transactions_csv, CUSTOMER_COL, DATE_COL, params))
+    assert_same_counts(streamed, in_memory)
+    np.testing.assert_allclose(streamed.rewards().to_numpy(), in_memory.rewards().to_numpy())
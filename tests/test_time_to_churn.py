@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from markov_churn import COHORT_SEGMENT, get_Q, segment_model, state_from_model
+from markov_churn.analytics import TRANSIENT, time_to_churn_summary
+from markov_churn.states import STATE_C
+
+
+def test_survival_matches_matrix_powers(model):
+    # P(T > n | início i) = 1 − (Pⁿ)[i, C]
+    dist = model.time_to_churn_distribution()
+    for n in (0, 1, 2, 6, 24):
+        Pn = np.linalg.matrix_power(model.P, n)
+        for i, s in zip(TRANSIENT, ("A", "R")):
+            assert dist.loc[n, f"sobrevivencia_{s}"] == pytest.approx(1 - Pn[i, STATE_C])
+
+
+def test_summary_matches_distribution(model):
+    # média e variância em forma fechada = momentos da pmf; percentis = 1º n com P(T ≤ n) ≥ q
+    dist = model.time_to_churn_distribution(tol=1e-14)
+    summary = model.time_to_churn_summary()
+    n = dist.index.to_numpy(dtype=float)
+    for s in ("A", "R"):
+        pmf = dist[f"pmf_{s}"].to_numpy()
+        mean = (n * pmf).sum()
+        assert summary.loc[s, "media"] == pytest.approx(mean, rel=1e-8)
+        assert summary.loc[s, "variancia"] == pytest.approx((n ** 2 * pmf).sum() - mean ** 2, rel=1e-6)
+        cdf = np.cumsum(pmf)
+        for q in (0.25, 0.5, 0.75, 0.9):
+            assert summary.loc[s, f"p{100 * q:g}"] == np.argmax(cdf >= q - 1e-12)
+    np.testing.assert_allclose(summary["media"].to_numpy(), model.time_to_churn()[0])
+
+
+def test_state_and_segments_match_model(model, transactions):
+    assert state_from_model(model).time_to_churn_summary().equals(model.time_to_churn_summary())
+
+    # resumo em lote por segmento = resumo de cada P de segmento sozinha
+    seg = segment_model(model, COHORT_SEGMENT, transactions)
+    batched = seg.time_to_churn_summary()
+    for s, label in enumerate(seg.labels):
+        if not seg.is_absorbing[s]:
+            continue
+        single = time_to_churn_summary(get_Q(seg.P[s], TRANSIENT))
+        np.testing.assert_allclose(batched.loc[label].to_numpy(), single.to_numpy(), rtol=1e-9, equal_nan=True)
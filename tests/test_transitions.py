@@ -0,0 +1,39 @@
+import numpy as np
+
+from markov_churn import counts_frame, transition_counts
+from markov_churn.transitions import month_counts
+
+
+def _loop_counts(state, next_state, k):
+    out = np.zeros((k, k), dtype=np.int64)
+    for i, j in zip(state, next_state):
+        if i >= 0 and j >= 0:
+            out[i, j] += 1
+    return out
+
+
+def test_transition_counts_matches_row_loop():
+    rng = np.random.default_rng(3)
+    state = rng.integers(-1, 3, size=5000).astype(np.int8)
+    next_state = rng.integers(-1, 3, size=5000).astype(np.int8)
+    np.testing.assert_array_equal(transition_counts(state, next_state), _loop_counts(state, next_state, 3))
+
+
+def test_transition_counts_other_k_and_empty():
+    rng = np.random.default_rng(4)
+    state, next_state = rng.integers(0, 5, size=(2, 800))
+    np.testing.assert_array_equal(transition_counts(state, next_state, k=5), _loop_counts(state, next_state, 5))
+    empty = np.array([], dtype=np.int8)
+    assert transition_counts(empty, empty).shape == (3, 3)
+
+
+def test_counts_frame_labels():
+    frame = counts_frame(np.arange(9).reshape(3, 3))
+    assert list(frame.index) == ["A", "R", "C"] and list(frame.columns) == ["A", "R", "C"]
+    assert frame.loc["R", "C"] == 5
+
+
+def test_month_counts_of_empty_panel():
+    empty = np.array([], dtype=np.int8)
+    months, transitions, states = month_counts(np.array([], dtype=np.int32), empty, empty)
+    assert months.shape == (0,) and transitions.shape == (0, 3, 3) and states.shape == (0, 3)
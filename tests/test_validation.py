@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from markov_churn import state_from_model, transition_counts, transition_matrix, validation
+from markov_churn.states import STATE_C
+from markov_churn.validation import (
+    brier_score, confusion_counts, history_counts, log_loss, markov_order_test, month_tensors, reliability_curve,
+    rolling_backtest, threshold_sweep,
+)
+
+
+def test_month_tensors_match_incremental_state(model):
+    months, transitions, states = month_tensors(model.panel)
+    state = state_from_model(model)
+    assert months[0] == state.start_month
+    np.testing.assert_array_equal(transitions, state.month_transitions)
+    np.testing.assert_array_equal(states, state.month_states)
+    np.testing.assert_array_equal(transitions.sum(axis=0), model.Nij)
+
+
+@pytest.mark.parametrize("window", [None, 4])
+def test_backtest_matches_refit_per_origin(model, window):
+    months, transitions, states = month_tensors(model.panel)
+    bt = rolling_backtest(transitions, states, horizons=(1, 3, 6), window=window, months=months)
+
+    panel = model.panel
+    month = panel["_month_index"].to_numpy()
+    for row in bt.sample(25, random_state=1).itertuples(index=False):
+        t, h = int(row.origem), int(row.horizonte)
+        lo = 0 if window is None else max(t - window, 0)
+        # P refeita só com as transições que saem dos meses [lo, t)
+        train = panel[(month >= months[lo]) & (month < months[t])]
+        P = transition_matrix(transition_counts(train["state"].to_numpy(), train["next_state"].to_numpy()))
+        pi_t = np.bincount(panel.loc[month == months[t], "state"], minlength=3) / (month == months[t]).sum()
+        real = np.bincount(panel.loc[month == months[t + h], "state"], minlength=3) / (month == months[t + h]).sum()
+        pred = pi_t @ np.linalg.matrix_power(P, h)
+        np.testing.assert_allclose([row.prev_A, row.prev_R, row.prev_C], pred, atol=1e-12)
+        np.testing.assert_allclose([row.real_A, row.real_R, row.real_C], real)
+        assert row.mae == pytest.approx(np.abs(pred - real).mean())
+        assert row.mes_origem.year * 12 + row.mes_origem.month == months[t]
+
+
+def _chain_panel(next_probs, n_customers=800, length=30, seed=0):
+    # painel sintético (cliente, state, next_state); next_probs(prev, curr) = distribuição do próximo estado
+    rng = np.random.default_rng(seed)
+    states = np.empty((n_customers, length), dtype=np.int8)
+    states[:, :2] = rng.integers(0, 3, size=(n_customers, 2))
+    for t in range(2, length):
+        p = next_probs(states[:, t - 2], states[:, t - 1])  # (clientes, K)
+        states[:, t] = (rng.random((n_customers, 1)) > np.cumsum(p, axis=1)).sum(axis=1)
+    nxt = np.full_like(states, -1)
+    nxt[:, :-1] = states[:, 1:]
+    return pd.DataFrame({"c": np.repeat(np.arange(n_customers), length),
+                         "state": states.ravel(), "next_state": nxt.ravel()})
+
+
+P1 = np.array([[0.6, 0.3, 0.1], [0.3, 0.4, 0.3], [0.2, 0.2, 0.6]])
+
+
+def test_history_counts_match_row_loop():
+    panel = _chain_panel(lambda prev, curr: P1[curr], n_customers=50, length=12)
+    ref = np.zeros((3, 3, 3), dtype=np.int64)
+    for _, g in panel.groupby("c"):
+        s = g["state"].to_list() + [g["next_state"].iloc[-1]]
+        for a, b, c in zip(s, s[1:], s[2:]):
+            if c >= 0:
+                ref[a, b, c] += 1
+    np.testing.assert_array_equal(history_counts(panel, "c", order=2), ref)
+    assert history_counts(panel, "c", order=3).sum() == ref.sum() - 50
+
+
+def test_order_test_keeps_first_order_chain():
+    result = markov_order_test(history_counts(_chain_panel(lambda prev, curr: P1[curr]), "c", order=2))
+    assert result.df == 12  # 3 contextos × (3 − 1)(3 − 1)
+    assert result.p_value > 0.01
+    assert result.n == 800 * 28
+
+
+def test_order_test_rejects_second_order_chain():
+    # o próximo estado depende também do estado anterior
+    P2 = np.stack([P1, P1[::-1], P1[:, ::-1]])  # P2[prev, curr]
+    result = markov_order_test(history_counts(_chain_panel(lambda prev, curr: P2[prev, curr]), "c", order=2))
+    assert result.p_value < 1e-6
+    assert result.g2 > 10 * result.df
+    # P2[:, R] é a mesma linha para todo estado anterior: só os contextos A e C mostram memória
+    p_ctx = result.contexts.set_index("curr")["p_valor"]
+    assert p_ctx["A"] < 1e-6 and p_ctx["C"] < 1e-6 and p_ctx["R"] > 1e-3
+
+
+def test_chi2_sf_fallback_close_to_exact(monkeypatch):
+    x, df = np.array([1.0, 5.0, 20.0, 60.0]), np.array([2, 4, 12, 40])
+    exact = validation.chi2_sf(x, df)
+    monkeypatch.setattr(validation, "chi2_dist", None)
+    np.testing.assert_allclose(validation.chi2_sf(x, df), exact, atol=0.02)
+    assert np.isnan(validation.chi2_sf(3.0, 0)).all()
+
+
+@pytest.fixture(scope="module")
+def scored_rows():
+    # previsões com muitos empates (como P[estado, C]) e pesos inteiros
+    rng = np.random.default_rng(3)
+    p = rng.choice(np.linspace(0.05, 0.95, 12), size=500)
+    y = (rng.random(500) < p).astype(int)
+    w = rng.integers(1, 6, size=500)
+    return y, p, w
+
+
+def test_sweep_matches_confusion_at_every_threshold(scored_rows):
+    y, p, w = scored_rows
+    sweep = threshold_sweep(y, p, weights=w)
+    for thr in np.r_[np.unique(p), np.linspace(0.0, 1.0, 41)]:
+        assert sweep.at(thr) == confusion_counts(y, p, thr, weights=w)
+
+
+def test_sweep_auc_matches_pairwise_ranking(scored_rows):
+    # AUC = P(p_churn > p_não_churn) + ½ P(empate), pesando cada par pelos pesos
+    y, p, w = scored_rows
+    pos, neg = y == 1, y == 0
+    diff = p[pos][:, None] - p[neg][None, :]
+    pair_w = w[pos][:, None] * w[neg][None, :]
+    expected = (pair_w * ((diff > 0) + 0.5 * (diff == 0))).sum() / pair_w.sum()
+    assert threshold_sweep(y, p, weights=w).auc == pytest.approx(expected)
+
+
+def test_weighted_pairs_match_per_row_evaluation(model):
+    # app (8.4): um par (não churn, churn) por estado, pesado por Nᵢⱼ = avaliar cada transição do painel
+    panel = model.panel[model.panel["next_state"] >= 0]
+    y_rows = (panel["next_state"].to_numpy() == STATE_C).astype(int)
+    p_rows = model.P[panel["state"].to_numpy(), STATE_C]
+
+    k = len(model.Nij)
+    y = np.tile([0, 1], k)
+    p = np.repeat(model.P[:, STATE_C], 2)
+    w = np.column_stack([model.Nij.sum(axis=1) - model.Nij[:, STATE_C], model.Nij[:, STATE_C]]).ravel()
+
+    assert log_loss(y, p, weights=w) == pytest.approx(log_loss(y_rows, p_rows))
+    assert brier_score(y, p, weights=w) == pytest.approx(brier_score(y_rows, p_rows))
+    sweep, sweep_rows = threshold_sweep(y, p, weights=w), threshold_sweep(y_rows, p_rows)
+    for thr in (0.1, 0.3, 0.5, 0.9):
+        assert sweep.at(thr) == sweep_rows.at(thr)
+    assert sweep.auc == pytest.approx(sweep_rows.auc)
+    assert sweep.average_precision == pytest.approx(sweep_rows.average_precision)
+    np.testing.assert_allclose(reliability_curve(y, p, weights=w).to_numpy(),
+                               reliability_curve(y_rows, p_rows).to_numpy())